@@ -1,25 +1,228 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
 from typing import List, Dict, Any
 import json
+import time
 from datetime import datetime
 
 from services.condition_analyzer import ConditionAnalyzer
 from services.comparable_selector import ComparableSelector
-from services.price_estimator import PriceEstimator
+from services.price_estimator import PriceEstimator, INTERVAL_METHODS, interval_method_from_env
 from services.justification_generator import JustificationGenerator
-from utils.data_loader import load_real_data
+from services.pricing_pipeline import PricingPipeline
+from services.backtester import Backtester
+from services.conformal import ConformalCalibrator, parse_coverage
+from utils.data_loader import (
+    load_real_data,
+    load_subject_property,
+    normalize_subject_property,
+    load_video_transcript,
+    subject_data_signature,
+    load_knn_weights,
+)
+from utils.corpus import CorpusProvider, shared_memory_name_from_env
+from utils.shared_corpus import SharedCorpusStore
+from utils.serialization import make_api_response, cached_api_response
+from utils.ndjson import NDJSON_MIMETYPE, iter_ndjson, ndjson_line, wants_ndjson
+from utils.corpus_watcher import CorpusWatcher, poll_interval_from_env, wal_compact_bytes_from_env
+from utils.single_flight import SingleFlight, SingleFlightTimeout, canonical_request_key
+from utils.jobs import JobQueueFull, job_manager_from_env
+from utils.ann_index import nlist_from_env, nprobe_from_env
+from utils.market_shards import market_shards_from_env
+from utils.comp_filters import candidate_rows, filters_from_query, parse_filters
+from utils.geo import rows_by_distance, rows_in_box, rows_within_radius, tile_bbox
+from utils.price_grid import parse_quarter, price_grid
+from utils.market_index import market_index
+from utils.hedonic import hedonic_model
+from utils.pagination import StaleCursor, page_by_distance
 
 app = Flask(__name__)
 CORS(app)
 
+# Tuned KNN settings (see tune_weights.py); built-in defaults when absent
+knn_settings = load_knn_weights()
+DEFAULT_NUM_COMPS = int(knn_settings.get('num_comps', 5))
+
 # Initialize services
 condition_analyzer = ConditionAnalyzer()
-comparable_selector = ComparableSelector()
-price_estimator = PriceEstimator()
+comparable_selector = ComparableSelector(
+    feature_weights=knn_settings.get('feature_weights'),
+    ann_nlist=nlist_from_env()
+)
+price_estimator = PriceEstimator(
+    idw_power=float(knn_settings.get('idw_power', 1.0)),
+    interval_method=interval_method_from_env()
+)
 justification_generator = JustificationGenerator()
 
+# Conformal price intervals, calibrated per corpus version on a background thread
+conformal_calibrator = ConformalCalibrator(Backtester(
+    num_comps=DEFAULT_NUM_COMPS,
+    feature_weights=knn_settings.get('feature_weights'),
+    price_estimator=price_estimator
+))
+
+# Prepared sales corpus, shared across workers when CORPUS_SHARED_MEMORY_NAME is set
+_shared_memory_name = shared_memory_name_from_env()
+corpus_provider = CorpusProvider(
+    shared_store=SharedCorpusStore(_shared_memory_name) if _shared_memory_name else None
+)
+
+# Hot-reload the corpus in the background when new sales land in the data file
+_watch_interval = poll_interval_from_env()
+corpus_watcher = CorpusWatcher(
+    corpus_provider,
+    interval=_watch_interval,
+    wal_compact_bytes=wal_compact_bytes_from_env(),
+    # Build the market index and hedonic model on reload, not on the first request,
+    # and queue the new version's interval calibration
+    warmers=[market_index, hedonic_model, conformal_calibrator.schedule]
+)
+if _watch_interval > 0:
+    corpus_watcher.start()
+
+# One corpus per market data file, loaded on demand within a memory budget;
+# the default market is served by corpus_provider above
+market_shards = market_shards_from_env(corpus_provider)
+
+
+pricing_pipeline = PricingPipeline(
+    condition_analyzer=condition_analyzer,
+    comparable_selector=comparable_selector,
+    price_estimator=price_estimator,
+    justification_generator=justification_generator,
+    corpus_provider=corpus_provider,
+    conformal_calibrator=conformal_calibrator
+)
+
+# Identical concurrent analyses share one computation
+analysis_flights = SingleFlight()
+ANALYSIS_COALESCE_TIMEOUT = float(os.environ.get('ANALYSIS_COALESCE_TIMEOUT', 60))
+
+# Background valuation jobs (bounded queue, in-process workers)
+job_manager = job_manager_from_env()
+
+# Default IVF lists probed by approximate comparable search
+ANN_NPROBE = nprobe_from_env()
+SEARCH_MODES = ('exact', 'approximate')
+
+
+def search_nprobe(data: Dict[str, Any]):
+    """
+    nprobe for a request's `search_mode` / `nprobe` fields: None for exact
+    search (the default), else the lists to probe in approximate mode.
+    """
+    search_mode = data.get('search_mode', 'exact')
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"search_mode must be one of {', '.join(SEARCH_MODES)}")
+    if search_mode == 'exact':
+        return None
+    nprobe = data.get('nprobe', ANN_NPROBE)
+    if isinstance(nprobe, bool) or not isinstance(nprobe, int) or nprobe < 1:
+        raise ValueError('nprobe must be a positive integer')
+    return nprobe
+
+
+def parse_num_comps(value: Any) -> int:
+    """
+    Comparables per valuation from a request body field or query parameter
+    (digit strings are accepted for the latter); DEFAULT_NUM_COMPS when absent.
+    
+    Raises:
+        ValueError: Not a positive integer
+    """
+    if value is None:
+        return DEFAULT_NUM_COMPS
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError('num_comps must be a positive integer')
+    return value
+
+
+# Page size for the nearby / bounding-box comparable listings
+NEAR_COMPS_DEFAULT_LIMIT = 50
+NEAR_COMPS_MAX_LIMIT = 500
+
+
+def query_float(name: str, default: Any = None) -> float:
+    """A numeric query parameter; required when no default is given."""
+    value = request.args.get(name)
+    if value in (None, ''):
+        if default is None:
+            raise ValueError(f"{name} is required")
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def nearby_comparables_page(lat: float, lon: float, rows_for_corpus) -> Dict[str, Any]:
+    """
+    Shared body of the /api/comparables/near and /bbox listings.
+
+    `rows_for_corpus(corpus, candidate_rows)` returns the matching rows and
+    their miles from (lat, lon), ordered by (distance, row); the query string
+    supplies market, attribute filters, limit and cursor.
+    """
+    limit = int(query_float('limit', NEAR_COMPS_DEFAULT_LIMIT))
+    if not 1 <= limit <= NEAR_COMPS_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {NEAR_COMPS_MAX_LIMIT}")
+    location = {'latitude': lat, 'longitude': lon}
+    market, corpus = market_shards.resolve(location, request.args.get('market'))
+    constraints = parse_filters(filters_from_query(request.args), location)
+
+    rows, miles = rows_for_corpus(corpus, candidate_rows(corpus, constraints))
+    page_rows, page_miles, next_cursor = page_by_distance(
+        rows, miles, request.args.get('cursor'), limit, corpus.version
+    )
+    comparables = [
+        {**corpus.record(int(row)), 'distance_miles': round(float(distance), 2)}
+        for row, distance in zip(page_rows.tolist(), page_miles.tolist())
+    ]
+    return {
+        'success': True,
+        'market': market,
+        'corpus_version': corpus.version,
+        'total': len(rows),
+        'count': len(comparables),
+        'comparables': comparables,
+        'next_cursor': next_cursor
+    }
+
+
+def value_subject(subject: Dict[str, Any], num_comps: int = DEFAULT_NUM_COMPS) -> Dict[str, Any]:
+    """Full pricing report for one /api/analyze-home style subject body."""
+    if not isinstance(subject, dict):
+        raise ValueError('Expected a subject object')
+    
+    subject_home = subject.get('subject_home', {})
+    comparable_sales = subject.get('comparable_sales', [])
+    market, corpus = (None, None) if comparable_sales else market_shards.resolve(subject_home, subject.get('market'))
+    return {
+        'subject_home': subject_home,
+        'market': market,
+        **pricing_pipeline.analyze(
+            subject_home=subject_home,
+            photos=subject.get('photos', []),
+            video_transcript=subject.get('video_transcript', ''),
+            comparable_sales=comparable_sales,
+            num_comps=num_comps,
+            corpus=corpus
+        )
+    }
+
+
+def iter_batch_outcomes(subjects, num_comps: int = DEFAULT_NUM_COMPS):
+    """Value subjects one at a time, yielding {'index', 'result'|'error'} as each completes."""
+    for index, subject in enumerate(subjects):
+        try:
+            yield {'index': index, 'result': value_subject(subject, num_comps)}
+        except Exception as e:
+            yield {'index': index, 'error': str(e)}
+
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -37,7 +240,13 @@ def analyze_home():
         "subject_home": {...},
         "photos": [...],
         "video_transcript": "...",
-        "comparable_sales": [...]
+        "comparable_sales": [...],  (optional, defaults to the server-side sales corpus)
+        "market": "phoenix",        (optional, else routed from the subject's location)
+        "search_mode": "exact",     (optional, "approximate" for IVF corpus search)
+        "nprobe": 8,                (optional, lists probed in approximate mode)
+        "filters": {...},           (optional, hard constraints, see utils/comp_filters.py)
+        "interval_method": "bootstrap", (optional, price range method: "cv" or "bootstrap")
+        "coverage": 0.9             (optional, conformal price range with this coverage)
     }
     """
     try:
@@ -47,48 +256,195 @@ def analyze_home():
         photos = data.get('photos', [])
         video_transcript = data.get('video_transcript', '')
         comparable_sales = data.get('comparable_sales', [])
+        nprobe = search_nprobe(data)
+        filters = data.get('filters')
+        interval_method = data.get('interval_method')
+        if interval_method is not None and interval_method not in INTERVAL_METHODS:
+            raise ValueError(f"interval_method must be one of {', '.join(INTERVAL_METHODS)}")
+        coverage = parse_coverage(data.get('coverage'))
         
-        # Step 1: Analyze home condition
-        condition_summary = condition_analyzer.analyze(
-            subject_home=subject_home,
-            photos=photos,
-            video_transcript=video_transcript
-        )
-        
-        # Step 2: Select top 5 comparable homes
-        top_comparables = comparable_selector.select_top_comparables(
-            subject_home=subject_home,
-            comparable_sales=comparable_sales,
-            num_comps=5
-        )
-        
-        # Step 3: Estimate price based on comparables
-        price_recommendation = price_estimator.estimate_price(
-            subject_home=subject_home,
-            comparables=top_comparables,
-            condition_summary=condition_summary
+        # Pin the market's corpus snapshot so the coalescing key matches what is computed
+        market, corpus = (None, None) if comparable_sales else market_shards.resolve(subject_home, data.get('market'))
+        flight_key = canonical_request_key(
+            'analyze-home',
+            {
+                'subject_home': subject_home,
+                'photos': photos,
+                'video_transcript': video_transcript,
+                'comparable_sales': comparable_sales,
+                'nprobe': nprobe,
+                'filters': filters,
+                'interval_method': interval_method,
+                'coverage': coverage,
+                'market': market,
+            },
+            corpus.version if corpus is not None else None
         )
         
-        # Step 4: Generate justification
-        justification = justification_generator.generate(
-            subject_home=subject_home,
-            comparables=top_comparables,
-            price_recommendation=price_recommendation,
-            condition_summary=condition_summary
+        report, _ = analysis_flights.do(
+            flight_key,
+            lambda: pricing_pipeline.analyze(
+                subject_home=subject_home,
+                photos=photos,
+                video_transcript=video_transcript,
+                comparable_sales=comparable_sales,
+                num_comps=DEFAULT_NUM_COMPS,
+                corpus=corpus,
+                nprobe=nprobe,
+                filters=filters,
+                interval_method=interval_method,
+                coverage=coverage
+            ),
+            timeout=ANALYSIS_COALESCE_TIMEOUT
         )
         
         # Compile response
         response = {
             'success': True,
             'subject_home': subject_home,
-            'condition_summary': condition_summary,
-            'top_comparables': top_comparables,
-            'price_recommendation': price_recommendation,
-            'justification': justification,
+            'market': market,
+            **report,
+            'search_mode': 'exact' if nprobe is None else 'approximate',
             'generated_at': datetime.now().isoformat()
         }
         
-        return jsonify(response)
+        return make_api_response(response)
+        
+    except SingleFlightTimeout as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 504
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/analyze-batch', methods=['POST'])
+def analyze_batch():
+    """
+    Value many subjects in one request.
+    
+    Expected input, either JSON:
+    {
+        "subjects": [{"subject_home": {...}, ...}, ...],
+        "num_comps": 5
+    }
+    or an NDJSON body (Content-Type: application/x-ndjson) with one subject
+    per line, read incrementally.
+    
+    With `?stream=true` or `Accept: application/x-ndjson` the response is
+    NDJSON: one {"index", "result"|"error"} line per subject as soon as it is
+    valued, then a summary line. Otherwise all results are returned together.
+    """
+    try:
+        num_comps = parse_num_comps(request.args.get('num_comps'))
+        
+        if request.mimetype == NDJSON_MIMETYPE:
+            subjects = iter_ndjson(request.stream)
+        else:
+            data = request.get_json()
+            if not isinstance(data, dict) or not isinstance(data.get('subjects'), list):
+                return jsonify({'success': False, 'error': 'Expected {"subjects": [...]}'}), 400
+            subjects = data['subjects']
+            if 'num_comps' in data:
+                num_comps = parse_num_comps(data['num_comps'])
+        
+        if wants_ndjson(request.headers.get('Accept'), request.args.get('stream')):
+            def generate():
+                total = failed = 0
+                try:
+                    for outcome in iter_batch_outcomes(subjects, num_comps):
+                        total += 1
+                        failed += 'error' in outcome
+                        yield ndjson_line(outcome)
+                except ValueError as e:
+                    # Malformed NDJSON input; results already sent stay valid
+                    yield ndjson_line({'success': False, 'error': str(e), 'total': total, 'failed': failed})
+                    return
+                yield ndjson_line({'success': True, 'total': total, 'failed': failed})
+            
+            return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+        
+        results = list(iter_batch_outcomes(subjects, num_comps))
+        
+        return make_api_response({
+            'success': True,
+            'total': len(results),
+            'failed': sum(1 for outcome in results if 'error' in outcome),
+            'results': results,
+            'generated_at': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@app.route('/api/sensitivity', methods=['POST'])
+def sensitivity():
+    """
+    What-if pricing: re-price variants of a subject against its market's corpus.
+    
+    Expected input:
+    {
+        "subject_home": {...},
+        "scenarios": [
+            {"name": "add pool", "set": {"has_pool": true}},
+            {"name": "+300 sqft", "add": {"sqft": 300}},
+            {"name": "sell in 3 months", "months_ahead": 3}
+        ],
+        "photos": [...],            (optional, condition shared by all variants)
+        "video_transcript": "...",  (optional)
+        "market": "phoenix",        (optional, else routed from the subject's location)
+        "num_comps": 5,             (optional)
+        "filters": {...}            (optional, see utils/comp_filters.py)
+    }
+    
+    Returns the base price and, per scenario, its price and delta to the base.
+    """
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+        
+        subject_home = data.get('subject_home') or {}
+        num_comps = parse_num_comps(data.get('num_comps'))
+        
+        started = time.perf_counter()
+        market, corpus = market_shards.resolve(subject_home, data.get('market'))
+        report = pricing_pipeline.sensitivity(
+            subject_home,
+            data.get('scenarios'),
+            corpus=corpus,
+            num_comps=num_comps,
+            photos=data.get('photos', []),
+            video_transcript=data.get('video_transcript', ''),
+            filters=data.get('filters')
+        )
+        
+        return make_api_response({
+            'success': True,
+            'market': market,
+            'corpus_version': corpus.version,
+            **report,
+            'computation_ms': round((time.perf_counter() - started) * 1000, 2)
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
         
     except Exception as e:
         return jsonify({
@@ -109,7 +465,7 @@ def analyze_condition():
             video_transcript=data.get('video_transcript', '')
         )
         
-        return jsonify({
+        return make_api_response({
             'success': True,
             'condition_summary': condition_summary
         })
@@ -123,21 +479,42 @@ def analyze_condition():
 
 @app.route('/api/select-comparables', methods=['POST'])
 def select_comparables():
-    """Endpoint to select comparable homes"""
+    """
+    Endpoint to select comparable homes
+    
+    Uses `comparable_sales` from the request when provided, otherwise the
+    server-side corpus of the subject's market (explicit `market`, else
+    routed from its location). Corpus search is exact unless `search_mode` is
+    "approximate" (optionally with `nprobe`). Optional `filters` (sold within N
+    days, sqft/year built ranges, bedrooms, dwelling type, private pool)
+    restrict the candidates before KNN.
+    """
     try:
         data = request.get_json()
+        nprobe = search_nprobe(data)
+        subject_home = data.get('subject_home', {})
+        comparable_sales = data.get('comparable_sales', [])
+        market, corpus = (None, None) if comparable_sales else market_shards.resolve(subject_home, data.get('market'))
         
-        top_comparables = comparable_selector.select_top_comparables(
-            subject_home=data.get('subject_home', {}),
-            comparable_sales=data.get('comparable_sales', []),
-            num_comps=data.get('num_comps', 5)
+        top_comparables = pricing_pipeline.select_comparables(
+            subject_home,
+            comparable_sales,
+            num_comps=parse_num_comps(data.get('num_comps')),
+            corpus=corpus,
+            nprobe=nprobe,
+            filters=data.get('filters')
         )
         
-        return jsonify({
+        return make_api_response({
             'success': True,
-            'comparables': top_comparables
+            'market': market,
+            'comparables': top_comparables,
+            'search_mode': 'exact' if nprobe is None else 'approximate'
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
+        
     except Exception as e:
         return jsonify({
             'success': False,
@@ -145,6 +522,122 @@ def select_comparables():
         }), 500
 
 
+@app.route('/api/comparables/near', methods=['GET'])
+def comparables_near():
+    """
+    Sales within `radius_miles` of `lat`/`lon`, nearest first.
+
+    Served from the spatial index of the market's corpus (explicit `market`,
+    else routed from the point). Optional filter parameters are the same as
+    the `filters` object of /api/select-comparables, with comma-separated
+    lists (e.g. bedrooms=3,4). Pages hold `limit` comps; pass `next_cursor`
+    back as `cursor` for the next one. A cursor from before the corpus
+    changed (ingest or reload) gets 410 Gone; start again from page one.
+    """
+    try:
+        lat, lon = query_float('lat'), query_float('lon')
+        radius_miles = query_float('radius_miles')
+        if radius_miles <= 0:
+            raise ValueError('radius_miles must be positive')
+        
+        return make_api_response(nearby_comparables_page(
+            lat, lon,
+            lambda corpus, rows: rows_within_radius(corpus, lat, lon, radius_miles, rows)
+        ))
+        
+    except StaleCursor as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 410
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@app.route('/api/comparables/bbox', methods=['GET'])
+def comparables_in_bbox():
+    """
+    Sales inside the box `min_lat`/`min_lon`/`max_lat`/`max_lon`.
+
+    Ordered by distance from `lat`/`lon` when given, else from the box centre;
+    market, filter, `limit` and `cursor` parameters work as for
+    /api/comparables/near.
+    """
+    try:
+        box = tuple(query_float(name) for name in ('min_lat', 'min_lon', 'max_lat', 'max_lon'))
+        if box[0] > box[2] or box[1] > box[3]:
+            raise ValueError('Bounding box minimums must not exceed its maximums')
+        lat = query_float('lat', (box[0] + box[2]) / 2)
+        lon = query_float('lon', (box[1] + box[3]) / 2)
+        
+        return make_api_response(nearby_comparables_page(
+            lat, lon,
+            lambda corpus, rows: rows_by_distance(corpus, rows_in_box(corpus, *box, rows), lat, lon)
+        ))
+        
+    except StaleCursor as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 410
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@app.route('/api/heatmap', methods=['GET'])
+def heatmap():
+    """
+    Neighbourhood $/sqft grid cells (count, median, IQR) for a map tile.
+
+    The area is a slippy-map tile (`z`, `x`, `y`) or a bounding box
+    (`min_lat`, `min_lon`, `max_lat`, `max_lon`). Optional `quarter` (e.g.
+    2024Q3) restricts to sales in that quarter, `min_count` hides sparse
+    cells and `market` picks the corpus (else routed from the area centre).
+    """
+    try:
+        if request.args.get('z') is not None:
+            box = tile_bbox(*(int(query_float(name)) for name in ('z', 'x', 'y')))
+        else:
+            box = tuple(query_float(name) for name in ('min_lat', 'min_lon', 'max_lat', 'max_lon'))
+        quarter = request.args.get('quarter')
+        quarter = parse_quarter(quarter) if quarter else None
+        min_count = int(query_float('min_count', 1))
+        
+        center = {'latitude': (box[0] + box[2]) / 2, 'longitude': (box[1] + box[3]) / 2}
+        market, corpus = market_shards.resolve(center, request.args.get('market'))
+        grid = price_grid(corpus)
+        
+        return make_api_response({
+            'success': True,
+            'market': market,
+            'corpus_version': corpus.version,
+            'cell_degrees': grid.cell_degrees,
+            'quarter': request.args.get('quarter'),
+            'quarters': grid.quarters(),
+            'cells': grid.cells_in_bbox(*box, quarter=quarter, min_count=min_count)
+        })
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
 @app.route('/api/analyze-from-data', methods=['GET'])
 def analyze_from_real_data():
     """
@@ -152,17 +645,22 @@ def analyze_from_real_data():
     This endpoint automatically loads:
     - Subject property details from SUBJECT_PROPERTY_DETAILS.json
     - Video transcript from PRE_WALK_VIDEO_TRANSCRIPTION.json
-    - Comparable properties from PHOENIX_SALES_RECORDS.json
+    - Comparable properties from PHOENIX_SALES_RECORDS.json (prepared corpus)
     
     Returns a complete pricing report without requiring any input.
+    The report is cached (with its compressed variants) until the corpus
+    version or the subject data files change.
     """
     try:
-        # Load all real data
-        real_data = load_real_data()
+        comparable_sales = corpus_provider.get()
+        cache_key = ('analyze-from-data', comparable_sales.version, subject_data_signature())
+        cached = cached_api_response(cache_key)
+        if cached is not None:
+            return cached
         
-        subject_home = real_data['subject_property']
-        video_transcript = real_data['video_transcript']
-        comparable_sales = real_data['comparable_properties']
+        # Load subject + transcript; comparables come from the prepared corpus
+        subject_home = normalize_subject_property(load_subject_property())
+        video_transcript = load_video_transcript()
         
         if not subject_home:
             return jsonify({'success': False, 'error': 'Subject property data not found'}), 400
@@ -170,51 +668,233 @@ def analyze_from_real_data():
         if not video_transcript:
             return jsonify({'success': False, 'error': 'Video transcript not found'}), 400
         
-        if not comparable_sales:
+        if len(comparable_sales) == 0:
             return jsonify({'success': False, 'error': 'No comparable properties found'}), 400
         
-        # Step 1: Analyze home condition
-        condition_summary = condition_analyzer.analyze(
-            subject_home=subject_home,
-            photos=[],  # Photos not provided in data files
-            video_transcript=video_transcript
-        )
-        
-        # Step 2: Select top 7 comparable homes
-        top_comparables = comparable_selector.select_top_comparables(
-            subject_home=subject_home,
-            comparable_sales=comparable_sales,
-            num_comps=7
-        )
-        
-        # Step 3: Estimate price based on comparables
-        price_recommendation = price_estimator.estimate_price(
-            subject_home=subject_home,
-            comparables=top_comparables,
-            condition_summary=condition_summary
-        )
-        
-        # Step 4: Generate justification
-        justification = justification_generator.generate(
-            subject_home=subject_home,
-            comparables=top_comparables,
-            price_recommendation=price_recommendation,
-            condition_summary=condition_summary
+        # Concurrent cache misses (e.g. right after a reload) compute the report once
+        report, _ = analysis_flights.do(
+            canonical_request_key('analyze-from-data', list(cache_key)),
+            lambda: pricing_pipeline.analyze(
+                subject_home=subject_home,
+                photos=[],  # Photos not provided in data files
+                video_transcript=video_transcript,
+                num_comps=7,
+                corpus=comparable_sales
+            ),
+            timeout=ANALYSIS_COALESCE_TIMEOUT
         )
         
         # Compile response
         response = {
             'success': True,
             'subject_home': subject_home,
-            'condition_summary': condition_summary,
-            'top_comparables': top_comparables,
-            'price_recommendation': price_recommendation,
-            'justification': justification,
+            **report,
             'data_source': 'real_data_files',
             'generated_at': datetime.now().isoformat()
         }
         
-        return jsonify(response)
+        return make_api_response(response, cache_key=cache_key)
+        
+    except SingleFlightTimeout as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 504
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@app.route('/api/sales', methods=['POST'])
+def ingest_sale():
+    """
+    Append one newly closed listing to the live sales corpus.
+    
+    Expected input: a single listing in the PHOENIX_SALES_RECORDS.json
+    `listings` schema. The listing is persisted to its market's storage (the
+    write-ahead log for JSON) and is visible to comparable selection
+    immediately, without a full reload.
+    """
+    try:
+        listing = request.get_json()
+        
+        if not isinstance(listing, dict) or not listing:
+            return jsonify({'success': False, 'error': 'Expected a listing object'}), 400
+        
+        result = market_shards.ingest([listing])
+        if not result['accepted']:
+            return jsonify({'success': False, 'accepted': 0, 'rejected': result['rejected']}), 422
+        
+        return jsonify({'success': True, **result['markets'][0]}), 201
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@app.route('/api/sales/bulk', methods=['POST'])
+def ingest_sales_bulk():
+    """
+    Append many newly closed listings to the live sales corpora.
+    
+    Expected input:
+    {
+        "listings": [...]
+    }
+    
+    Listings are grouped by market (see MarketShards.ingest); the response
+    reports each market's accepted count and resulting corpus version.
+    """
+    try:
+        data = request.get_json()
+        listings = data.get('listings', []) if isinstance(data, dict) else []
+        
+        if not listings:
+            return jsonify({'success': False, 'error': 'No listings provided'}), 400
+        if not isinstance(listings, list) or not all(isinstance(listing, dict) for listing in listings):
+            return jsonify({'success': False, 'error': 'listings must be a list of listing objects'}), 400
+        
+        result = market_shards.ingest(listings)
+        
+        return jsonify({'success': True, **result}), 201 if result['accepted'] else 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a valuation job and return its id immediately.
+    
+    Expected input, either a single /api/analyze-home body or a batch:
+    {
+        "subjects": [
+            {"subject_home": {...}, "photos": [...], "video_transcript": "...", "comparable_sales": [...]},
+            ...
+        ],
+        "num_comps": 5
+    }
+    """
+    try:
+        data = request.get_json()
+        
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+        
+        subjects = data.get('subjects')
+        if subjects is None and 'subject_home' in data:
+            subjects = [data]
+        
+        if not isinstance(subjects, list) or not subjects:
+            return jsonify({'success': False, 'error': 'No subjects provided'}), 400
+        
+        num_comps = parse_num_comps(data.get('num_comps'))
+        
+        job = job_manager.submit(subjects, lambda subject: value_subject(subject, num_comps))
+        
+        return jsonify({'success': True, **job.summary(include_results=False)}), 202
+        
+    except JobQueueFull as e:
+        response = jsonify({'success': False, 'error': str(e), 'type': type(e).__name__})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e), 'type': type(e).__name__}), 400
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'type': type(e).__name__
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Poll a job's status, progress and results (completed so far).
+    
+    Pass `results=false` to get status and progress only.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    include_results = request.args.get('results', 'true').lower() not in ('0', 'false', 'no')
+    return make_api_response({'success': True, **job.summary(include_results=include_results)})
+
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    """
+    Stream a job's results as NDJSON, one line per subject as it completes,
+    followed by a final status line.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    def generate():
+        for outcome in job.iter_outcomes():
+            yield ndjson_line(outcome)
+        yield ndjson_line({'success': True, **job.summary(include_results=False)})
+    
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    Cancel a job. Queued jobs never start; running jobs stop after the
+    subject in progress and keep their partial results.
+    """
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True, **job.summary(include_results=False)})
+
+
+@app.route('/api/markets', methods=['GET'])
+def list_markets():
+    """
+    Markets with sales data (one per <MARKET>_SALES_RECORDS.json), their
+    routing metadata, and which shards are currently loaded.
+    """
+    try:
+        return jsonify({
+            'success': True,
+            'markets': market_shards.summaries(),
+            'shards': market_shards.stats()
+        })
         
     except Exception as e:
         return jsonify({
@@ -0,0 +1,99 @@
+"""
+Leave-one-out backtest of the KNN pricer against the sales corpus.
+
+Every sale is valued from the sales that closed before it, and the report
+gives MAE, MAPE and median APE overall, by zip code and by price band.
+
+Usage (from the backend directory):
+    python backtest.py --workers 8 --report backtest.json
+    python backtest.py --num-comps 7 --predictions predictions.csv
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from services.backtester import Backtester, DEFAULT_MEMORY_BUDGET
+from services.price_estimator import PriceEstimator
+from utils.corpus import load_sales_corpus
+from utils.data_loader import load_knn_weights
+from utils.shared_corpus import SharedCorpusStore
+
+
+def print_table(title, groups):
+    print(f"\n{title}")
+    print(f"{'':>22} {'count':>7} {'MAE':>12} {'MAPE %':>8} {'MdAPE %':>8}")
+    for label, metrics in groups.items():
+        print(f"{label:>22} {metrics['count']:>7} {metrics['mae']:>12,.0f} {metrics['mape']:>8.2f} {metrics['median_ape']:>8.2f}")
+
+
+def main(argv=None) -> int:
+    settings = load_knn_weights()
+
+    parser = argparse.ArgumentParser(description="Leave-one-out backtest of the KNN pricer.")
+    parser.add_argument('--num-comps', type=int, default=int(settings.get('num_comps', 5)),
+                        help="K nearest comparables (default: tuned K, else 5)")
+    parser.add_argument('--min-comps', type=int, default=None, help="Skip sales with fewer earlier sales (default: K)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                        help="Distance matrix memory per block in MB (default: 256)")
+    parser.add_argument('--report', help="Write the JSON report to this file")
+    parser.add_argument('--predictions', help="Write per-sale predictions to this CSV file")
+    args = parser.parse_args(argv)
+
+    corpus = load_sales_corpus()
+    if len(corpus) == 0:
+        raise SystemExit("No comparable sales found in the data directory")
+
+    # Backtest the settings the API serves with (tuned weights file, else defaults)
+    backtester = Backtester(
+        num_comps=args.num_comps,
+        feature_weights=settings.get('feature_weights'),
+        price_estimator=PriceEstimator(idw_power=float(settings.get('idw_power', 1.0))),
+        memory_budget=args.memory_mb * 1024 * 1024
+    )
+    workers = max(1, args.workers)
+    print(f"Backtesting {len(corpus)} sales (version {corpus.version}), K={args.num_comps}, "
+          f"{len(backtester.blocks(corpus))} block(s) on {workers} worker(s)")
+
+    started = time.time()
+    store = None
+    if workers > 1:
+        store = SharedCorpusStore(f"backtest_{os.getpid()}")
+        store.publish(corpus)
+    try:
+        rows, predictions = backtester.run(
+            corpus, workers=workers, min_comps=args.min_comps, store_name=store.name if store else None
+        )
+    finally:
+        if store is not None:
+            store.unlink()
+    elapsed = time.time() - started
+
+    report = backtester.report(corpus, rows, predictions)
+    report['elapsed_seconds'] = round(elapsed, 2)
+
+    overall = report['overall']
+    print(f"Valued {report['valued']} sales ({report['skipped']} skipped) in {elapsed:.1f}s")
+    if overall['count']:
+        print(f"MAE ${overall['mae']:,.0f}  MAPE {overall['mape']:.2f}%  median APE {overall['median_ape']:.2f}%")
+        print_table("By price band", report['by_price_band'])
+        print_table("By zip code", report['by_zip'])
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.predictions:
+        with open(args.predictions, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['address', 'sale_date', 'sale_price', 'predicted_price'])
+            for row, predicted in zip(rows.tolist(), predictions.tolist()):
+                record = corpus.record(row)
+                writer.writerow([record.get('address', ''), record.get('sale_date', ''), corpus.prices[row], int(predicted)])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
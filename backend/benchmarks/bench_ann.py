@@ -0,0 +1,90 @@
+"""
+Benchmark approximate (IVF) comparable search against exact search.
+
+Builds a synthetic corpus of clustered metro-area sales, then for a sample of
+subjects reports per-query latency of ComparableSelector.select_from_corpus
+in exact mode and in approximate mode at several nprobe values, with the
+measured recall@K of the approximate results against the exact ones.
+
+Run from the backend directory:
+    python benchmarks/bench_ann.py [N ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.comparable_selector import ComparableSelector
+from utils.ann_index import recall_at_k
+from utils.corpus import build_corpus
+
+SIZES = (100_000, 1_000_000)
+NPROBES = (1, 4, 8, 16, 32)
+QUERIES = 200
+K = 5
+
+
+def synthetic_sales(n: int, rng: np.random.Generator):
+    """Sales scattered around 40 neighbourhood centres."""
+    centres = rng.uniform((29.5, -98.8), (30.5, -97.5), size=(40, 2))
+    location = centres[rng.integers(len(centres), size=n)] + rng.normal(scale=0.02, size=(n, 2))
+    sqft = rng.normal(2000, 600, size=n).clip(500)
+    bedrooms = rng.integers(1, 6, size=n)
+    bathrooms = rng.integers(1, 5, size=n)
+    year_built = rng.integers(1950, 2024, size=n)
+    pool = rng.random(n) < 0.2
+    days = rng.integers(1, 720, size=n)
+    return [
+        {
+            'listing_id': i,
+            'latitude': float(location[i, 0]),
+            'longitude': float(location[i, 1]),
+            'sqft': float(sqft[i]),
+            'bedrooms': int(bedrooms[i]),
+            'bathrooms': int(bathrooms[i]),
+            'year_built': int(year_built[i]),
+            'has_private_pool': bool(pool[i]),
+            'days_since_sale': int(days[i]),
+            'sale_price': float(sqft[i] * 200),
+        }
+        for i in range(n)
+    ]
+
+
+def timed_search(selector, subjects, corpus, nprobe=None):
+    """(mean milliseconds per query, listing ids per query)."""
+    found = []
+    start = time.perf_counter()
+    for subject in subjects:
+        comps = selector.select_from_corpus(subject, corpus, num_comps=K, nprobe=nprobe)
+        found.append([comp['listing_id'] for comp in comps])
+    return (time.perf_counter() - start) * 1000 / len(subjects), found
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    rng = np.random.default_rng(0)
+
+    print(f"{'N':>9} {'mode':>12} {'ms/query':>9} {'recall@' + str(K):>9}")
+    for n in sizes:
+        sales = synthetic_sales(n + QUERIES, rng)
+        corpus = build_corpus(sales[:n])
+        subjects = [{**sale, 'days_since_sale': 0} for sale in sales[n:]]
+        selector = ComparableSelector()
+
+        start = time.perf_counter()
+        index = selector.ann_index(corpus)
+        print(f"{n:>9} {'index build':>12} {(time.perf_counter() - start) * 1000:>9.0f}   nlist={index.nlist}")
+
+        exact_ms, exact = timed_search(selector, subjects, corpus)
+        print(f"{n:>9} {'exact':>12} {exact_ms:>9.2f} {1.0:>9.3f}")
+        for nprobe in NPROBES:
+            approx_ms, approx = timed_search(selector, subjects, corpus, nprobe)
+            print(f"{n:>9} {f'nprobe={nprobe}':>12} {approx_ms:>9.2f} {recall_at_k(exact, approx):>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
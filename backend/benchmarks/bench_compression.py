@@ -0,0 +1,81 @@
+"""
+Benchmark response compression: CPU cost vs. bytes saved.
+
+Builds realistic analysis payloads from the real data files (a single
+/api/analyze-from-data report and batches of reports) and measures each
+encoder/level combination.
+
+Run from the backend directory:
+    python benchmarks/bench_compression.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.condition_analyzer import ConditionAnalyzer
+from services.comparable_selector import ComparableSelector
+from services.price_estimator import PriceEstimator
+from services.justification_generator import JustificationGenerator
+from utils.compression import brotli, compress_body
+from utils.corpus import load_sales_corpus
+from utils.data_loader import load_video_transcript
+from utils.serialization import dumps_json
+
+BATCH_SIZES = (1, 10, 100)
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 5, 11)
+
+
+def build_report(subject_home, corpus, video_transcript):
+    """Run the full pipeline for one subject, like /api/analyze-home."""
+    condition_summary = ConditionAnalyzer().analyze(subject_home, [], video_transcript)
+    comparables = ComparableSelector().select_from_corpus(subject_home, corpus, num_comps=7)
+    price = PriceEstimator().estimate_price(subject_home, comparables, condition_summary)
+    justification = JustificationGenerator().generate(subject_home, comparables, price, condition_summary)
+    return {
+        'success': True,
+        'subject_home': subject_home,
+        'condition_summary': condition_summary,
+        'top_comparables': comparables,
+        'price_recommendation': price,
+        'justification': justification,
+    }
+
+
+def time_call(fn, body, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(body)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    corpus = load_sales_corpus()
+    transcript = load_video_transcript()
+
+    # Use real sales as subjects so every report differs
+    subjects = [corpus.record(row) for row in range(min(max(BATCH_SIZES), len(corpus)))]
+    reports = [build_report(subject, corpus, transcript) for subject in subjects]
+
+    codecs = [(f'gzip-{level}', lambda body, level=level: compress_body(body, 'gzip', level)) for level in GZIP_LEVELS]
+    if brotli is not None:
+        codecs += [(f'br-{quality}', lambda body, quality=quality: compress_body(body, 'br', quality)) for quality in BROTLI_QUALITIES]
+    else:
+        print("brotli not installed; benchmarking gzip only\n")
+
+    print(f"{'payload':>12} {'codec':>8} {'raw KB':>9} {'out KB':>9} {'ratio':>7} {'ms':>8} {'MB/s':>8}")
+    for batch_size in BATCH_SIZES:
+        body = dumps_json({'success': True, 'results': reports[:batch_size]} if batch_size > 1 else reports[0])
+        repeat = max(3, 200 // batch_size)
+        for name, codec in codecs:
+            seconds, compressed = time_call(codec, body, repeat)
+            print(
+                f"{batch_size:>6} rep(s) {name:>8} {len(body) / 1024:>9.1f} {len(compressed) / 1024:>9.1f} "
+                f"{len(body) / len(compressed):>7.1f} {seconds * 1000:>8.2f} {len(body) / seconds / 1e6:>8.1f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark the blocked distance kernel: all-pairs top-k over synthetic corpora.
+
+Compares memory budgets and reports throughput against the size a full
+N x N float64 distance matrix would need.
+
+Run from the backend directory:
+    python benchmarks/bench_distance.py [N ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.corpus import FEATURE_NAMES
+from utils.distance import tile_shape, top_k_neighbours
+
+SIZES = (10_000, 50_000)
+BUDGETS_MB = (16, 64, 256)
+K = 10
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    rng = np.random.default_rng(0)
+
+    print(f"{'N':>9} {'budget MB':>10} {'tile':>16} {'full matrix GB':>15} {'seconds':>9} {'pairs/s':>12}")
+    for n in sizes:
+        points = rng.normal(size=(n, len(FEATURE_NAMES)))
+        for budget_mb in BUDGETS_MB:
+            budget = budget_mb * 1024 * 1024
+            rows, cols = tile_shape(n, n, budget)
+            start = time.perf_counter()
+            top_k_neighbours(points, points, K, memory_budget=budget, exclude_self=True)
+            seconds = time.perf_counter() - start
+            print(
+                f"{n:>9} {budget_mb:>10} {f'{rows}x{cols}':>16} {n * n * 8 / 1e9:>15.1f} "
+                f"{seconds:>9.2f} {n * n / seconds:>12,.0f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
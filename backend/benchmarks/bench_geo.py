@@ -0,0 +1,74 @@
+"""
+Benchmark the vectorized haversine / score-breakdown kernel against the
+per-comp scalar path it replaced.
+
+Run from the backend directory:
+    python benchmarks/bench_geo.py [N ...]
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.corpus import FEATURE_NAMES
+from utils.geo import breakdown_columns, score_breakdowns
+
+SIZES = (10, 1_000, 100_000)
+
+
+def scalar_breakdown(subject, comp):
+    """The former per-comp implementation (math module, one dict at a time)."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (subject['latitude'], subject['longitude'], comp['latitude'], comp['longitude']))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    miles = 3959 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return {
+        'distance_miles': round(miles, 2),
+        'sqft_diff': abs(subject['sqft'] - comp['sqft']),
+        'sqft_pct_diff': round(abs(subject['sqft'] - comp['sqft']) / subject['sqft'] * 100, 1),
+        'bedrooms_diff': abs(subject['bedrooms'] - comp['bedrooms']),
+        'bathrooms_diff': abs(subject['bathrooms'] - comp['bathrooms']),
+        'age_diff_years': abs(subject['year_built'] - comp['year_built']),
+        'days_since_sale': comp['days_since_sale'],
+        'has_pool_match': 1 if subject['has_pool'] == comp['has_pool'] else 0,
+        'knn_method': 'Weighted Euclidean Distance',
+    }
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    rng = np.random.default_rng(0)
+
+    print(f"{'comps':>8} {'scalar ms':>10} {'vector ms':>10} {'speedup':>8} {'arrays only ms':>15}")
+    for n in sizes:
+        comps = np.column_stack([
+            rng.uniform(33.2, 33.8, n), rng.uniform(-112.4, -111.6, n), rng.uniform(800, 4000, n),
+            rng.integers(1, 6, n), rng.integers(1, 4, n), rng.integers(1950, 2024, n),
+            rng.integers(0, 2, n), rng.integers(1, 720, n),
+        ]).astype(np.float64)
+        subject = comps[0].copy()
+        subject_dict = dict(zip(FEATURE_NAMES, subject.tolist()))
+        comp_dicts = [dict(zip(FEATURE_NAMES, row)) for row in comps.tolist()]
+
+        start = time.perf_counter()
+        [scalar_breakdown(subject_dict, comp) for comp in comp_dicts]
+        scalar_ms = (time.perf_counter() - start) * 1000
+
+        score_breakdowns(subject, comps[:1])  # warm up
+        start = time.perf_counter()
+        score_breakdowns(subject, comps)
+        vector_ms = (time.perf_counter() - start) * 1000
+
+        # Batch / backtest consumers can stay in arrays and skip the per-comp dicts
+        start = time.perf_counter()
+        breakdown_columns(subject, comps)
+        columns_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{n:>8} {scalar_ms:>10.2f} {vector_ms:>10.2f} {scalar_ms / vector_ms:>7.1f}x {columns_ms:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Offline bulk valuation: price a JSONL or CSV file of subject homes against
+the sales corpus without running the Flask server.
+
+Each input row is either a subject home (app format, or raw
+SUBJECT_PROPERTY_DETAILS format with `property_address`) or an
+/api/analyze-home style body with a `subject_home` key. CSV columns map to
+subject home fields.
+
+The corpus is loaded once and published to shared memory; worker processes
+attach to it zero-copy. Results are appended to a JSONL file in input order,
+and a checkpoint next to it records how far the run got, so an interrupted
+run continues where it stopped with --resume.
+
+Usage (from the backend directory):
+    python bulk_valuation.py subjects.jsonl results.jsonl --workers 8
+    python bulk_valuation.py subjects.csv results.jsonl --resume
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from itertools import islice
+from typing import Any, Dict, Iterator, Optional
+
+from services.pricing_pipeline import PricingPipeline
+from utils.corpus import load_sales_corpus
+from utils.data_loader import load_knn_weights, normalize_subject_property
+from utils.shared_corpus import SharedCorpusStore
+
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+
+# Per-worker state, set by _init_worker
+_pipeline: Optional[PricingPipeline] = None
+_corpus = None
+_num_comps = 5
+_full_reports = False
+
+
+def _parse_csv_value(value: str) -> Any:
+    """Convert a CSV cell to bool/int/float where it looks like one."""
+    text = value.strip()
+    if text.lower() in ('true', 'false'):
+        return text.lower() == 'true'
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def iter_subjects(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield raw input rows from a .csv or JSONL file, one at a time."""
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                yield {key: _parse_csv_value(value) for key, value in row.items() if value not in (None, '')}
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def count_subjects(path: str) -> int:
+    """Number of input rows (header and blank lines excluded)."""
+    with open(path, 'rb') as f:
+        count = sum(1 for line in f if line.strip())
+    return count - 1 if path.lower().endswith('.csv') and count else count
+
+
+def to_subject_home(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Subject home dict from any supported input row shape."""
+    subject = row.get('subject_home', row)
+    if 'property_address' in subject:
+        subject = normalize_subject_property(subject)
+    return subject
+
+
+def _init_worker(store_name: str, num_comps: int, full_reports: bool) -> None:
+    global _pipeline, _corpus, _num_comps, _full_reports
+    _corpus = SharedCorpusStore(store_name).current()
+    _pipeline = PricingPipeline.from_knn_settings(load_knn_weights())
+    _num_comps = num_comps
+    _full_reports = full_reports
+
+
+def _value_row(task) -> Dict[str, Any]:
+    index, row = task
+    try:
+        subject_home = to_subject_home(row)
+        report = _pipeline.analyze(
+            subject_home=subject_home,
+            video_transcript=row.get('video_transcript', ''),
+            num_comps=_num_comps,
+            corpus=_corpus
+        )
+        result = {
+            'index': index,
+            'address': subject_home.get('address', ''),
+            'price_recommendation': report['price_recommendation'],
+        }
+        if _full_reports:
+            result.update(report)
+        return result
+    except Exception as e:
+        return {'index': index, 'error': f"{type(e).__name__}: {e}"}
+
+
+def _input_signature(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_checkpoint(output_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(output_path + CHECKPOINT_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(output_path: str, checkpoint: Dict[str, Any]) -> None:
+    """Atomically replace the checkpoint file."""
+    checkpoint_path = output_path + CHECKPOINT_SUFFIX
+    with open(checkpoint_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run(
+    input_path: str,
+    output_path: str,
+    workers: int,
+    num_comps: int = 5,
+    resume: bool = False,
+    checkpoint_every: int = 1000,
+    progress_interval: float = 5.0,
+    full_reports: bool = False
+) -> Dict[str, int]:
+    """
+    Value every row of `input_path`, appending results to `output_path`.
+
+    Returns:
+        {'valued': rows valued in this run, 'failed': rows with errors, 'total': input rows}
+    """
+    signature = _input_signature(input_path)
+    checkpoint = load_checkpoint(output_path) if resume else None
+    if checkpoint is not None and checkpoint['input'] != signature:
+        raise SystemExit(f"Checkpoint for {output_path} was written for a different input file; rerun without --resume")
+    if checkpoint is None and os.path.exists(output_path) and os.path.getsize(output_path) > 0 and not resume:
+        raise SystemExit(f"{output_path} already exists; pass --resume to continue it or remove it first")
+
+    completed = checkpoint['completed'] if checkpoint else 0
+    output_bytes = checkpoint['output_bytes'] if checkpoint else 0
+    if output_bytes and (not os.path.exists(output_path) or os.path.getsize(output_path) < output_bytes):
+        raise SystemExit(f"{output_path} is shorter than its checkpoint records; rerun without --resume")
+    total = count_subjects(input_path)
+
+    corpus = load_sales_corpus()
+    if len(corpus) == 0:
+        raise SystemExit("No comparable sales found in the data directory")
+    print(f"Corpus: {len(corpus)} sales (version {corpus.version}); {total} subjects, {completed} already done")
+
+    store = SharedCorpusStore(f"bulk_valuation_{os.getpid()}")
+    store.publish(corpus)
+
+    # Drop anything written after the last checkpoint, then append
+    with open(output_path, 'a+b') as out:
+        out.truncate(output_bytes)
+    out = open(output_path, 'ab')
+
+    valued = failed = 0
+    started = last_report = time.time()
+    try:
+        tasks = enumerate(islice(iter_subjects(input_path), completed, None), start=completed)
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(store.name, num_comps, full_reports)) as pool:
+            for result in pool.imap(_value_row, tasks, chunksize=32):
+                out.write(json.dumps(result).encode('utf-8') + b'\n')
+                completed += 1
+                valued += 1
+                failed += 'error' in result
+
+                if valued % checkpoint_every == 0:
+                    out.flush()
+                    os.fsync(out.fileno())
+                    write_checkpoint(output_path, {'input': signature, 'completed': completed, 'output_bytes': out.tell()})
+
+                now = time.time()
+                if now - last_report >= progress_interval:
+                    rate = valued / (now - started)
+                    eta = (total - completed) / rate if rate > 0 else 0
+                    print(f"{completed}/{total} ({completed / max(total, 1):.1%}) {rate:,.0f} rows/s, ETA {_format_seconds(eta)}", flush=True)
+                    last_report = now
+    finally:
+        out.flush()
+        os.fsync(out.fileno())
+        write_checkpoint(output_path, {'input': signature, 'completed': completed, 'output_bytes': out.tell()})
+        out.close()
+        store.unlink()
+
+    elapsed = time.time() - started
+    print(f"Done: {valued} valued ({failed} failed) in {_format_seconds(elapsed)}, {valued / max(elapsed, 1e-9):,.0f} rows/s")
+    return {'valued': valued, 'failed': failed, 'total': total}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Value a JSONL/CSV file of subject homes against the sales corpus.")
+    parser.add_argument('input', help="Subjects file (.jsonl or .csv)")
+    parser.add_argument('output', help="Results file (JSONL, appended in input order)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument('--num-comps', type=int, default=int(load_knn_weights().get('num_comps', 5)),
+                        help="Comparables per subject (default: tuned K, else 5)")
+    parser.add_argument('--resume', action='store_true', help="Continue from the output's checkpoint")
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help="Rows between checkpoints (default: 1000)")
+    parser.add_argument('--progress-interval', type=float, default=5.0, help="Seconds between progress lines (default: 5)")
+    parser.add_argument('--full', action='store_true', help="Write full reports (condition, comparables, justification)")
+    args = parser.parse_args(argv)
+
+    run(
+        args.input,
+        args.output,
+        workers=max(1, args.workers),
+        num_comps=args.num_comps,
+        resume=args.resume,
+        checkpoint_every=max(1, args.checkpoint_every),
+        progress_interval=args.progress_interval,
+        full_reports=args.full
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Bulk import sales listings into the SQLite sales database.
+
+Reads files in the PHOENIX_SALES_RECORDS.json `listings` schema (or JSONL
+write-ahead logs), normalizes them and loads them into the typed `sales`
+table. Listings already present (same `id`) are replaced, so
+re-running an import is safe. Listings without a `market` are stored under
+the market of their file name (PHOENIX_SALES_RECORDS.json -> phoenix) or
+--market. Serve from the database with SALES_STORAGE=sqlite.
+
+Usage (from the backend directory):
+    python import_sales.py                      # every market file (and WAL) in data/
+    python import_sales.py --db /srv/sales.db exports/*.json
+"""
+import argparse
+import os
+import sys
+import time
+
+from utils.data_loader import DATA_DIR, discover_market_files, records_file_market, sales_wal_file
+from utils.storage import SqliteSalesStorage, iter_listings_file, sales_db_path
+
+
+def default_input_files():
+    """Every market records file in the data directory, each followed by its WAL if present."""
+    paths = []
+    for records_file in discover_market_files().values():
+        for name in (records_file, sales_wal_file(records_file)):
+            path = os.path.join(DATA_DIR, name)
+            if os.path.exists(path):
+                paths.append(path)
+    return paths
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import sales listings into the SQLite sales database.")
+    parser.add_argument('inputs', nargs='*', help="Listings JSON / JSONL files (default: market files in data/)")
+    parser.add_argument('--db', default=sales_db_path(), help="Database file (default: SALES_DB_PATH or data/sales.db)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Listings per transaction (default: 5000)")
+    parser.add_argument('--market', help="Market for listings without one (default: from each file name)")
+    args = parser.parse_args(argv)
+
+    inputs = args.inputs or default_input_files()
+    if not inputs:
+        raise SystemExit("No listings files to import")
+
+    storage = SqliteSalesStorage(args.db)
+    for path in inputs:
+        started = time.time()
+        counts = storage.import_listings(
+            iter_listings_file(path),
+            batch_size=args.batch_size,
+            market=args.market or records_file_market(path)
+        )
+        print(f"{path}: {counts['imported']} imported, {counts['rejected']} rejected "
+              f"({time.time() - started:.1f}s)")
+
+    print(f"{storage.count()} sales in {args.db}")
+    storage.pool.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Minimal Python client for the batch valuation endpoints.
+
+Streams subjects to /api/analyze-batch as NDJSON and yields each result as
+soon as the server sends it, so neither the request nor the response is
+held in memory in full:
+
+    from pricing_client import stream_batch
+
+    for outcome in stream_batch("http://localhost:5000", subjects):
+        if 'error' in outcome:
+            print(outcome['index'], outcome['error'])
+        else:
+            print(outcome['index'], outcome['result']['price_recommendation']['recommended_price'])
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import requests
+
+from utils.ndjson import NDJSON_MIMETYPE, iter_ndjson
+
+API_BASE_URL = "http://localhost:5000"
+
+
+def _encode_subjects(subjects: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for subject in subjects:
+        yield json.dumps(subject).encode('utf-8') + b'\n'
+
+
+def stream_batch(
+    base_url: str = API_BASE_URL,
+    subjects: Iterable[Dict[str, Any]] = (),
+    num_comps: int = 5,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Value subjects via /api/analyze-batch, yielding one outcome per subject.
+
+    Args:
+        base_url: Server root, e.g. http://localhost:5000
+        subjects: Iterable of /api/analyze-home style bodies; a generator is
+            uploaded lazily with chunked transfer encoding
+        num_comps: Comparables per subject
+        session: Optional requests.Session to reuse connections
+        timeout: Seconds to wait between bytes from the server
+
+    Yields:
+        {'index': i, 'result': {...}} or {'index': i, 'error': '...'}
+
+    Raises:
+        RuntimeError: The server reported a failure in its summary line
+    """
+    http = session or requests.Session()
+    response = http.post(
+        f"{base_url}/api/analyze-batch",
+        params={'stream': 'true', 'num_comps': num_comps},
+        data=_encode_subjects(subjects),
+        headers={'Content-Type': NDJSON_MIMETYPE, 'Accept': NDJSON_MIMETYPE},
+        stream=True,
+        timeout=timeout
+    )
+    try:
+        response.raise_for_status()
+        for line in iter_ndjson(response.iter_lines()):
+            if 'index' in line:
+                yield line
+            elif not line.get('success', False):
+                raise RuntimeError(line.get('error', 'Batch failed'))
+    finally:
+        response.close()
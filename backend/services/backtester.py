@@ -0,0 +1,318 @@
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import multiprocessing
+import re
+import numpy as np
+
+from services.condition_analyzer import ConditionAnalyzer
+from services.comparable_selector import ComparableSelector
+from services.price_estimator import PriceEstimator
+from utils.corpus import SalesCorpus
+from utils.distance import DEFAULT_MEMORY_BUDGET, scaled_features, tile_shape, top_k_neighbours
+from utils.geo import haversine_miles
+from utils.hedonic import hedonic_model
+from utils.market_index import market_index
+from utils.price_grid import price_grid
+
+
+# Upper edges of the sale price bands used in the report
+DEFAULT_PRICE_BANDS = (250_000, 400_000, 600_000, 1_000_000)
+
+ZIP_PATTERN = re.compile(r'(\d{5})(?:-\d{4})?\s*$')
+
+
+def _zip_code(address: str) -> str:
+    match = ZIP_PATTERN.search(address or '')
+    return match.group(1) if match else 'unknown'
+
+
+def _price_band(price: float, bands: Sequence[float]) -> str:
+    lower = 0
+    for upper in bands:
+        if price < upper:
+            return f"{int(lower):,}-{int(upper):,}"
+        lower = upper
+    return f"{int(lower):,}+"
+
+
+def error_metrics(predicted: np.ndarray, actual: np.ndarray) -> Dict[str, Any]:
+    """MAE, MAPE and median APE for one group of predictions."""
+    if len(actual) == 0:
+        return {'count': 0, 'mae': None, 'mape': None, 'median_ape': None}
+    abs_error = np.abs(predicted - actual)
+    ape = abs_error / actual * 100
+    return {
+        'count': int(len(actual)),
+        'mae': round(float(abs_error.mean()), 2),
+        'mape': round(float(ape.mean()), 2),
+        'median_ape': round(float(np.median(ape)), 2),
+    }
+
+
+class Backtester:
+    """
+    Leave-one-out backtest of the KNN pricer over a sales corpus.
+
+    Every sale is valued as if it were the subject on its own sale date: its
+    K nearest neighbours are searched among sales that closed strictly
+    earlier (no look-ahead), using the same standardized features and
+    FEATURE_WEIGHTS as ComparableSelector, and the price comes from
+    PriceEstimator with the same weighting and adjustments as the API: the
+    corpus's market index (moving comp prices to the subject's sale date),
+    hedonic model and neighbourhood $/sqft prior. Conformal calibration
+    (services.conformal) relies on this being the predictor that is served.
+
+    The neighbour search is blocked: subjects are processed in sale-date order
+    in blocks sized to a memory budget, and each block's distances to the
+    earlier sales go through the tiled kernel in utils.distance. Blocks can
+    be spread across a process pool.
+    """
+
+    def __init__(
+        self,
+        num_comps: int = 5,
+        feature_weights: Optional[Dict[str, float]] = None,
+        condition_analyzer: Optional[ConditionAnalyzer] = None,
+        price_estimator: Optional[PriceEstimator] = None,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET
+    ):
+        self.num_comps = num_comps
+        self.feature_weights = {**ComparableSelector.FEATURE_WEIGHTS, **(feature_weights or {})}
+        self.condition_analyzer = condition_analyzer or ConditionAnalyzer()
+        self.price_estimator = price_estimator or PriceEstimator()
+        self.memory_budget = memory_budget
+
+    def prepare(self, corpus: SalesCorpus) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Weighted feature space in sale-date order.
+
+        The corpus' standardized days column is (mean_sale_day - sale_day) / std,
+        which equals the standardized days_since_sale of both subject and comp
+        on any valuation date, so one matrix serves every held-out subject.
+
+        Returns:
+            (order, scaled, cutoffs): corpus rows sorted by sale date; their
+            standardized features scaled by sqrt(weight); and for each sorted
+            position, the number of sales strictly before its sale date
+        """
+        order = np.argsort(corpus.sale_days, kind='stable')
+        scaled = scaled_features(corpus, self.feature_weights)[order]
+        sorted_days = corpus.sale_days[order]
+        cutoffs = np.searchsorted(sorted_days, sorted_days, side='left')
+        return order, scaled, cutoffs
+
+    def blocks(self, corpus: SalesCorpus) -> List[Tuple[int, int]]:
+        """Contiguous ranges of sorted positions, each within the memory budget."""
+        n = len(corpus)
+        block_size, _ = tile_shape(n, n, self.memory_budget)
+        return [(start, min(n, start + block_size)) for start in range(0, n, block_size)]
+
+    def nearest_prior(
+        self,
+        scaled: np.ndarray,
+        cutoffs: np.ndarray,
+        start: int,
+        stop: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        K nearest earlier sales for sorted positions [start, stop).
+
+        Returns:
+            (neighbours, distances), each (stop - start, K). Neighbours are sorted
+            positions ordered by distance; missing neighbours are -1 / inf.
+        """
+        limit = int(cutoffs[stop - 1])
+        if limit == 0:
+            return (
+                np.full((stop - start, self.num_comps), -1, dtype=np.int64),
+                np.full((stop - start, self.num_comps), np.inf)
+            )
+
+        # Sales on or after the subject's own sale date are not available to it
+        subject_cutoffs = cutoffs[start:stop]
+        return top_k_neighbours(
+            scaled[start:stop],
+            scaled[:limit],
+            self.num_comps,
+            memory_budget=self.memory_budget,
+            pair_filter=lambda rows, cols: cols[None, :] < subject_cutoffs[rows][:, None]
+        )
+
+    def estimate(
+        self,
+        corpus: SalesCorpus,
+        subject_row: int,
+        comp_rows: Sequence[int],
+        comp_distances: Sequence[float]
+    ) -> Optional[int]:
+        """
+        Price one held-out sale from its neighbours the way PricingPipeline
+        prices a corpus subject, valued on the subject's sale date.
+        """
+        subject_home = corpus.record(subject_row)
+        comp_rows = np.asarray(comp_rows, dtype=np.int64)
+        if len(comp_rows) == 0:
+            return None
+        latitude, longitude = corpus.features[subject_row, 0], corpus.features[subject_row, 1]
+        miles = np.round(haversine_miles(latitude, longitude, corpus.features[comp_rows, 0], corpus.features[comp_rows, 1]), 2)
+        comparables = []
+        for row, distance, distance_miles in zip(comp_rows.tolist(), comp_distances, miles.tolist()):
+            comp = dict(corpus.record(row))
+            comp['knn_distance'] = round(float(distance), 4)
+            comp['distance_miles'] = distance_miles
+            comparables.append(comp)
+
+        price_prior = None
+        if self.price_estimator.needs_price_prior(comparables):
+            price_prior = price_grid(corpus).cell_stats(float(latitude), float(longitude))
+        condition_summary = self.condition_analyzer.analyze(subject_home, [], '')
+        return self.price_estimator.estimate_point_price(
+            subject_home,
+            comparables,
+            condition_summary,
+            price_prior=price_prior,
+            market_index=market_index(corpus),
+            hedonic_model=hedonic_model(corpus),
+            valuation_day=int(corpus.sale_days[subject_row])
+        )
+
+    def run_block(
+        self,
+        corpus: SalesCorpus,
+        prepared: Tuple[np.ndarray, np.ndarray, np.ndarray],
+        start: int,
+        stop: int,
+        min_comps: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Predict sorted positions [start, stop).
+
+        Returns:
+            (corpus rows, predicted prices) for the subjects with at least
+            `min_comps` earlier sales
+        """
+        order, scaled, cutoffs = prepared
+        neighbours, distances = self.nearest_prior(scaled, cutoffs, start, stop)
+
+        rows, predictions = [], []
+        for offset in range(stop - start):
+            found = neighbours[offset] >= 0
+            if found.sum() < min_comps:
+                continue
+            row = int(order[start + offset])
+            if corpus.prices[row] <= 0:
+                continue
+            predicted = self.estimate(corpus, row, order[neighbours[offset][found]], distances[offset][found])
+            if predicted is None:
+                continue
+            rows.append(row)
+            predictions.append(predicted)
+        return np.array(rows, dtype=np.int64), np.array(predictions, dtype=np.float64)
+
+    def run(
+        self,
+        corpus: SalesCorpus,
+        workers: int = 1,
+        min_comps: Optional[int] = None,
+        store_name: Optional[str] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Backtest every sale in the corpus.
+
+        Args:
+            corpus: Sales corpus
+            workers: Processes to spread blocks over (1 = in-process)
+            min_comps: Skip sales with fewer earlier sales than this (default: K)
+            store_name: SharedCorpusStore name the corpus was published under;
+                required when workers > 1
+
+        Returns:
+            (corpus rows, predicted prices) for every sale that could be valued
+        """
+        if min_comps is None:
+            min_comps = self.num_comps
+        blocks = self.blocks(corpus)
+        if not blocks:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        if workers <= 1 or len(blocks) == 1:
+            prepared = self.prepare(corpus)
+            results = [self.run_block(corpus, prepared, start, stop, min_comps) for start, stop in blocks]
+        else:
+            if store_name is None:
+                raise ValueError("store_name is required to run on multiple workers")
+            settings = (
+                store_name, self.num_comps, self.feature_weights, self.price_estimator.idw_power,
+                self.memory_budget, min_comps
+            )
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=settings) as pool:
+                results = pool.map(_run_block, blocks, chunksize=1)
+
+        rows = np.concatenate([block_rows for block_rows, _ in results])
+        predictions = np.concatenate([block_predictions for _, block_predictions in results])
+        return rows, predictions
+
+    def report(
+        self,
+        corpus: SalesCorpus,
+        rows: np.ndarray,
+        predictions: np.ndarray,
+        price_bands: Sequence[float] = DEFAULT_PRICE_BANDS
+    ) -> Dict[str, Any]:
+        """Error metrics overall, by zip code and by sale price band."""
+        actual = corpus.prices[rows]
+        zips = np.array([_zip_code(corpus.record(int(row)).get('address', '')) for row in rows])
+        bands = np.array([_price_band(price, price_bands) for price in actual])
+
+        def grouped(labels: np.ndarray) -> Dict[str, Any]:
+            return {
+                str(label): error_metrics(predictions[labels == label], actual[labels == label])
+                for label in sorted(set(labels.tolist()))
+            }
+
+        return {
+            'corpus_version': corpus.version,
+            'num_comps': self.num_comps,
+            'feature_weights': self.feature_weights,
+            'sales': len(corpus),
+            'valued': int(len(rows)),
+            'skipped': int(len(corpus) - len(rows)),
+            'overall': error_metrics(predictions, actual),
+            'by_zip': grouped(zips),
+            'by_price_band': grouped(bands),
+        }
+
+
+# Per-process state for Backtester.run with workers > 1
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(
+    store_name: str,
+    num_comps: int,
+    feature_weights: Dict[str, float],
+    idw_power: float,
+    memory_budget: int,
+    min_comps: int
+) -> None:
+    from utils.shared_corpus import SharedCorpusStore
+
+    corpus = SharedCorpusStore(store_name).current()
+    backtester = Backtester(
+        num_comps=num_comps,
+        feature_weights=feature_weights,
+        price_estimator=PriceEstimator(idw_power=idw_power),
+        memory_budget=memory_budget
+    )
+    _worker_state.update(
+        corpus=corpus,
+        backtester=backtester,
+        prepared=backtester.prepare(corpus),
+        min_comps=min_comps
+    )
+
+
+def _run_block(block: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    start, stop = block
+    return _worker_state['backtester'].run_block(
+        _worker_state['corpus'], _worker_state['prepared'], start, stop, _worker_state['min_comps']
+    )
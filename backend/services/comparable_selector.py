@@ -1,7 +1,14 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import math
+import threading
+from collections import OrderedDict
 import numpy as np
 
+from utils.ann_index import IVFIndex, default_nlist
+from utils.corpus import SalesCorpus, FEATURE_NAMES, parse_sale_day, today_epoch_day
+from utils.distance import scaled_features, top_k_neighbours
+from utils.geo import haversine_miles, score_breakdowns
+
 
 class ComparableSelector:
     """
@@ -31,6 +38,23 @@ class ComparableSelector:
         'has_pool': 0.10
     }
     
+    # ANN indexes kept at once, one per market shard (least recently used evicted)
+    ANN_INDEX_CACHE_SIZE = 8
+    
+    def __init__(self, feature_weights: Dict[str, float] = None, ann_nlist: Optional[int] = None):
+        """
+        Args:
+            feature_weights: Overrides for FEATURE_WEIGHTS, e.g. tuned weights
+                loaded from the weights file (see tune_weights.py)
+            ann_nlist: IVF list count for approximate search (default: about
+                4 * sqrt(corpus size))
+        """
+        if feature_weights:
+            self.FEATURE_WEIGHTS = {**ComparableSelector.FEATURE_WEIGHTS, **feature_weights}
+        self.ann_nlist = ann_nlist
+        self._ann_indexes: 'OrderedDict[str, IVFIndex]' = OrderedDict()
+        self._ann_lock = threading.Lock()
+    
     def select_top_comparables(
         self,
         subject_home: Dict[str, Any],
@@ -80,34 +104,213 @@ class ComparableSelector:
         k_nearest = distances[:num_comps]
         
         # Build result with KNN distances and similarity scores
-        result = []
-        for idx, distance in k_nearest:
-            comp = comparable_sales[idx].copy()
-            
-            # Convert distance to similarity score (0-100)
-            # Lower distance = higher similarity
-            similarity_score = self._distance_to_similarity(distance)
+        return self._build_comparable_results(
+            [comparable_sales[idx] for idx, _ in k_nearest],
+            subject_features,
+            np.array([[comparable_features[idx][name] for name in FEATURE_NAMES] for idx, _ in k_nearest]),
+            [distance for _, distance in k_nearest]
+        )
+    
+    def select_from_corpus(
+        self,
+        subject_home: Dict[str, Any],
+        corpus: SalesCorpus,
+        num_comps: int = 5,
+        nprobe: Optional[int] = None,
+        candidate_rows: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Select the K most similar properties from a prepared SalesCorpus.
+        
+        Same KNN as select_top_comparables, but the distances to every comp are
+        computed in one vectorized pass over the corpus feature matrix, and only
+        the K selected rows are turned back into dicts.
+        
+        Args:
+            subject_home: The property to find comparables for
+            corpus: Prepared corpus (see utils.corpus.build_corpus)
+            num_comps: K value - number of nearest neighbors to return (default: 5)
+            nprobe: Approximate search - only scan the sales in the nprobe
+                nearest IVF lists (see utils.ann_index). None (default) is exact.
+            candidate_rows: Ascending corpus rows to choose from, e.g. from the
+                attribute pre-filter (utils.comp_filters); scored exactly
             
-            # Calculate real geographic distance in miles using Haversine formula
-            real_distance_miles = self._calculate_haversine_distance(
-                subject_features['latitude'],
-                subject_features['longitude'],
-                comparable_features[idx]['latitude'],
-                comparable_features[idx]['longitude']
+        Returns:
+            List of K most similar properties with KNN distances and similarity scores
+        """
+        if len(corpus) == 0 or (candidate_rows is not None and len(candidate_rows) == 0):
+            return []
+        
+        subject_features = self._extract_features(subject_home)
+        subject_vector = np.array([subject_features[name] for name in FEATURE_NAMES])
+        
+        # Z-score parameters and standardized matrix are cached per corpus version
+        today = today_epoch_day()
+        normalized = corpus.normalized()
+        subject_normalized = normalized.standardize(subject_vector, today)
+        
+        weights = np.array([self.FEATURE_WEIGHTS.get(name, 0.0) for name in FEATURE_NAMES])
+        
+        if candidate_rows is not None:
+            diffs = normalized.matrix[candidate_rows] - subject_normalized
+            distances = np.sqrt((diffs * diffs) @ weights)
+            local = self._k_smallest(distances, num_comps)
+            nearest, nearest_distances = candidate_rows[local], distances[local]
+        elif nprobe is not None:
+            nearest, nearest_distances = self.ann_index(corpus).search(
+                subject_normalized * np.sqrt(weights), num_comps, nprobe
             )
+        else:
+            diffs = normalized.matrix - subject_normalized
+            distances = np.sqrt((diffs * diffs) @ weights)
+            nearest = self._k_smallest(distances, num_comps)
+            nearest_distances = distances[nearest]
+        
+        return self._build_comparable_results(
+            [corpus.record(int(idx)) for idx in nearest],
+            subject_features,
+            np.column_stack([corpus.features[nearest], (today - corpus.sale_days[nearest]).astype(np.float64)]),
+            np.asarray(nearest_distances, dtype=np.float64).tolist()
+        )
+    
+    def select_many_from_corpus(
+        self,
+        subjects: List[Dict[str, Any]],
+        corpus: SalesCorpus,
+        num_comps: int = 5,
+        valuation_days: Optional[List[int]] = None,
+        candidate_rows: Optional[np.ndarray] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Exact select_from_corpus for many subjects at once.
+        
+        All subject vectors are standardized into one query matrix and their
+        neighbours come from a single tiled distance pass over the corpus
+        (utils.distance.top_k_neighbours), instead of one scan per subject.
+        
+        Args:
+            subjects: Properties to find comparables for
+            valuation_days: Epoch day each subject is valued on (default
+                today); sale recency is measured from it
+            candidate_rows: Ascending corpus rows to choose from
             
-            comp['similarity_score'] = similarity_score
-            comp['knn_distance'] = round(distance, 4)
-            comp['distance_miles'] = round(real_distance_miles, 2)  # Add real distance
-            comp['score_breakdown'] = self._get_score_breakdown(
-                subject_home, 
-                comp,
-                subject_features,
-                comparable_features[idx]
+        Returns:
+            One comparables list per subject, as select_from_corpus returns
+        """
+        if not subjects:
+            return []
+        if len(corpus) == 0 or (candidate_rows is not None and len(candidate_rows) == 0):
+            return [[] for _ in subjects]
+        
+        today = today_epoch_day()
+        if valuation_days is None:
+            valuation_days = [today] * len(subjects)
+        subject_features = [self._extract_features(subject) for subject in subjects]
+        normalized = corpus.normalized()
+        queries = np.vstack([
+            normalized.standardize(np.array([features[name] for name in FEATURE_NAMES]), day)
+            for features, day in zip(subject_features, valuation_days)
+        ])
+        
+        scale = np.sqrt(np.array([self.FEATURE_WEIGHTS.get(name, 0.0) for name in FEATURE_NAMES]))
+        points = normalized.matrix if candidate_rows is None else normalized.matrix[candidate_rows]
+        neighbours, distances = top_k_neighbours(queries * scale, points * scale, num_comps)
+        
+        results = []
+        for features, day, found, found_distances in zip(subject_features, valuation_days, neighbours, distances):
+            nearest = found[found >= 0]
+            if candidate_rows is not None:
+                nearest = candidate_rows[nearest]
+            results.append(self._build_comparable_results(
+                [corpus.record(int(idx)) for idx in nearest],
+                features,
+                np.column_stack([corpus.features[nearest], (day - corpus.sale_days[nearest]).astype(np.float64)]),
+                found_distances[:len(nearest)].tolist()
+            ))
+        return results
+    
+    def ann_index(self, corpus: SalesCorpus) -> IVFIndex:
+        """
+        IVF index over the corpus' weight-scaled features, built on first use
+        and rebuilt when the corpus version changes.
+        
+        One index is cached per market shard. A new version of a shard reuses
+        its previous centroids (only the list assignment is redone) unless the
+        corpus size has moved far enough that the list count should change.
+        """
+        with self._ann_lock:
+            index = self._ann_indexes.get(corpus.market)
+            if index is not None and index.version == corpus.version:
+                self._ann_indexes.move_to_end(corpus.market)
+                return index
+            
+            nlist = self.ann_nlist or default_nlist(len(corpus))
+            centroids = None
+            if index is not None and nlist / 2 <= index.nlist <= nlist * 2:
+                centroids = index.centroids
+            
+            index = IVFIndex.build(
+                scaled_features(corpus, self.FEATURE_WEIGHTS),
+                version=corpus.version,
+                nlist=nlist,
+                centroids=centroids
             )
-            result.append(comp)
+            self._ann_indexes[corpus.market] = index
+            self._ann_indexes.move_to_end(corpus.market)
+            while len(self._ann_indexes) > self.ANN_INDEX_CACHE_SIZE:
+                self._ann_indexes.popitem(last=False)
+            return index
+    
+    @staticmethod
+    def _k_smallest(distances: np.ndarray, k: int) -> np.ndarray:
+        """
+        Indices of the k smallest distances, ordered by (distance, index).
+        
+        Matches the stable sort used by select_top_comparables, including ties
+        at the K-th position, without sorting the whole array.
+        """
+        k = min(k, len(distances))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        
+        threshold = np.partition(distances, k - 1)[k - 1]
+        candidates = np.flatnonzero(distances <= threshold)
+        order = np.lexsort((candidates, distances[candidates]))
+        return candidates[order][:k]
+    
+    def _build_comparable_results(
+        self,
+        comparables: List[Dict[str, Any]],
+        subject_features: Dict[str, float],
+        comp_matrix: np.ndarray,
+        distances: List[float]
+    ) -> List[Dict[str, Any]]:
+        """
+        Copy comparables and annotate them with KNN distance, similarity and breakdown.
+        
+        Geographic distances and breakdown fields for all comps are computed in
+        one array pass (utils.geo.score_breakdowns).
+        
+        Args:
+            comp_matrix: (k, len(FEATURE_NAMES)) raw comp features
+            distances: KNN distance per comp
+        """
+        if not comparables:
+            return []
+        
+        subject_vector = np.array([subject_features[name] for name in FEATURE_NAMES])
+        breakdowns = score_breakdowns(subject_vector, comp_matrix)
         
-        return result
+        results = []
+        for comparable, distance, breakdown in zip(comparables, distances, breakdowns):
+            comp = comparable.copy()
+            # Lower distance = higher similarity (0-100)
+            comp['similarity_score'] = self._distance_to_similarity(distance)
+            comp['knn_distance'] = round(distance, 4)
+            comp['distance_miles'] = breakdown['distance_miles']  # Real distance (Haversine)
+            comp['score_breakdown'] = breakdown
+            results.append(comp)
+        return results
     
     def _extract_features(self, property_data: Dict[str, Any]) -> Dict[str, float]:
         """
@@ -134,19 +337,12 @@ class ComparableSelector:
         # Calculate days since sale (0 for subject property)
         days_since_sale = property_data.get('days_since_sale', 0)
         if days_since_sale == 0 and 'sale_date' in property_data:
-            # Parse sale_date if available
-            try:
-                from dateutil import parser
-                from datetime import datetime, timezone
-                sale_date = parser.parse(property_data['sale_date'])
-                sale_date = sale_date.replace(tzinfo=timezone.utc)
-                days_since_sale = (datetime.now(timezone.utc) - sale_date).days
-            except Exception as e:
-                print(e)
-                days_since_sale = 90  # Default to 90 days
+            # Whole UTC calendar days between the sale and today, counted the
+            # same way as the corpus path (unparseable dates default to 90 days)
+            today = today_epoch_day()
+            days_since_sale = today - parse_sale_day(property_data, today)
         
         features['days_since_sale'] = float(days_since_sale)
-        print(features)
         
         return features
     
@@ -259,19 +455,9 @@ class ComparableSelector:
         Calculate geographic distance in miles using Haversine formula.
         
         This is used for human-readable distance reporting, not for KNN distance.
+        Scalar wrapper around utils.geo.haversine_miles.
         """
-        R = 3959  # Earth's radius in miles
-        
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lon = math.radians(lon2 - lon1)
-        
-        a = (math.sin(delta_lat / 2) ** 2 +
-             math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon / 2) ** 2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        
-        return R * c
+        return float(haversine_miles(lat1, lon1, lat2, lon2))
     
     def _get_score_breakdown(
         self, 
@@ -284,6 +470,7 @@ class ComparableSelector:
         Get detailed breakdown of KNN feature contributions.
         
         Shows how each feature contributed to the overall distance/similarity.
+        Single-pair form of utils.geo.score_breakdowns.
         """
         # Extract features if not provided
         if subject_features is None:
@@ -291,25 +478,7 @@ class ComparableSelector:
         if comp_features is None:
             comp_features = self._extract_features(comp)
         
-        # Calculate geographic distance in miles
-        distance_miles = self._calculate_haversine_distance(
-            subject_features['latitude'],
-            subject_features['longitude'],
-            comp_features['latitude'],
-            comp_features['longitude']
-        )
-        
-        # Calculate feature differences (unnormalized for readability)
-        breakdown = {
-            'distance_miles': round(distance_miles, 2),
-            'sqft_diff': abs(subject_features['sqft'] - comp_features['sqft']),
-            'sqft_pct_diff': round(abs(subject_features['sqft'] - comp_features['sqft']) / subject_features['sqft'] * 100, 1) if subject_features['sqft'] > 0 else 0,
-            'bedrooms_diff': abs(subject_features['bedrooms'] - comp_features['bedrooms']),
-            'bathrooms_diff': abs(subject_features['bathrooms'] - comp_features['bathrooms']),
-            'age_diff_years': abs(subject_features['year_built'] - comp_features['year_built']),
-            'days_since_sale': comp_features['days_since_sale'],
-            'has_pool_match': 1 if subject_features['has_pool'] == comp_features['has_pool'] else 0,
-            'knn_method': 'Weighted Euclidean Distance'
-        }
-        
-        return breakdown
+        return score_breakdowns(
+            np.array([subject_features[name] for name in FEATURE_NAMES]),
+            np.array([[comp_features[name] for name in FEATURE_NAMES]])
+        )[0]
@@ -0,0 +1,194 @@
+from typing import Any, Dict, Optional, Sequence
+import math
+import threading
+import time
+import numpy as np
+
+from services.backtester import Backtester, DEFAULT_PRICE_BANDS, _price_band
+from utils.corpus import SalesCorpus
+
+# Bands with fewer calibration residuals than this use the whole market's residuals
+MIN_BAND_RESIDUALS = 30
+
+
+def parse_coverage(value: Any) -> Optional[float]:
+    """
+    Requested interval coverage as a fraction; None when not requested.
+
+    Raises:
+        ValueError: Not a number strictly between 0 and 1
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value < 1:
+        raise ValueError('coverage must be a number between 0 and 1 (e.g. 0.9)')
+    return float(value)
+
+
+class ConformalCalibration:
+    """
+    Sorted relative leave-one-out residuals |actual - predicted| / predicted
+    of one corpus version, overall and per predicted-price band.
+
+    A split-conformal interval for coverage c is predicted * (1 +/- r_k) with
+    r_k the ceil((n + 1) * c)-th smallest residual, so turning a coverage into
+    an interval is one index into an already sorted array.
+
+    Attributes:
+        version: Corpus version the residuals were computed on
+        market: Market of that corpus
+        price_bands: Upper edges of the price bands
+        residuals: All residuals, sorted
+        band_residuals: Sorted residuals per band (len(price_bands) + 1 arrays)
+    """
+
+    def __init__(
+        self,
+        version: str,
+        market: Optional[str],
+        price_bands: Sequence[float],
+        residuals: np.ndarray,
+        band_residuals: Sequence[np.ndarray]
+    ):
+        self.version = version
+        self.market = market
+        self.price_bands = np.asarray(price_bands, dtype=np.float64)
+        self.residuals = residuals
+        self.band_residuals = list(band_residuals)
+
+    @classmethod
+    def from_backtest(
+        cls,
+        corpus: SalesCorpus,
+        rows: np.ndarray,
+        predictions: np.ndarray,
+        price_bands: Sequence[float] = DEFAULT_PRICE_BANDS
+    ) -> 'ConformalCalibration':
+        """Calibration from Backtester.run output on `corpus`."""
+        valid = predictions > 0
+        predictions = predictions[valid]
+        residuals = np.abs(corpus.prices[rows[valid]] - predictions) / predictions
+        bands = np.searchsorted(np.asarray(price_bands, dtype=np.float64), predictions, side='right')
+        return cls(
+            corpus.version,
+            corpus.market,
+            price_bands,
+            np.sort(residuals),
+            [np.sort(residuals[bands == band]) for band in range(len(price_bands) + 1)]
+        )
+
+    def interval(self, predicted_price: float, coverage: float) -> Optional[Dict[str, Any]]:
+        """
+        Conformal interval around a predicted price, or None when there are
+        too few residuals for the requested coverage.
+        """
+        band = int(np.searchsorted(self.price_bands, predicted_price, side='right'))
+        residuals = self.band_residuals[band]
+        if len(residuals) < MIN_BAND_RESIDUALS:
+            residuals = self.residuals
+        rank = math.ceil((len(residuals) + 1) * coverage)
+        if rank > len(residuals):
+            return None
+        width = float(residuals[rank - 1])
+        return {
+            'price_range': {
+                'low': int(max(0.0, predicted_price * (1 - width))),
+                'high': int(predicted_price * (1 + width))
+            },
+            'method': 'conformal',
+            'coverage': coverage,
+            'price_band': _price_band(predicted_price, self.price_bands.tolist()),
+            'residuals': int(len(residuals)),
+            'calibration_version': self.version
+        }
+
+
+class ConformalCalibrator:
+    """
+    Keeps the latest ConformalCalibration per market, computed off the request
+    path.
+
+    schedule() queues a corpus snapshot for a leave-one-out Backtester pass on
+    a background thread (a market's queued snapshot is replaced by the one
+    scheduled after it). calibration() never computes: it returns the
+    market's latest calibration, which may be for an earlier version while
+    the new one is being computed, and queues the snapshot if it is not
+    calibrated yet.
+    """
+
+    def __init__(
+        self,
+        backtester: Optional[Backtester] = None,
+        price_bands: Sequence[float] = DEFAULT_PRICE_BANDS
+    ):
+        self.backtester = backtester or Backtester()
+        self.price_bands = tuple(price_bands)
+        self._calibrations: Dict[str, ConformalCalibration] = {}
+        self._pending: Dict[str, SalesCorpus] = {}
+        self._running: Dict[str, str] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def calibrate(self, corpus: SalesCorpus) -> ConformalCalibration:
+        """Run the leave-one-out pass for a snapshot and store the result (blocking)."""
+        started = time.time()
+        rows, predictions = self.backtester.run(corpus)
+        calibration = ConformalCalibration.from_backtest(corpus, rows, predictions, self.price_bands)
+        with self._condition:
+            self._calibrations[corpus.market or ''] = calibration
+        print(f"Calibrated price intervals: {len(calibration.residuals)} residuals, "
+              f"version {corpus.version} ({time.time() - started:.2f}s)")
+        return calibration
+
+    def schedule(self, corpus: SalesCorpus) -> None:
+        """Queue a snapshot for background calibration unless it is already calibrated or queued."""
+        market = corpus.market or ''
+        with self._condition:
+            current = self._calibrations.get(market)
+            pending = self._pending.get(market)
+            if corpus.version in (
+                current.version if current is not None else None,
+                pending.version if pending is not None else None,
+                self._running.get(market)
+            ):
+                return
+            self._pending[market] = corpus
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='conformal-calibrator', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def calibration(self, corpus: SalesCorpus) -> Optional[ConformalCalibration]:
+        """Latest calibration for the snapshot's market (None before the first one completes)."""
+        with self._condition:
+            current = self._calibrations.get(corpus.market or '')
+        if current is None or current.version != corpus.version:
+            self.schedule(corpus)
+        return current
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until no calibration is queued or running; False on timeout."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                market, corpus = self._pending.popitem()
+                self._running[market] = corpus.version
+            try:
+                self.calibrate(corpus)
+            except Exception as e:
+                print(f"Error calibrating price intervals: {e}")
+            finally:
+                with self._condition:
+                    self._running.pop(market, None)
+                    self._condition.notify_all()
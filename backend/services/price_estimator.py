@@ -1,7 +1,48 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import os
 import statistics
+import time
 import numpy as np
 
+from utils.corpus import today_epoch_day
+
+# Comparables within this many miles count as close to the subject
+CLOSE_COMP_MILES = 1.0
+
+# With fewer close comparables than this, the base price is blended with the
+# neighbourhood $/sqft prior (weight grows to PRIOR_MAX_WEIGHT with no close comps)
+MIN_CLOSE_COMPS = 3
+PRIOR_MAX_WEIGHT = 0.5
+
+# Fewest sales a neighbourhood cell needs before its median is used as a prior
+PRIOR_MIN_SALES = 5
+
+# Price range methods: spread of raw comp prices, or a bootstrap of the
+# weighted, adjusted comp prices
+INTERVAL_METHODS = ('cv', 'bootstrap')
+DEFAULT_INTERVAL_METHOD = 'cv'
+
+# Bootstrap resamples, RNG seed (same comps give the same range) and coverage
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_SEED = 0
+BOOTSTRAP_LEVEL = 0.90
+
+
+def interval_method_from_env() -> str:
+    """Default price range method (PRICE_INTERVAL_METHOD, 'cv' or 'bootstrap')."""
+    method = os.environ.get('PRICE_INTERVAL_METHOD', DEFAULT_INTERVAL_METHOD).strip().lower()
+    return method if method in INTERVAL_METHODS else DEFAULT_INTERVAL_METHOD
+
+
+def has_pool(property_data: Dict[str, Any]) -> bool:
+    """Pool flag of a normalized property (`has_pool`; legacy `pool` accepted)."""
+    return bool(property_data.get('has_pool') or property_data.get('has_private_pool') or property_data.get('pool'))
+
+
+def has_garage(property_data: Dict[str, Any]) -> bool:
+    """Garage flag of a normalized property (`garage_spaces` > 0; legacy `garage` accepted)."""
+    return bool((property_data.get('garage_spaces') or 0) > 0 or property_data.get('garage'))
+
 
 class PriceEstimator:
     """
@@ -13,18 +54,49 @@ class PriceEstimator:
     
     Applies additional adjustments for:
     - Property condition
-    - Key features (pool, garage, age)
+    - Key features (pool, garage, age; plus lot size with a hedonic model),
+      from the market's fitted hedonic regression when one is given
     """
     
+    def __init__(self, idw_power: float = 1.0, interval_method: str = DEFAULT_INTERVAL_METHOD):
+        """
+        Args:
+            idw_power: Exponent of the inverse-distance weights,
+                weight = 1 / (1 + knn_distance) ** idw_power
+            interval_method: Default price range method (one of INTERVAL_METHODS)
+        """
+        self.idw_power = idw_power
+        self.interval_method = interval_method
+    
     def estimate_price(
         self,
         subject_home: Dict[str, Any],
         comparables: List[Dict[str, Any]],
-        condition_summary: Dict[str, Any]
+        condition_summary: Dict[str, Any],
+        price_prior: Optional[Dict[str, Any]] = None,
+        market_index=None,
+        hedonic_model=None,
+        interval_method: Optional[str] = None,
+        coverage: Optional[float] = None,
+        calibration=None
     ) -> Dict[str, Any]:
         """
         Generate price recommendation with confidence intervals
         
+        Args:
+            price_prior: Neighbourhood $/sqft statistics of the subject's grid
+                cell (utils.price_grid), blended into the base price when few
+                comparables are close to the subject
+            market_index: Market price index (utils.market_index) used to
+                time-adjust comp prices to today
+            hedonic_model: Fitted hedonic regression (utils.hedonic) for the
+                feature adjustments; fixed adjustments without one
+            interval_method: Price range method for this call (default the
+                estimator's); 'bootstrap' also reports `interval`
+            coverage: Requested coverage (e.g. 0.9) of a conformal price range
+                from `calibration` (services.conformal); the range falls back
+                to `interval_method` while no calibration is available
+        
         Returns:
         {
             'recommended_price': int,
@@ -38,22 +110,30 @@ class PriceEstimator:
         
         if not comparables:
             raise ValueError("No comparables provided for price estimation")
+        interval_method = interval_method or self.interval_method
+        if interval_method not in INTERVAL_METHODS:
+            raise ValueError(f"interval_method must be one of {', '.join(INTERVAL_METHODS)}")
         
-        # Calculate base price from comparables
-        base_price = self._calculate_base_price(subject_home, comparables)
-        
-        # Apply condition adjustments
-        condition_adjustment = self._calculate_condition_adjustment(condition_summary)
-        
-        # Apply feature adjustments
-        feature_adjustments = self._calculate_feature_adjustments(subject_home, comparables)
+        time_factors = market_index.comparable_factors(comparables) if market_index is not None else None
+        base_price, condition_adjustment, feature_adjustments = self._calculate_price_components(
+            subject_home, comparables, condition_summary, time_factors, hedonic_model
+        )
+        base_price, prior_weight = self._apply_price_prior(subject_home, comparables, base_price, price_prior)
         
         # Calculate final price
         total_adjustment = condition_adjustment + sum(feature_adjustments.values())
         recommended_price = int(base_price * (1 + total_adjustment))
         
         # Calculate price range (confidence interval)
-        price_range = self._calculate_price_range(recommended_price, comparables)
+        interval = None
+        if coverage is not None and calibration is not None:
+            interval = calibration.interval(recommended_price, coverage)
+        if interval is None and interval_method == 'bootstrap':
+            interval = self._bootstrap_price_range(subject_home, recommended_price, comparables, time_factors)
+        if interval is not None:
+            price_range = interval.pop('price_range')
+        else:
+            price_range = self._calculate_price_range(recommended_price, comparables)
         
         # Determine confidence level
         confidence = self._determine_confidence(comparables, condition_summary)
@@ -62,7 +142,7 @@ class PriceEstimator:
         sqft = subject_home.get('sqft', subject_home.get('square_footage', 1))
         price_per_sqft = recommended_price / sqft if sqft > 0 else 0
         
-        return {
+        result = {
             'recommended_price': recommended_price,
             'price_range': price_range,
             'confidence': confidence,
@@ -75,8 +155,168 @@ class PriceEstimator:
             },
             'methodology': self._get_methodology_description(comparables)
         }
+        if prior_weight:
+            result['neighbourhood_prior'] = {
+                'median_price_per_sqft': price_prior['median_price_per_sqft'],
+                'sales': price_prior['count'],
+                'weight': round(prior_weight, 3)
+            }
+        if interval is not None:
+            result['interval'] = interval
+        if coverage is not None and (interval is None or interval['method'] != 'conformal'):
+            result['interval'] = {
+                **(interval or {'method': interval_method}),
+                'requested_coverage': coverage,
+                'note': 'Conformal calibration is not available for this corpus yet'
+            }
+        if hedonic_model is not None:
+            result['hedonic_model'] = hedonic_model.summary()
+        if time_factors is not None:
+            result['market_time_adjustment'] = {
+                'comp_adjustments_pct': [round((factor - 1) * 100, 2) for factor in time_factors.tolist()]
+            }
+        return result
+    
+    def estimate_point_price(
+        self,
+        subject_home: Dict[str, Any],
+        comparables: List[Dict[str, Any]],
+        condition_summary: Dict[str, Any],
+        price_prior: Optional[Dict[str, Any]] = None,
+        market_index=None,
+        hedonic_model=None,
+        valuation_day: Optional[int] = None
+    ) -> int:
+        """
+        Recommended price only, without the range, confidence and methodology.
+        
+        Same weighting and adjustments as estimate_price; used where many
+        prices are needed, e.g. backtesting and what-if scenarios.
+        `valuation_day` (epoch day, default today) is the date the market
+        index moves comp prices to.
+        """
+        if not comparables:
+            raise ValueError("No comparables provided for price estimation")
+        
+        time_factors = (
+            market_index.comparable_factors(comparables, valuation_day) if market_index is not None else None
+        )
+        base_price, condition_adjustment, feature_adjustments = self._calculate_price_components(
+            subject_home, comparables, condition_summary, time_factors, hedonic_model
+        )
+        base_price, _ = self._apply_price_prior(subject_home, comparables, base_price, price_prior)
+        return int(base_price * (1 + condition_adjustment + sum(feature_adjustments.values())))
+    
+    def estimate_point_prices(
+        self,
+        subjects: List[Dict[str, Any]],
+        comparables_lists: List[List[Dict[str, Any]]],
+        condition_summary: Dict[str, Any],
+        price_priors: Optional[List[Optional[Dict[str, Any]]]] = None,
+        market_index=None,
+        hedonic_model=None,
+        valuation_days: Optional[List[int]] = None
+    ) -> List[int]:
+        """
+        estimate_point_price for many (subject, comparables) pairs sharing one
+        condition summary.
+        
+        The market index factors of every comp and the hedonic adjustments of
+        every subject are computed in one array pass each; only the K-comp
+        weighted averages remain per subject.
+        """
+        if any(not comparables for comparables in comparables_lists):
+            raise ValueError("No comparables provided for price estimation")
+        price_priors = price_priors or [None] * len(subjects)
+        
+        time_factors = [None] * len(subjects)
+        if market_index is not None:
+            counts = [len(comparables) for comparables in comparables_lists]
+            days = np.repeat(
+                np.asarray(valuation_days if valuation_days is not None else [today_epoch_day()] * len(subjects)),
+                counts
+            )
+            flat = [comp for comparables in comparables_lists for comp in comparables]
+            time_factors = np.split(market_index.comparable_factors(flat, days), np.cumsum(counts)[:-1])
+        
+        if hedonic_model is not None:
+            feature_adjustments = hedonic_model.adjustments_many(subjects, comparables_lists)
+        else:
+            feature_adjustments = [
+                self._calculate_feature_adjustments(subject, comparables)
+                for subject, comparables in zip(subjects, comparables_lists)
+            ]
+        condition_adjustment = self._calculate_condition_adjustment(condition_summary)
+        
+        prices = []
+        for subject, comparables, factors, adjustments, prior in zip(
+            subjects, comparables_lists, time_factors, feature_adjustments, price_priors
+        ):
+            base_price = self._calculate_base_price(subject, comparables, factors)
+            base_price, _ = self._apply_price_prior(subject, comparables, base_price, prior)
+            prices.append(int(base_price * (1 + condition_adjustment + sum(adjustments.values()))))
+        return prices
+    
+    def _calculate_price_components(
+        self,
+        subject_home: Dict[str, Any],
+        comparables: List[Dict[str, Any]],
+        condition_summary: Dict[str, Any],
+        time_factors: Optional[np.ndarray] = None,
+        hedonic_model=None
+    ):
+        """Base price, condition adjustment and feature adjustments for a subject."""
+        # Calculate base price from comparables
+        base_price = self._calculate_base_price(subject_home, comparables, time_factors)
+        
+        # Apply condition adjustments
+        condition_adjustment = self._calculate_condition_adjustment(condition_summary)
+        
+        # Apply feature adjustments
+        if hedonic_model is not None:
+            feature_adjustments = hedonic_model.adjustments(subject_home, comparables)
+        else:
+            feature_adjustments = self._calculate_feature_adjustments(subject_home, comparables)
+        
+        return base_price, condition_adjustment, feature_adjustments
+    
+    def needs_price_prior(self, comparables: List[Dict[str, Any]]) -> bool:
+        """True when too few comparables are within CLOSE_COMP_MILES for the base price alone."""
+        close = sum(1 for c in comparables if c.get('distance_miles', 0) <= CLOSE_COMP_MILES)
+        return close < MIN_CLOSE_COMPS
+    
+    def _apply_price_prior(
+        self,
+        subject_home: Dict[str, Any],
+        comparables: List[Dict[str, Any]],
+        base_price: float,
+        price_prior: Optional[Dict[str, Any]]
+    ):
+        """
+        Blend the base price with the neighbourhood median $/sqft when few comps are close.
+        
+        Weight is PRIOR_MAX_WEIGHT * (missing close comps / MIN_CLOSE_COMPS).
+        
+        Returns:
+            (base price, prior weight; 0 when the prior is not used)
+        """
+        if not price_prior or price_prior.get('count', 0) < PRIOR_MIN_SALES:
+            return base_price, 0.0
+        subject_sqft = subject_home.get('sqft', subject_home.get('square_footage', 0))
+        if not subject_sqft or not self.needs_price_prior(comparables):
+            return base_price, 0.0
+        
+        close = sum(1 for c in comparables if c.get('distance_miles', 0) <= CLOSE_COMP_MILES)
+        weight = PRIOR_MAX_WEIGHT * (MIN_CLOSE_COMPS - close) / MIN_CLOSE_COMPS
+        prior_price = price_prior['median_price_per_sqft'] * subject_sqft
+        return (1 - weight) * base_price + weight * prior_price, weight
     
-    def _calculate_base_price(self, subject_home: Dict[str, Any], comparables: List[Dict[str, Any]]) -> float:
+    def _calculate_base_price(
+        self,
+        subject_home: Dict[str, Any],
+        comparables: List[Dict[str, Any]],
+        time_factors: Optional[np.ndarray] = None
+    ) -> float:
         """
         Calculate base price using KNN-weighted regression.
         
@@ -88,11 +328,48 @@ class PriceEstimator:
         
         Formula: 
             predicted_price = Σ(weight_i * adjusted_price_i) / Σ(weight_i)
-            where weight_i = 1 / (1 + knn_distance_i)
+            where weight_i = 1 / (1 + knn_distance_i) ** idw_power
+        
+        `time_factors` (one per comp, from the market index) move each sale
+        price to the valuation date first.
         """
         if not comparables:
             return 0
         
+        if time_factors is None:
+            time_factors = np.ones(len(comparables))
+        
+        prices, knn_weights = self._weighted_comp_prices(subject_home, comparables, time_factors)
+        
+        if not prices:
+            # Fallback: use unadjusted prices
+            prices = [c.get('sale_price', 0) * f for c, f in zip(comparables, time_factors.tolist()) if c.get('sale_price', 0) > 0]
+            if not prices:
+                return 0
+            return statistics.mean(prices)
+        
+        # KNN Regression: Weighted average
+        total_weight = sum(knn_weights)
+        if total_weight == 0:
+            return statistics.mean(prices)
+        
+        knn_predicted_price = sum(p * w for p, w in zip(prices, knn_weights)) / total_weight
+        
+        return knn_predicted_price
+    
+    def _weighted_comp_prices(
+        self,
+        subject_home: Dict[str, Any],
+        comparables: List[Dict[str, Any]],
+        time_factors: np.ndarray
+    ):
+        """
+        Sqft-adjusted comp prices and their inverse-distance weights, for the
+        comps with a price and square footage.
+        
+        Returns:
+            (prices, weights) lists
+        """
         subject_sqft = subject_home.get('sqft', subject_home.get('square_footage', 1))
         if subject_sqft == 0:
             subject_sqft = 1
@@ -100,9 +377,9 @@ class PriceEstimator:
         prices = []
         knn_weights = []
         
-        for comp in comparables:
+        for comp, time_factor in zip(comparables, time_factors.tolist()):
             comp_sqft = comp.get('sqft', comp.get('square_footage', 1))
-            comp_price = comp.get('sale_price', 0)
+            comp_price = comp.get('sale_price', 0) * time_factor
             knn_distance = comp.get('knn_distance', 1.0)
             
             if comp_sqft > 0 and comp_price > 0:
@@ -114,24 +391,10 @@ class PriceEstimator:
                 # KNN Weight: Inverse distance weighting
                 # Closer neighbors (lower distance) get higher weight
                 # Add 1 to distance to avoid division by zero
-                weight = 1.0 / (1.0 + knn_distance)
+                weight = 1.0 / (1.0 + knn_distance) ** self.idw_power
                 knn_weights.append(weight)
         
-        if not prices:
-            # Fallback: use unadjusted prices
-            prices = [c.get('sale_price', 0) for c in comparables if c.get('sale_price', 0) > 0]
-            if not prices:
-                return 0
-            return statistics.mean(prices)
-        
-        # KNN Regression: Weighted average
-        total_weight = sum(knn_weights)
-        if total_weight == 0:
-            return statistics.mean(prices)
-        
-        knn_predicted_price = sum(p * w for p, w in zip(prices, knn_weights)) / total_weight
-        
-        return knn_predicted_price
+        return prices, knn_weights
     
     def _calculate_condition_adjustment(self, condition_summary: Dict[str, Any]) -> float:
         """
@@ -163,14 +426,15 @@ class PriceEstimator:
         comparables: List[Dict[str, Any]]
     ) -> Dict[str, float]:
         """
-        Calculate adjustments for specific features
+        Calculate fixed adjustments for specific features (used when no
+        hedonic model is available for the market)
         Returns dict of feature: adjustment pairs
         """
         adjustments = {}
         
         # Pool adjustment
-        subject_has_pool = subject_home.get('pool', False)
-        comp_pool_avg = sum(1 for c in comparables if c.get('pool', False)) / len(comparables)
+        subject_has_pool = has_pool(subject_home)
+        comp_pool_avg = sum(1 for c in comparables if has_pool(c)) / len(comparables)
         
         if subject_has_pool and comp_pool_avg < 0.5:
             adjustments['pool'] = 0.03  # +3% for having pool when comps don't
@@ -178,8 +442,8 @@ class PriceEstimator:
             adjustments['pool'] = -0.03  # -3% for not having pool when comps do
         
         # Garage adjustment
-        subject_has_garage = subject_home.get('garage', False)
-        comp_garage_avg = sum(1 for c in comparables if c.get('garage', False)) / len(comparables)
+        subject_has_garage = has_garage(subject_home)
+        comp_garage_avg = sum(1 for c in comparables if has_garage(c)) / len(comparables)
         
         if subject_has_garage and comp_garage_avg < 0.5:
             adjustments['garage'] = 0.02  # +2%
@@ -221,6 +485,54 @@ class PriceEstimator:
             'high': int(recommended_price * (1 + range_pct))
         }
     
+    def _bootstrap_price_range(
+        self,
+        subject_home: Dict[str, Any],
+        recommended_price: int,
+        comparables: List[Dict[str, Any]],
+        time_factors: Optional[np.ndarray] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Percentile bootstrap of the KNN-weighted comp price.
+        
+        Resamples the comps (with their weights) BOOTSTRAP_RESAMPLES times as
+        one (resamples x K) index matrix from a seeded RNG, and scales the
+        recommended price by the spread of the resampled weighted means
+        relative to the full-sample mean.
+        
+        Returns:
+            {'price_range': {...}, 'method', 'level', 'resamples', 'seed',
+            'computation_ms'}, or None with fewer than two priced comps
+        """
+        started = time.perf_counter()
+        if time_factors is None:
+            time_factors = np.ones(len(comparables))
+        prices, weights = self._weighted_comp_prices(subject_home, comparables, time_factors)
+        prices, weights = np.array(prices), np.array(weights)
+        if len(prices) < 2 or weights.sum() <= 0:
+            return None
+        
+        rng = np.random.default_rng(BOOTSTRAP_SEED)
+        samples = rng.integers(0, len(prices), size=(BOOTSTRAP_RESAMPLES, len(prices)))
+        sample_weights = weights[samples]
+        totals = sample_weights.sum(axis=1)
+        means = (prices[samples] * sample_weights).sum(axis=1) / np.where(totals > 0, totals, 1)
+        ratios = means / (prices @ weights / weights.sum())
+        tail = (1 - BOOTSTRAP_LEVEL) / 2 * 100
+        low, high = np.percentile(ratios, [tail, 100 - tail])
+        
+        return {
+            'price_range': {
+                'low': int(recommended_price * low),
+                'high': int(recommended_price * high)
+            },
+            'method': 'bootstrap',
+            'level': BOOTSTRAP_LEVEL,
+            'resamples': BOOTSTRAP_RESAMPLES,
+            'seed': BOOTSTRAP_SEED,
+            'computation_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+    
     def _determine_confidence(self, comparables: List[Dict[str, Any]], condition_summary: Dict[str, Any]) -> str:
         """Determine confidence level in price estimate"""
         
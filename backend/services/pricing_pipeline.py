@@ -0,0 +1,285 @@
+from typing import List, Dict, Any, Optional
+
+from services.condition_analyzer import ConditionAnalyzer
+from services.comparable_selector import ComparableSelector
+from services.price_estimator import PriceEstimator, interval_method_from_env
+from services.justification_generator import JustificationGenerator
+from services.sensitivity import apply_scenario, parse_scenarios
+from utils.comp_filters import candidate_rows, filter_comparables, parse_filters
+from utils.price_grid import price_grid
+from utils.market_index import market_index
+from utils.hedonic import hedonic_model
+from utils.corpus import today_epoch_day
+
+
+class PricingPipeline:
+    """
+    Runs the full pricing report pipeline for one subject property:
+
+    1. ConditionAnalyzer - condition from photos and video transcript
+    2. ComparableSelector - K nearest comparable sales
+    3. PriceEstimator - KNN-weighted price recommendation
+    4. JustificationGenerator - human-readable explanation
+
+    Used by the HTTP endpoints, background jobs and bulk valuation so every
+    entry point produces the same report.
+    """
+
+    def __init__(
+        self,
+        condition_analyzer: Optional[ConditionAnalyzer] = None,
+        comparable_selector: Optional[ComparableSelector] = None,
+        price_estimator: Optional[PriceEstimator] = None,
+        justification_generator: Optional[JustificationGenerator] = None,
+        corpus_provider=None,
+        conformal_calibrator=None
+    ):
+        self.condition_analyzer = condition_analyzer or ConditionAnalyzer()
+        self.comparable_selector = comparable_selector or ComparableSelector()
+        self.price_estimator = price_estimator or PriceEstimator()
+        self.justification_generator = justification_generator or JustificationGenerator()
+        self.corpus_provider = corpus_provider
+        self.conformal_calibrator = conformal_calibrator
+
+    @classmethod
+    def from_knn_settings(cls, settings: Dict[str, Any], corpus_provider=None) -> 'PricingPipeline':
+        """
+        Pipeline using tuned KNN settings from the weights file
+        (utils.data_loader.load_knn_weights); empty settings mean defaults.
+        """
+        return cls(
+            comparable_selector=ComparableSelector(feature_weights=settings.get('feature_weights')),
+            price_estimator=PriceEstimator(
+                idw_power=float(settings.get('idw_power', 1.0)),
+                interval_method=interval_method_from_env()
+            ),
+            corpus_provider=corpus_provider
+        )
+
+    def select_comparables(
+        self,
+        subject_home: Dict[str, Any],
+        comparable_sales: Optional[List[Dict[str, Any]]],
+        num_comps: int = 5,
+        corpus=None,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Select comparables from the client-supplied list, or from the server-side
+        sales corpus when none are supplied.
+
+        Client-supplied comps are normalized per request; the corpus path reuses
+        the normalization statistics cached for the current corpus version.
+
+        Args:
+            corpus: Specific corpus snapshot to use instead of the provider's current one
+            nprobe: Approximate (IVF) corpus search probing this many lists;
+                None for exact search
+            filters: Hard constraints applied before KNN (see utils.comp_filters);
+                filtered corpus searches are exact
+
+        Raises:
+            ValueError: Invalid filters
+        """
+        constraints = parse_filters(filters, subject_home)
+        if comparable_sales:
+            return self.comparable_selector.select_top_comparables(
+                subject_home=subject_home,
+                comparable_sales=filter_comparables(comparable_sales, constraints),
+                num_comps=num_comps
+            )
+
+        if corpus is None:
+            if self.corpus_provider is None:
+                return []
+            corpus = self.corpus_provider.get()
+
+        return self.comparable_selector.select_from_corpus(
+            subject_home=subject_home,
+            corpus=corpus,
+            num_comps=num_comps,
+            nprobe=nprobe,
+            candidate_rows=candidate_rows(corpus, constraints)
+        )
+
+    def neighbourhood_prior(self, subject_home: Dict[str, Any], corpus) -> Optional[Dict[str, Any]]:
+        """$/sqft statistics of the corpus grid cell containing the subject, if it has sales."""
+        try:
+            latitude, longitude = float(subject_home['latitude']), float(subject_home['longitude'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return price_grid(corpus).cell_stats(latitude, longitude)
+
+    def analyze(
+        self,
+        subject_home: Dict[str, Any],
+        photos: Optional[List[str]] = None,
+        video_transcript: str = '',
+        comparable_sales: Optional[List[Dict[str, Any]]] = None,
+        num_comps: int = 5,
+        corpus=None,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        interval_method: Optional[str] = None,
+        coverage: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate a complete pricing report.
+
+        Comparables come from `comparable_sales` when given, otherwise from
+        `corpus` (or the provider's current corpus). `nprobe` switches the
+        corpus search to approximate mode and `filters` restricts the
+        candidates (see select_comparables). `interval_method` overrides the
+        estimator's price range method; `coverage` asks for a conformal range
+        from the corpus's calibration (see services.conformal).
+
+        Returns:
+        {
+            'condition_summary': {...},
+            'top_comparables': [...],
+            'price_recommendation': {...},
+            'justification': str
+        }
+        """
+        # Step 1: Analyze home condition
+        condition_summary = self.condition_analyzer.analyze(
+            subject_home=subject_home,
+            photos=photos or [],
+            video_transcript=video_transcript or ''
+        )
+
+        # Step 2: Select top K comparable homes
+        if not comparable_sales and corpus is None and self.corpus_provider is not None:
+            corpus = self.corpus_provider.get()
+        top_comparables = self.select_comparables(
+            subject_home, comparable_sales, num_comps=num_comps, corpus=corpus, nprobe=nprobe, filters=filters
+        )
+
+        # Step 3: Estimate price based on comparables, with the neighbourhood
+        # $/sqft prior when the corpus comps are not close to the subject
+        # and the corpus's market index and hedonic model
+        use_corpus = not comparable_sales and corpus is not None
+        price_prior = None
+        if use_corpus and self.price_estimator.needs_price_prior(top_comparables):
+            price_prior = self.neighbourhood_prior(subject_home, corpus)
+        price_recommendation = self.price_estimator.estimate_price(
+            subject_home=subject_home,
+            comparables=top_comparables,
+            condition_summary=condition_summary,
+            price_prior=price_prior,
+            market_index=market_index(corpus) if use_corpus else None,
+            hedonic_model=hedonic_model(corpus) if use_corpus else None,
+            interval_method=interval_method,
+            coverage=coverage,
+            calibration=(
+                self.conformal_calibrator.calibration(corpus)
+                if coverage is not None and use_corpus and self.conformal_calibrator is not None else None
+            )
+        )
+
+        # Step 4: Generate justification
+        justification = self.justification_generator.generate(
+            subject_home=subject_home,
+            comparables=top_comparables,
+            price_recommendation=price_recommendation,
+            condition_summary=condition_summary
+        )
+
+        return {
+            'condition_summary': condition_summary,
+            'top_comparables': top_comparables,
+            'price_recommendation': price_recommendation,
+            'justification': justification,
+        }
+
+    def sensitivity(
+        self,
+        subject_home: Dict[str, Any],
+        scenarios: List[Dict[str, Any]],
+        corpus=None,
+        num_comps: int = 5,
+        photos: Optional[List[str]] = None,
+        video_transcript: str = '',
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Re-price what-if variants of a subject against a corpus.
+
+        The subject and every variant (see services.sensitivity) are searched
+        in one batched neighbour pass and priced in one batched estimator call
+        with the same market index, hedonic model and neighbourhood prior as
+        analyze(). Condition comes from the subject's photos and transcript
+        and is shared by all variants.
+
+        Returns:
+        {
+            'base': {'recommended_price': int, 'comparables': [...]},
+            'scenarios': [{'name', 'recommended_price', 'price_delta',
+                           'price_delta_pct', 'comparables_changed'}, ...]
+        }
+
+        Raises:
+            ValueError: Invalid scenarios or filters, or no comparables found
+        """
+        scenarios = parse_scenarios(scenarios)
+        if corpus is None:
+            if self.corpus_provider is None:
+                raise ValueError("No sales corpus available")
+            corpus = self.corpus_provider.get()
+
+        condition_summary = self.condition_analyzer.analyze(
+            subject_home=subject_home,
+            photos=photos or [],
+            video_transcript=video_transcript or ''
+        )
+
+        today = today_epoch_day()
+        variants = [(subject_home, today)] + [apply_scenario(subject_home, scenario, today) for scenario in scenarios]
+        selections = self.comparable_selector.select_many_from_corpus(
+            [variant for variant, _ in variants],
+            corpus,
+            num_comps=num_comps,
+            valuation_days=[day for _, day in variants],
+            candidate_rows=candidate_rows(corpus, parse_filters(filters, subject_home))
+        )
+        if not selections[0]:
+            raise ValueError("No comparables found for the subject")
+
+        # Variants share the subject's location, so they share its neighbourhood prior
+        needs_prior = [self.price_estimator.needs_price_prior(comparables) for comparables in selections]
+        prior = self.neighbourhood_prior(subject_home, corpus) if any(needs_prior) else None
+        prices = self.price_estimator.estimate_point_prices(
+            [variant for variant, _ in variants],
+            selections,
+            condition_summary,
+            price_priors=[prior if needed else None for needed in needs_prior],
+            market_index=market_index(corpus),
+            hedonic_model=hedonic_model(corpus),
+            valuation_days=[day for _, day in variants]
+        )
+
+        base_price, base_comparables = prices[0], selections[0]
+        def sale_key(comp):
+            return comp.get('address'), comp.get('sale_date'), comp.get('sale_price')
+
+        base_ids = {sale_key(comp) for comp in base_comparables}
+        results = []
+        for scenario, price, comparables in zip(scenarios, prices[1:], selections[1:]):
+            ids = {sale_key(comp) for comp in comparables}
+            results.append({
+                'name': scenario['name'],
+                'set': scenario['set'],
+                'add': scenario['add'],
+                'months_ahead': scenario['months_ahead'],
+                'recommended_price': price,
+                'price_delta': price - base_price,
+                'price_delta_pct': round((price - base_price) / base_price * 100, 2) if base_price else None,
+                'comparables_changed': len(ids - base_ids),
+            })
+
+        return {
+            'condition_summary': condition_summary,
+            'base': {'recommended_price': base_price, 'comparables': base_comparables},
+            'scenarios': results,
+        }
@@ -0,0 +1,100 @@
+from typing import List, Dict, Any, Tuple
+
+# Most scenarios priced in one /api/sensitivity request
+MAX_SCENARIOS = 100
+
+# Latest sale date a scenario may move the valuation to
+MAX_MONTHS_AHEAD = 36
+
+# Subject fields a scenario may override ("set") or, when numeric, shift ("add")
+SET_FIELDS = ('sqft', 'bedrooms', 'bathrooms', 'year_built', 'has_pool', 'garage_spaces', 'lot_sqft')
+ADD_FIELDS = ('sqft', 'bedrooms', 'bathrooms', 'year_built', 'garage_spaces', 'lot_sqft')
+
+SCENARIO_KEYS = ('name', 'set', 'add', 'months_ahead')
+
+DAYS_PER_MONTH = 365.25 / 12
+
+
+def _number(value: Any, label: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{label} must be a number")
+    return float(value)
+
+
+def parse_scenarios(scenarios: Any) -> List[Dict[str, Any]]:
+    """
+    Validate what-if scenarios for PricingPipeline.sensitivity.
+
+    Each scenario is {"name": str, "set": {field: value}, "add": {field:
+    number}, "months_ahead": int}, all keys optional: `set` overrides subject
+    fields, `add` shifts numeric ones (e.g. {"sqft": 300}) and `months_ahead`
+    values the variant that many months from today.
+
+    Returns:
+        Scenarios with defaults filled in
+
+    Raises:
+        ValueError: Not a non-empty list of scenario objects, unknown keys or
+            fields, or out-of-range values
+    """
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError('scenarios must be a non-empty list of objects')
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f"At most {MAX_SCENARIOS} scenarios per request")
+
+    parsed = []
+    for position, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ValueError(f"Scenario {position} must be an object")
+        unknown = sorted(set(scenario) - set(SCENARIO_KEYS))
+        if unknown:
+            raise ValueError(f"Unknown scenario keys: {', '.join(unknown)}")
+
+        overrides = scenario.get('set') or {}
+        shifts = scenario.get('add') or {}
+        if not isinstance(overrides, dict) or not isinstance(shifts, dict):
+            raise ValueError(f"Scenario {position}: set and add must be objects")
+        unknown = sorted((set(overrides) - set(SET_FIELDS)) | (set(shifts) - set(ADD_FIELDS)))
+        if unknown:
+            raise ValueError(f"Scenario {position}: unsupported fields: {', '.join(unknown)}")
+        for field, value in overrides.items():
+            if field == 'has_pool':
+                if not isinstance(value, bool):
+                    raise ValueError(f"Scenario {position}: has_pool must be true or false")
+            else:
+                _number(value, f"Scenario {position}: {field}")
+        shifts = {field: _number(value, f"Scenario {position}: add.{field}") for field, value in shifts.items()}
+
+        months_ahead = scenario.get('months_ahead', 0)
+        if isinstance(months_ahead, bool) or not isinstance(months_ahead, int) or not 0 <= months_ahead <= MAX_MONTHS_AHEAD:
+            raise ValueError(f"Scenario {position}: months_ahead must be an integer from 0 to {MAX_MONTHS_AHEAD}")
+
+        parsed.append({
+            'name': str(scenario.get('name') or f"scenario {position + 1}"),
+            'set': dict(overrides),
+            'add': shifts,
+            'months_ahead': months_ahead,
+        })
+    return parsed
+
+
+def apply_scenario(subject_home: Dict[str, Any], scenario: Dict[str, Any], today: int) -> Tuple[Dict[str, Any], int]:
+    """
+    (variant subject, valuation epoch day) for a parsed scenario.
+
+    Square footage is written to `sqft` (which takes precedence over
+    `square_footage` everywhere); the pool flag is written to both
+    `has_pool` and `has_private_pool` so the KNN features and the price
+    adjustments agree.
+    """
+    variant = dict(subject_home)
+    if 'sqft' not in variant and 'square_footage' in variant:
+        variant['sqft'] = variant['square_footage']
+    for field, value in scenario['set'].items():
+        if field == 'has_pool':
+            variant['has_pool'] = variant['has_private_pool'] = value
+        else:
+            variant[field] = value
+    for field, shift in scenario['add'].items():
+        variant[field] = max(0.0, float(variant.get(field) or 0) + shift)
+    return variant, today + int(round(scenario['months_ahead'] * DAYS_PER_MONTH))
@@ -0,0 +1,376 @@
+from typing import List, Dict, Any, Optional, Sequence
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from datetime import datetime
+import numpy as np
+
+from services.backtester import Backtester, DEFAULT_MEMORY_BUDGET, error_metrics
+from services.condition_analyzer import ConditionAnalyzer
+from services.price_estimator import PriceEstimator, has_pool, has_garage
+from utils.corpus import SalesCorpus, FEATURE_NAMES
+
+
+OBJECTIVES = ('mape', 'median_ape', 'mae')
+
+DEFAULT_IDW_POWERS = (0.5, 1.0, 2.0, 3.0)
+
+# Candidate neighbours kept per held-out sale
+DEFAULT_POOL_SIZE = 64
+
+# Multipliers tried on each weight during coordinate descent
+DESCENT_STEPS = (0.0, 0.5, 0.8, 1.25, 2.0)
+
+
+def build_candidate_pool(
+    corpus: SalesCorpus,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+) -> Dict[str, np.ndarray]:
+    """
+    Precompute everything the tuning objective needs, once.
+
+    For every sale, its `pool_size` nearest earlier sales under equal feature
+    weights form the candidate pool, and the per-feature squared differences
+    of the standardized features are stored as an (n, pool, features) tensor.
+    Scoring a weight vector is then `sqrt(squared_diffs @ weights)` plus a
+    top-K, with no neighbour search. The comp and subject attributes that
+    PriceEstimator reads are gathered alongside.
+
+    Returns:
+        Dict of arrays (see the keys below); rows without a full pool are dropped
+    """
+    equal_weights = {name: 1.0 / len(FEATURE_NAMES) for name in FEATURE_NAMES}
+    searcher = Backtester(num_comps=pool_size, feature_weights=equal_weights, memory_budget=memory_budget)
+    order, scaled, cutoffs = searcher.prepare(corpus)
+    standardized = corpus.normalized().matrix
+
+    subject_rows, comp_rows = [], []
+    for start, stop in searcher.blocks(corpus):
+        neighbours, _ = searcher.nearest_prior(scaled, cutoffs, start, stop)
+        full = (neighbours >= 0).all(axis=1)
+        subject_rows.append(order[start:stop][full])
+        comp_rows.append(order[neighbours[full]])
+    subject_rows = np.concatenate(subject_rows)
+    comp_rows = np.concatenate(comp_rows)
+
+    squared_diffs = ((standardized[subject_rows][:, None, :] - standardized[comp_rows]) ** 2).astype(np.float32)
+
+    records = [corpus.record(row) for row in range(len(corpus))]
+
+    def column(key, default, dtype=np.float64):
+        return np.array([record.get(key, default) for record in records], dtype=dtype)
+
+    sqft = column('sqft', 0)
+    prices = column('sale_price', 0)
+    year_built = column('year_built', 2000)
+    pool = np.array([has_pool(record) for record in records], dtype=bool)
+    garage = np.array([has_garage(record) for record in records], dtype=bool)
+
+    analyzer = ConditionAnalyzer()
+    estimator = PriceEstimator()
+    condition_adjustment = np.array([
+        estimator._calculate_condition_adjustment(analyzer.analyze(records[row], [], ''))
+        for row in subject_rows
+    ])
+
+    return {
+        'subject_rows': subject_rows,
+        'comp_rows': comp_rows,
+        'squared_diffs': squared_diffs,
+        'actual': corpus.prices[subject_rows],
+        'subject_sqft': np.where(sqft[subject_rows] == 0, 1.0, sqft[subject_rows]),
+        'subject_age': 2025 - year_built[subject_rows],
+        'subject_pool': pool[subject_rows],
+        'subject_garage': garage[subject_rows],
+        'condition_adjustment': condition_adjustment,
+        'comp_sqft': sqft[comp_rows],
+        'comp_price': prices[comp_rows],
+        'comp_age': 2025 - year_built[comp_rows],
+        'comp_pool': pool[comp_rows],
+        'comp_garage': garage[comp_rows],
+    }
+
+
+def _presence_adjustment(subject_has: np.ndarray, comp_share: np.ndarray, amount: float) -> np.ndarray:
+    """PriceEstimator's pool/garage rule: +amount if only the subject has it, -amount if only the comps do."""
+    return np.where(subject_has & (comp_share < 0.5), amount, np.where(~subject_has & (comp_share > 0.5), -amount, 0.0))
+
+
+def predict_prices(
+    pool: Dict[str, np.ndarray],
+    weights: np.ndarray,
+    num_comps: int,
+    idw_power: float = 1.0
+) -> np.ndarray:
+    """
+    Vectorized PriceEstimator.estimate_point_price over the candidate pool.
+
+    Mirrors _calculate_base_price (sqft-adjusted, inverse-distance weighted),
+    the condition adjustment and the pool/garage/age feature adjustments.
+
+    Returns:
+        Predicted prices, NaN where no comp has a usable price
+    """
+    distances = np.sqrt(np.maximum(pool['squared_diffs'] @ weights.astype(np.float32), 0)).astype(np.float64)
+    nearest = np.argpartition(distances, num_comps - 1, axis=1)[:, :num_comps]
+
+    def pick(key):
+        return np.take_along_axis(pool[key], nearest, axis=1)
+
+    knn_distance = np.round(np.take_along_axis(distances, nearest, axis=1), 4)
+    comp_sqft, comp_price = pick('comp_sqft'), pick('comp_price')
+
+    # Base price: sqft-adjusted comp prices, inverse-distance weighted
+    usable = (comp_sqft > 0) & (comp_price > 0)
+    idw = np.where(usable, 1.0 / (1.0 + knn_distance) ** idw_power, 0.0)
+    adjusted = np.where(usable, comp_price / np.where(usable, comp_sqft, 1.0), 0.0) * pool['subject_sqft'][:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        base = (idw * adjusted).sum(axis=1) / idw.sum(axis=1)
+        positive = comp_price > 0
+        fallback = np.where(positive, comp_price, 0.0).sum(axis=1) / positive.sum(axis=1)
+    base = np.where(usable.any(axis=1), base, fallback)
+
+    # Feature adjustments
+    pool_adjustment = _presence_adjustment(pool['subject_pool'], pick('comp_pool').mean(axis=1), 0.03)
+    garage_adjustment = _presence_adjustment(pool['subject_garage'], pick('comp_garage').mean(axis=1), 0.02)
+    age_adjustment = np.clip((pick('comp_age').mean(axis=1) - pool['subject_age']) / 10 * 0.01, -0.05, 0.05)
+    age_adjustment = np.where(np.abs(age_adjustment) > 0.005, age_adjustment, 0.0)
+
+    total = pool['condition_adjustment'] + pool_adjustment + garage_adjustment + age_adjustment
+    return np.trunc(base * (1 + total))
+
+
+def score(predicted: np.ndarray, actual: np.ndarray, objective: str = 'mape') -> float:
+    """Backtest error of one candidate (lower is better)."""
+    valid = np.isfinite(predicted) & (actual > 0)
+    if not valid.any():
+        return float('inf')
+    abs_error = np.abs(predicted[valid] - actual[valid])
+    if objective == 'mae':
+        return float(abs_error.mean())
+    ape = abs_error / actual[valid] * 100
+    return float(np.median(ape) if objective == 'median_ape' else ape.mean())
+
+
+def save_candidate_pool(pool: Dict[str, np.ndarray], directory: str) -> None:
+    """Write the pool as .npy files so worker processes can memory-map it."""
+    for key, array in pool.items():
+        np.save(os.path.join(directory, f"{key}.npy"), array)
+
+
+def load_candidate_pool(directory: str) -> Dict[str, np.ndarray]:
+    return {
+        name[:-4]: np.load(os.path.join(directory, name), mmap_mode='r')
+        for name in os.listdir(directory) if name.endswith('.npy')
+    }
+
+
+# Per-process candidate pool for parallel evaluation
+_worker_pool: Dict[str, Any] = {}
+
+
+def _init_worker(directory: str, objective: str) -> None:
+    _worker_pool.update(pool=load_candidate_pool(directory), objective=objective)
+
+
+def _evaluate(candidate: Dict[str, Any]) -> float:
+    return evaluate_candidate(_worker_pool['pool'], candidate, _worker_pool['objective'])
+
+
+def evaluate_candidate(pool: Dict[str, np.ndarray], candidate: Dict[str, Any], objective: str = 'mape') -> float:
+    weights = np.array([candidate['feature_weights'].get(name, 0.0) for name in FEATURE_NAMES])
+    predicted = predict_prices(pool, weights, candidate['num_comps'], candidate['idw_power'])
+    return score(predicted, pool['actual'], objective)
+
+
+def _normalized(weights: np.ndarray) -> Dict[str, float]:
+    total = weights.sum()
+    if total <= 0:
+        weights, total = np.ones(len(weights)), float(len(weights))
+    return {name: round(float(value / total), 4) for name, value in zip(FEATURE_NAMES, weights)}
+
+
+class WeightTuner:
+    """
+    Searches FEATURE_WEIGHTS, K and the IDW power against backtest error.
+
+    A random search over the weight simplex, K and IDW power is followed by
+    coordinate descent from the best candidate. Candidates are scored with
+    predict_prices on the precomputed candidate pool, in parallel when
+    workers > 1; the winner is then re-checked with the exact Backtester.
+    """
+
+    def __init__(
+        self,
+        corpus: SalesCorpus,
+        objective: str = 'mape',
+        k_values: Sequence[int] = tuple(range(3, 11)),
+        idw_powers: Sequence[float] = DEFAULT_IDW_POWERS,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        workers: int = 1,
+        seed: int = 0
+    ):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown objective '{objective}', expected one of {OBJECTIVES}")
+        self.corpus = corpus
+        self.objective = objective
+        self.k_values = [k for k in k_values if 0 < k <= pool_size]
+        self.idw_powers = list(idw_powers)
+        self.pool_size = pool_size
+        self.workers = max(1, workers)
+        self.rng = np.random.default_rng(seed)
+        self.history: List[Dict[str, Any]] = []
+
+    def random_candidates(self, count: int) -> List[Dict[str, Any]]:
+        return [
+            {
+                'feature_weights': _normalized(self.rng.dirichlet(np.ones(len(FEATURE_NAMES)))),
+                'num_comps': int(self.rng.choice(self.k_values)),
+                'idw_power': float(self.rng.choice(self.idw_powers)),
+            }
+            for _ in range(count)
+        ]
+
+    def neighbours_of(self, candidate: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """One-coordinate moves: scale each weight, step K, change IDW power."""
+        weights = np.array([candidate['feature_weights'][name] for name in FEATURE_NAMES])
+        moves = []
+        for index in range(len(FEATURE_NAMES)):
+            for step in DESCENT_STEPS:
+                scaled = weights.copy()
+                scaled[index] = scaled[index] * step if scaled[index] > 0 else 0.05 * step
+                moves.append({**candidate, 'feature_weights': _normalized(scaled)})
+        for k in (candidate['num_comps'] - 1, candidate['num_comps'] + 1):
+            if k in self.k_values:
+                moves.append({**candidate, 'num_comps': k})
+        for power in self.idw_powers:
+            if power != candidate['idw_power']:
+                moves.append({**candidate, 'idw_power': power})
+        return moves
+
+    def tune(
+        self,
+        baseline: Dict[str, Any],
+        trials: int = 200,
+        rounds: int = 5,
+        progress=print
+    ) -> Dict[str, Any]:
+        """
+        Run the search.
+
+        Args:
+            baseline: Current settings {'feature_weights', 'num_comps', 'idw_power'}
+            trials: Random-search candidates
+            rounds: Maximum coordinate-descent rounds
+
+        Returns:
+            {'best': candidate, 'best_score', 'baseline_score', 'evaluations',
+             'subjects': sales in the candidate pool (scored by the search)}
+        """
+        pool = build_candidate_pool(self.corpus, self.pool_size)
+        progress(f"Candidate pool: {len(pool['actual'])} of {len(self.corpus)} sales "
+                 f"(those with {self.pool_size}+ earlier sales) x {self.pool_size} neighbours")
+
+        directory = tempfile.mkdtemp(prefix='knn_tuning_')
+        try:
+            if self.workers > 1:
+                save_candidate_pool(pool, directory)
+                executor = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(directory, self.objective))
+                evaluate = lambda candidates: executor.map(_evaluate, candidates)
+            else:
+                executor = None
+                evaluate = lambda candidates: [evaluate_candidate(pool, c, self.objective) for c in candidates]
+
+            try:
+                def scored(candidates):
+                    results = list(zip(evaluate(candidates), candidates))
+                    self.history.extend({'score': s, **c} for s, c in results)
+                    return min(results, key=lambda result: result[0])
+
+                baseline_score, _ = scored([baseline])
+                best_score, best = scored([baseline] + self.random_candidates(trials))
+                progress(f"Random search: {self.objective} {baseline_score:.3f} -> {best_score:.3f}")
+
+                for round_number in range(1, rounds + 1):
+                    round_score, round_best = scored(self.neighbours_of(best))
+                    if round_score >= best_score - 1e-9:
+                        break
+                    best_score, best = round_score, round_best
+                    progress(f"Descent round {round_number}: {self.objective} {best_score:.3f}")
+            finally:
+                if executor is not None:
+                    executor.close()
+                    executor.join()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        return {
+            'best': best,
+            'best_score': best_score,
+            'baseline_score': baseline_score,
+            'evaluations': len(self.history),
+            'subjects': int(len(pool['actual'])),
+        }
+
+
+def backtest_metrics(
+    corpus: SalesCorpus,
+    candidates: Sequence[Dict[str, Any]],
+    workers: int = 1,
+    store_name: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    Exact leave-one-out metrics for each candidate, on the same sales.
+
+    A larger K leaves fewer sales with enough earlier comps, so every
+    candidate is scored only on the sales all of them could value; the
+    metrics then compare like for like.
+    """
+    runs = []
+    for candidate in candidates:
+        backtester = Backtester(
+            num_comps=candidate['num_comps'],
+            feature_weights=candidate['feature_weights'],
+            price_estimator=PriceEstimator(idw_power=candidate['idw_power'])
+        )
+        runs.append(backtester.run(corpus, workers=workers, store_name=store_name))
+
+    common = runs[0][0]
+    for rows, _ in runs[1:]:
+        common = np.intersect1d(common, rows)
+    metrics = []
+    for rows, predictions in runs:
+        shared = np.isin(rows, common)
+        metrics.append(error_metrics(predictions[shared], corpus.prices[rows[shared]]))
+    return metrics
+
+
+def write_weights_file(path: str, payload: Dict[str, Any]) -> int:
+    """
+    Write a new weights file version.
+
+    The version number continues from the existing file; each version is also
+    kept as <name>.v<N>.json next to it so earlier weights can be restored.
+
+    Returns:
+        The version written
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            version = int(json.load(f).get('version', 0)) + 1
+    except (FileNotFoundError, ValueError):
+        version = 1
+
+    payload = {'version': version, 'created_at': datetime.now().isoformat(), **payload}
+    root, extension = os.path.splitext(path)
+    with open(f"{root}.v{version}{extension}", 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(temp_path, path)
+    return version
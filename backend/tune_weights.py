@@ -0,0 +1,115 @@
+"""
+Tune ComparableSelector.FEATURE_WEIGHTS, K and the IDW power against
+leave-one-out backtest error, and write a versioned weights file that the
+API loads at startup.
+
+Usage (from the backend directory):
+    python tune_weights.py --trials 500 --workers 8
+    python tune_weights.py --objective median_ape --dry-run
+"""
+import argparse
+import os
+import sys
+import time
+
+from services.comparable_selector import ComparableSelector
+from services.weight_tuner import (
+    DEFAULT_POOL_SIZE,
+    OBJECTIVES,
+    WeightTuner,
+    backtest_metrics,
+    write_weights_file,
+)
+from utils.corpus import load_sales_corpus
+from utils.data_loader import knn_weights_path, load_knn_weights
+from utils.shared_corpus import SharedCorpusStore
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Tune KNN feature weights, K and IDW power on backtest error.")
+    parser.add_argument('--objective', choices=OBJECTIVES, default='mape', help="Error to minimize (default: mape)")
+    parser.add_argument('--trials', type=int, default=200, help="Random-search candidates (default: 200)")
+    parser.add_argument('--rounds', type=int, default=5, help="Maximum coordinate-descent rounds (default: 5)")
+    parser.add_argument('--k-min', type=int, default=3, help="Smallest K to try (default: 3)")
+    parser.add_argument('--k-max', type=int, default=10, help="Largest K to try (default: 10)")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                        help=f"Candidate neighbours precomputed per sale (default: {DEFAULT_POOL_SIZE})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument('--output', default=knn_weights_path(), help="Weights file to write (default: data/knn_weights.json)")
+    parser.add_argument('--dry-run', action='store_true', help="Report the result without writing the weights file")
+    args = parser.parse_args(argv)
+
+    corpus = load_sales_corpus()
+    if len(corpus) == 0:
+        raise SystemExit("No comparable sales found in the data directory")
+
+    current = load_knn_weights(args.output)
+    baseline = {
+        'feature_weights': {**ComparableSelector.FEATURE_WEIGHTS, **current.get('feature_weights', {})},
+        'num_comps': int(current.get('num_comps', 5)),
+        'idw_power': float(current.get('idw_power', 1.0)),
+    }
+
+    tuner = WeightTuner(
+        corpus,
+        objective=args.objective,
+        k_values=range(args.k_min, args.k_max + 1),
+        pool_size=args.pool_size,
+        workers=args.workers,
+        seed=args.seed
+    )
+    print(f"Tuning on {len(corpus)} sales (version {corpus.version}), objective {args.objective}")
+
+    started = time.time()
+    result = tuner.tune(baseline, trials=args.trials, rounds=args.rounds)
+    best = result['best']
+    print(f"{result['evaluations']} candidates scored in {time.time() - started:.1f}s")
+
+    # Confirm on the exact backtest
+    store = None
+    if args.workers > 1:
+        store = SharedCorpusStore(f"tune_weights_{os.getpid()}")
+        store.publish(corpus)
+    try:
+        store_name = store.name if store else None
+        baseline_metrics, best_metrics = backtest_metrics(
+            corpus, [baseline, best], workers=args.workers, store_name=store_name
+        )
+    finally:
+        if store is not None:
+            store.unlink()
+
+    print(f"Search scored {result['subjects']} of {len(corpus)} sales (those with {args.pool_size}+ earlier sales)")
+    print(f"Exact backtest on the {baseline_metrics['count']} sales both settings could value:")
+    print(f"Baseline: K={baseline['num_comps']} idw_power={baseline['idw_power']} {baseline_metrics}")
+    print(f"Tuned:    K={best['num_comps']} idw_power={best['idw_power']} {best_metrics}")
+    print("Weights: " + ", ".join(f"{name}={value}" for name, value in best['feature_weights'].items()))
+
+    if args.dry_run:
+        return 0
+    if best_metrics[args.objective] is not None and best_metrics[args.objective] >= baseline_metrics[args.objective]:
+        print("Tuned settings do not beat the current ones on the exact backtest; weights file left unchanged")
+        return 0
+
+    version = write_weights_file(args.output, {
+        **best,
+        'objective': args.objective,
+        'corpus_version': corpus.version,
+        'backtest': best_metrics,
+        'baseline_backtest': baseline_metrics,
+        'search': {
+            'trials': args.trials,
+            'rounds': args.rounds,
+            'pool_size': args.pool_size,
+            'seed': args.seed,
+            'evaluations': result['evaluations'],
+            'subjects': result['subjects'],
+        },
+    })
+    print(f"Wrote version {version} to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
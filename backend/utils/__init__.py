@@ -4,6 +4,13 @@ from .data_loader import (
     load_subject_property,
     load_video_transcript,
     load_sales_records,
+    discover_market_files,
+    sales_records_signature,
+    subject_data_signature,
+    load_sales_wal,
+    append_sales_wal,
+    compact_sales_wal,
+    load_knn_weights,
     get_all_comparable_properties,
     normalize_subject_property,
     normalize_comparable_property,
@@ -14,6 +21,13 @@ __all__ = [
     'load_subject_property',
     'load_video_transcript',
     'load_sales_records',
+    'discover_market_files',
+    'sales_records_signature',
+    'subject_data_signature',
+    'load_sales_wal',
+    'append_sales_wal',
+    'compact_sales_wal',
+    'load_knn_weights',
     'get_all_comparable_properties',
     'normalize_subject_property',
     'normalize_comparable_property',
@@ -0,0 +1,173 @@
+"""
+Approximate nearest-neighbour (ANN) search over the weighted KNN feature space.
+
+An IVF (inverted file) index: k-means centroids coarsely partition the
+standardized, weight-scaled feature space, and each sale is listed under its
+nearest centroid. A query only scans the sales listed under its `nprobe`
+nearest centroids, so cost scales with nprobe / nlist of the corpus instead
+of all of it. Larger nprobe means higher recall and higher latency;
+nprobe = nlist is exact.
+
+Opt-in only: exact search remains the default for appraisal-grade reports.
+"""
+import math
+import os
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from .distance import top_k_neighbours
+
+DEFAULT_NPROBE = 8
+
+# Training sample for k-means; assignment still covers every row
+DEFAULT_TRAINING_SAMPLE = 50_000
+DEFAULT_ITERATIONS = 10
+
+
+def default_nlist(n: int) -> int:
+    """Number of lists for n points: about 4 * sqrt(n), at least 1."""
+    return max(1, min(n, int(4 * math.sqrt(n))))
+
+
+def train_centroids(
+    points: np.ndarray,
+    nlist: int,
+    iterations: int = DEFAULT_ITERATIONS,
+    sample_size: int = DEFAULT_TRAINING_SAMPLE,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    k-means (Lloyd's algorithm) on a random sample of the points.
+
+    Empty clusters are re-seeded from random sample points.
+    """
+    rng = np.random.default_rng(seed)
+    if len(points) > sample_size:
+        points = points[rng.choice(len(points), sample_size, replace=False)]
+    nlist = max(1, min(nlist, len(points)))
+
+    centroids = points[rng.choice(len(points), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment, _ = top_k_neighbours(points, centroids, 1)
+        assignment = assignment[:, 0]
+        counts = np.bincount(assignment, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = points[rng.choice(len(points), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over one corpus version's scaled feature matrix.
+
+    Attributes:
+        points: (n, d) scaled features the index was built over
+        centroids: (nlist, d) coarse quantizer
+        list_rows: Corpus rows grouped by list
+        list_offsets: (nlist + 1,) start of each list in list_rows
+        version: Corpus version the index was built for
+    """
+
+    def __init__(self, points: np.ndarray, centroids: np.ndarray, list_rows: np.ndarray, list_offsets: np.ndarray, version: str):
+        self.points = points
+        self.centroids = centroids
+        self.list_rows = list_rows
+        self.list_offsets = list_offsets
+        self.version = version
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(
+        cls,
+        points: np.ndarray,
+        version: str = '',
+        nlist: Optional[int] = None,
+        centroids: Optional[np.ndarray] = None,
+        seed: int = 0
+    ) -> 'IVFIndex':
+        """
+        Assign every point to its nearest centroid.
+
+        Args:
+            points: (n, d) scaled features
+            version: Corpus version
+            nlist: Number of lists (default: default_nlist(n)); ignored when
+                centroids are given
+            centroids: Reuse trained centroids (e.g. from the previous corpus
+                version), so a new version only costs the assignment pass
+        """
+        if centroids is None:
+            centroids = train_centroids(points, nlist or default_nlist(len(points)), seed=seed)
+        assignment, _ = top_k_neighbours(points, centroids, 1)
+        assignment = assignment[:, 0]
+        list_rows = np.argsort(assignment, kind='stable')
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(points, centroids, list_rows, list_offsets, version)
+
+    def candidates(self, query: np.ndarray, nprobe: int, min_count: int = 0) -> np.ndarray:
+        """
+        Rows listed under the nprobe centroids nearest the query.
+
+        Probes further lists if needed to return at least min_count rows.
+        """
+        centroid_distances = ((self.centroids - query) ** 2).sum(axis=1)
+        probe_order = np.argsort(centroid_distances, kind='stable')
+        nprobe = max(1, min(nprobe, self.nlist))
+
+        sizes = np.diff(self.list_offsets)[probe_order]
+        needed = int(np.searchsorted(np.cumsum(sizes), min_count, side='left')) + 1
+        probes = probe_order[:max(nprobe, min(needed, self.nlist))]
+        return np.concatenate([self.list_rows[self.list_offsets[p]:self.list_offsets[p + 1]] for p in probes])
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = DEFAULT_NPROBE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate k nearest rows to a scaled query vector.
+
+        Returns:
+            (rows, distances) ordered by (distance, row); distances are exact
+            for the returned rows
+        """
+        rows = self.candidates(query, nprobe, min_count=k)
+        if len(rows) == 0:
+            return rows, np.empty(0)
+        diffs = self.points[rows] - query
+        distances = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+        order = np.lexsort((rows, distances))[:k]
+        return rows[order], distances[order]
+
+
+def recall_at_k(exact: Sequence[Sequence[int]], approximate: Sequence[Sequence[int]]) -> float:
+    """Mean fraction of each query's exact top-K found by the approximate search."""
+    hits = total = 0
+    for truth, found in zip(exact, approximate):
+        truth = set(truth)
+        hits += len(truth.intersection(found))
+        total += len(truth)
+    return hits / total if total else 1.0
+
+
+def nlist_from_env() -> Optional[int]:
+    """IVF list count override (ANN_NLIST); None means size-based default."""
+    try:
+        value = int(os.environ.get('ANN_NLIST', 0))
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def nprobe_from_env() -> int:
+    """Default nprobe for approximate mode (ANN_NPROBE)."""
+    try:
+        return max(1, int(os.environ.get('ANN_NPROBE', DEFAULT_NPROBE)))
+    except ValueError:
+        return DEFAULT_NPROBE
@@ -0,0 +1,318 @@
+"""
+Hard constraints on comparables, applied as an index pre-filter before KNN.
+
+Range constraints (sale date, sqft, year built) use per-column sorted indexes
+(binary search); categorical ones (bedrooms, dwelling type, private pool) use
+bitmap indexes. The most selective range constraint produces the first
+candidate set and every other constraint is checked only on those rows, so a
+narrow filter costs O(log n + matches) instead of a pass over the corpus.
+Snapshots produced by SalesCorpus.append extend their parent's indexes with
+the appended rows rather than rebuilding them.
+
+Filters (all optional):
+    sold_within_days: Sold at most this many days ago
+    sqft_within_pct: Square footage within +/- this percent of the subject's
+    sqft_min / sqft_max: Square footage bounds
+    year_built_min / year_built_max: Year built bounds
+    bedrooms: Bedroom count, list of counts, or "same" (the subject's)
+    dwelling_type: Dwelling type, list of types, or "same"
+    has_private_pool: true / false
+"""
+from typing import Any, Callable, Dict, List, Mapping, Optional
+import numpy as np
+
+from .corpus import SalesCorpus, STATIC_FEATURE_NAMES, build_corpus, today_epoch_day
+from .sorted_index import SortedColumnIndex
+
+RANGE_COLUMNS = ('sqft', 'year_built')
+
+FILTER_KEYS = (
+    'sold_within_days', 'sqft_within_pct', 'sqft_min', 'sqft_max',
+    'year_built_min', 'year_built_max', 'bedrooms', 'dwelling_type', 'has_private_pool',
+)
+
+
+class BitmapIndex:
+    """
+    One packed bitmap per distinct value of a categorical column.
+
+    Bitmaps are np.packbits arrays (1 bit per row), so 1M rows cost 125 KB
+    per distinct value.
+    """
+
+    def __init__(self, bitmaps: Dict[Any, np.ndarray], size: int):
+        self.bitmaps = bitmaps
+        self.size = size
+
+    @classmethod
+    def from_values(cls, values: List[Any]) -> 'BitmapIndex':
+        values = np.asarray(values, dtype=object)
+        return cls(
+            {value: np.packbits(values == value) for value in set(values.tolist())},
+            len(values)
+        )
+
+    def appended(self, values: List[Any]) -> 'BitmapIndex':
+        """
+        Index with rows for `values` added after this one's; this index is left
+        unchanged. Copies the packed bitmaps (n / 8 bytes per distinct value)
+        and sets only the new rows' bits.
+        """
+        values = np.asarray(values, dtype=object)
+        size = self.size + len(values)
+        length = (size + 7) // 8
+        bitmaps = {}
+        for value in set(self.bitmaps) | set(values.tolist()):
+            bitmap = np.zeros(length, dtype=np.uint8)
+            previous = self.bitmaps.get(value)
+            if previous is not None:
+                bitmap[:len(previous)] = previous
+            rows = self.size + np.flatnonzero(values == value)
+            np.bitwise_or.at(bitmap, rows >> 3, (0x80 >> (rows & 7)).astype(np.uint8))
+            bitmaps[value] = bitmap
+        return BitmapIndex(bitmaps, size)
+
+    def bitmap(self, values: List[Any]) -> np.ndarray:
+        """OR of the bitmaps for the given values (all zeros for unknown values)."""
+        combined = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for value in values:
+            bitmap = self.bitmaps.get(value)
+            if bitmap is not None:
+                combined |= bitmap
+        return combined
+
+    def rows(self, values: List[Any]) -> np.ndarray:
+        """Ascending row ids having any of the values."""
+        return bitmap_rows(self.bitmap(values), self.size)
+
+
+def bitmap_rows(bitmap: np.ndarray, size: int) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(bitmap, count=size)).astype(np.int64)
+
+
+def bitmap_contains(bitmap: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Membership test for specific rows without unpacking the whole bitmap."""
+    return ((bitmap[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+
+
+def _bedroom_values(corpus: SalesCorpus, start: int = 0) -> List[Any]:
+    return corpus.features[start:, STATIC_FEATURE_NAMES.index('bedrooms')].tolist()
+
+
+def _dwelling_type_values(corpus: SalesCorpus, start: int = 0) -> List[Any]:
+    return corpus.coded_attribute('dwelling_type', start).tolist()
+
+
+def _private_pool_values(corpus: SalesCorpus, start: int = 0) -> List[Any]:
+    return (corpus.attribute('has_private_pool', start) > 0).tolist()
+
+
+# Column -> values of rows [start, len(corpus)) of a snapshot
+CATEGORICAL_COLUMNS: Dict[str, Callable[[SalesCorpus, int], List[Any]]] = {
+    'bedrooms': _bedroom_values,
+    'dwelling_type': _dwelling_type_values,
+    'has_private_pool': _private_pool_values,
+}
+
+
+def sorted_index(corpus: SalesCorpus, column: str) -> SortedColumnIndex:
+    """Sorted index over a static feature column, built once per corpus snapshot."""
+    if column == 'sale_day':
+        return corpus.date_index
+    values = corpus.features[:, STATIC_FEATURE_NAMES.index(column)]
+    return corpus.lazy_index(
+        f'sorted:{column}',
+        lambda: SortedColumnIndex.from_values(values),
+        update=lambda previous: _appended_sorted_index(previous, values)
+    )
+
+
+def _appended_sorted_index(previous: SortedColumnIndex, values: np.ndarray) -> SortedColumnIndex:
+    """
+    Copy of `previous` (which covers values[:len(previous)]) with the remaining
+    rows inserted; shares the sorted base and leaves `previous` unchanged.
+    """
+    index = previous.copy()
+    start = len(index)
+    for offset, value in enumerate(values[start:].tolist()):
+        index.insert(value, start + offset)
+    return index.merged() if index.needs_merge() else index
+
+
+def bitmap_index(corpus: SalesCorpus, column: str) -> BitmapIndex:
+    """Bitmap index over a categorical column, built once per corpus snapshot."""
+    return corpus.lazy_index(
+        f'bitmap:{column}',
+        lambda: BitmapIndex.from_values(CATEGORICAL_COLUMNS[column](corpus)),
+        update=lambda previous: previous.appended(CATEGORICAL_COLUMNS[column](corpus, previous.size))
+    )
+
+
+def _number(filters: Dict[str, Any], key: str) -> Optional[float]:
+    value = filters.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Filter {key} must be a number")
+    return float(value)
+
+
+def _categories(filters: Dict[str, Any], key: str, subject_value: Any) -> Optional[List[Any]]:
+    value = filters.get(key)
+    if value is None:
+        return None
+    if value == 'same':
+        if subject_value is None:
+            raise ValueError(f'Filter {key} "same" needs the subject {key}')
+        value = subject_value
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def parse_filters(filters: Optional[Dict[str, Any]], subject_home: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resolve a filters object against the subject into index lookups.
+
+    Returns:
+        {'ranges': {column: (low, high)}, 'categories': {column: [values]}};
+        empty when there are no constraints
+
+    Raises:
+        ValueError: Unknown filter or invalid value
+    """
+    if not filters:
+        return {}
+    if not isinstance(filters, dict):
+        raise ValueError('filters must be an object')
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+    ranges = {}
+    sold_within_days = _number(filters, 'sold_within_days')
+    if sold_within_days is not None:
+        ranges['sale_day'] = (today_epoch_day() - int(sold_within_days), None)
+
+    sqft_low, sqft_high = _number(filters, 'sqft_min'), _number(filters, 'sqft_max')
+    sqft_within_pct = _number(filters, 'sqft_within_pct')
+    if sqft_within_pct is not None:
+        subject_sqft = float(subject_home.get('sqft', subject_home.get('square_footage', 0)) or 0)
+        if subject_sqft <= 0:
+            raise ValueError('sqft_within_pct needs the subject sqft')
+        tolerance = subject_sqft * sqft_within_pct / 100
+        sqft_low = max(sqft_low or 0, subject_sqft - tolerance)
+        sqft_high = subject_sqft + tolerance if sqft_high is None else min(sqft_high, subject_sqft + tolerance)
+    if sqft_low is not None or sqft_high is not None:
+        ranges['sqft'] = (sqft_low, sqft_high)
+
+    year_low, year_high = _number(filters, 'year_built_min'), _number(filters, 'year_built_max')
+    if year_low is not None or year_high is not None:
+        ranges['year_built'] = (year_low, year_high)
+
+    categories = {}
+    bedrooms = _categories(filters, 'bedrooms', subject_home.get('bedrooms'))
+    if bedrooms is not None:
+        try:
+            categories['bedrooms'] = [float(value) for value in bedrooms]
+        except (TypeError, ValueError):
+            raise ValueError('Filter bedrooms must be a count, a list of counts or "same"')
+    dwelling_types = _categories(filters, 'dwelling_type', subject_home.get('dwelling_type'))
+    if dwelling_types is not None:
+        if not all(isinstance(value, (str, bool)) for value in dwelling_types):
+            raise ValueError('Filter dwelling_type must be a type, a list of types or "same"')
+        categories['dwelling_type'] = dwelling_types
+    has_private_pool = filters.get('has_private_pool')
+    if has_private_pool is not None:
+        if not isinstance(has_private_pool, bool):
+            raise ValueError('Filter has_private_pool must be true or false')
+        categories['has_private_pool'] = [has_private_pool]
+
+    if not ranges and not categories:
+        return {}
+    return {'ranges': ranges, 'categories': categories}
+
+
+def candidate_rows(corpus: SalesCorpus, constraints: Dict[str, Any]) -> Optional[np.ndarray]:
+    """
+    Ascending corpus rows satisfying every constraint from parse_filters(),
+    or None when there are no constraints.
+    """
+    if not constraints:
+        return None
+    size = len(corpus)
+    ranges = constraints['ranges']
+    bitmaps = [bitmap_index(corpus, column).bitmap(values) for column, values in constraints['categories'].items()]
+
+    if ranges:
+        # Start from the smallest range match; check the rest on those rows only
+        matches = {
+            column: sorted_index(corpus, column).range(low, high, limit=size)
+            for column, (low, high) in ranges.items()
+        }
+        first = min(matches, key=lambda column: len(matches[column]))
+        rows = np.sort(matches[first])
+        for column, (low, high) in ranges.items():
+            if column == first or len(rows) == 0:
+                continue
+            values = corpus.sale_days[rows] if column == 'sale_day' else corpus.features[rows, STATIC_FEATURE_NAMES.index(column)]
+            keep = np.ones(len(rows), dtype=bool)
+            if low is not None:
+                keep &= values >= low
+            if high is not None:
+                keep &= values <= high
+            rows = rows[keep]
+        for bitmap in bitmaps:
+            rows = rows[bitmap_contains(bitmap, rows)]
+        return rows
+
+    combined = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        combined = combined & bitmap
+    return bitmap_rows(combined, size)
+
+
+_NUMERIC_FILTERS = ('sold_within_days', 'sqft_within_pct', 'sqft_min', 'sqft_max', 'year_built_min', 'year_built_max')
+
+
+def filters_from_query(args: Mapping[str, str]) -> Dict[str, Any]:
+    """
+    Filters from query-string parameters (e.g. ?sqft_min=1500&bedrooms=3,4).
+
+    Lists are comma-separated; has_private_pool takes true/false. Parameters
+    that are not filter names are ignored.
+
+    Raises:
+        ValueError: A filter value is malformed
+    """
+    filters: Dict[str, Any] = {}
+    for key in _NUMERIC_FILTERS:
+        if args.get(key) not in (None, ''):
+            try:
+                filters[key] = float(args[key])
+            except ValueError:
+                raise ValueError(f"Filter {key} must be a number")
+    for key in ('bedrooms', 'dwelling_type'):
+        if args.get(key) not in (None, ''):
+            values = [value.strip() for value in args[key].split(',') if value.strip()]
+            filters[key] = values[0] if values == ['same'] else values
+    if 'bedrooms' in filters and filters['bedrooms'] != 'same':
+        try:
+            filters['bedrooms'] = [float(value) for value in filters['bedrooms']]
+        except ValueError:
+            raise ValueError('Filter bedrooms must be a comma-separated list of counts')
+    if args.get('has_private_pool') not in (None, ''):
+        value = args['has_private_pool'].lower()
+        if value not in ('true', 'false', '1', '0'):
+            raise ValueError('Filter has_private_pool must be true or false')
+        filters['has_private_pool'] = value in ('true', '1')
+    return filters
+
+
+def filter_comparables(
+    comparable_sales: List[Dict[str, Any]],
+    constraints: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Apply constraints to a client-supplied list of comparables."""
+    if not constraints or not comparable_sales:
+        return comparable_sales
+    rows = candidate_rows(build_corpus(comparable_sales), constraints)
+    return [comparable_sales[int(row)] for row in rows]
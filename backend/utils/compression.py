@@ -0,0 +1,148 @@
+"""
+Negotiated response compression (gzip, and brotli when installed).
+
+Large analysis responses are highly repetitive JSON, so they compress well.
+Bodies below a size threshold are sent as-is, since compressing them costs
+more CPU than the bytes it saves. Cached responses keep their compressed
+variants so repeated hits are not recompressed.
+"""
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are not compressed
+DEFAULT_MIN_BYTES = 1024
+
+# gzip level (1-9) and brotli quality (0-11); mid-range trades CPU for ratio
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5
+
+# Number of cached response bodies kept by ResponseBodyCache
+DEFAULT_CACHE_ENTRIES = 256
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+MIN_BYTES = _env_int('RESPONSE_COMPRESSION_MIN_BYTES', DEFAULT_MIN_BYTES)
+GZIP_LEVEL = _env_int('RESPONSE_GZIP_LEVEL', DEFAULT_GZIP_LEVEL)
+BROTLI_QUALITY = _env_int('RESPONSE_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)
+
+
+def supported_encodings() -> Tuple[str, ...]:
+    """Content encodings this server can produce, in preference order."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a content encoding from an Accept-Encoding header.
+
+    Returns:
+        'br', 'gzip', or None for identity. Encodings with q=0 are never
+        chosen; on equal quality brotli wins over gzip.
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        fields = part.strip().split(';')
+        coding = fields[0].strip().lower()
+        quality = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    best, best_quality = None, 0.0
+    for coding in supported_encodings():
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress_body(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """
+    Compress a body with the given content encoding.
+
+    Args:
+        body: Uncompressed bytes
+        encoding: 'gzip' or 'br'
+        level: gzip level / brotli quality (defaults from the environment)
+    """
+    if encoding == 'gzip':
+        # mtime=0 keeps output deterministic, so cached variants are byte-identical
+        return gzip.compress(body, compresslevel=GZIP_LEVEL if level is None else level, mtime=0)
+    if encoding == 'br':
+        if brotli is None:
+            raise RuntimeError("brotli is not installed")
+        return brotli.compress(body, quality=BROTLI_QUALITY if level is None else level)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+class CachedBody:
+    """An encoded response body plus its lazily created compressed variants."""
+
+    def __init__(self, body: bytes, mimetype: str):
+        self.body = body
+        self.mimetype = mimetype
+        self._variants: Dict[str, bytes] = {}
+
+    def variant(self, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """
+        Body for the negotiated encoding, compressing at most once per encoding.
+
+        Returns:
+            (bytes, content encoding or None when sent uncompressed)
+        """
+        if encoding is None or len(self.body) < MIN_BYTES:
+            return self.body, None
+        compressed = self._variants.get(encoding)
+        if compressed is None:
+            compressed = compress_body(self.body, encoding)
+            self._variants[encoding] = compressed
+        return compressed, encoding
+
+
+class ResponseBodyCache:
+    """Thread-safe LRU cache of CachedBody objects."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Hashable, CachedBody]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, entry: CachedBody) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,782 @@
+"""
+Prepared, array-backed view of the comparable sales corpus.
+
+The raw listings are normalized once and turned into NumPy columns (feature
+matrix, sale prices, sale dates) plus a spatial index, so the KNN selector can
+score the whole corpus in a few vectorized operations instead of rebuilding
+per-comp feature dicts on every request.
+"""
+import hashlib
+import contextlib
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+import numpy as np
+
+from .data_loader import normalize_valid_comparables
+from .spatial_index import GridSpatialIndex
+from .sorted_index import SortedColumnIndex
+from .storage import SalesStorage, sales_storage_from_env
+
+# Feature order used by the corpus matrix. Mirrors ComparableSelector._extract_features.
+FEATURE_NAMES = (
+    'latitude',
+    'longitude',
+    'sqft',
+    'bedrooms',
+    'bathrooms',
+    'year_built',
+    'has_pool',
+    'days_since_sale',
+)
+
+# Features stored as-is in the corpus; days_since_sale is derived from sale_days at query time
+STATIC_FEATURE_NAMES = FEATURE_NAMES[:-1]
+
+# Sale attributes outside the KNN features that the filter indexes, hedonic
+# model, market index and market routing read. They are kept as columns (the
+# categorical ones as CodeBook codes) so building those never decodes the
+# records, which shared-memory workers hold as packed JSON.
+NUMERIC_ATTRIBUTE_NAMES = ('has_private_pool', 'garage_spaces', 'lot_sqft')
+CODED_ATTRIBUTE_NAMES = ('zip_code', 'dwelling_type', 'market', 'brokerage_region_identifier')
+
+SECONDS_PER_DAY = 86400
+
+# Same fallback ComparableSelector uses when a sale date cannot be parsed
+DEFAULT_DAYS_SINCE_SALE = 90
+
+
+def today_epoch_day() -> int:
+    """Current UTC date as days since the Unix epoch."""
+    return int(datetime.now(timezone.utc).timestamp() // SECONDS_PER_DAY)
+
+
+def parse_sale_day(property_data: Dict[str, Any], today: Optional[int] = None) -> int:
+    """
+    Resolve a property's sale date to an epoch day.
+
+    Follows the same precedence as ComparableSelector._extract_features:
+    an explicit non-zero `days_since_sale`, then `sale_date`, then the
+    90-day default when the date is empty or can't be parsed. Properties
+    with no `sale_date` key at all (subjects) sold today. Timezone-aware
+    dates are converted to UTC; naive ones are taken as UTC.
+    """
+    if today is None:
+        today = today_epoch_day()
+
+    days_since_sale = property_data.get('days_since_sale', 0)
+    if days_since_sale:
+        return today - int(days_since_sale)
+
+    if 'sale_date' not in property_data:
+        return today
+    sale_date = property_data['sale_date']
+    if not sale_date:
+        return today - DEFAULT_DAYS_SINCE_SALE
+
+    try:
+        parsed = datetime.fromisoformat(str(sale_date).replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            from dateutil import parser
+            parsed = parser.parse(sale_date)
+        except Exception:
+            return today - DEFAULT_DAYS_SINCE_SALE
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    else:
+        parsed = parsed.astimezone(timezone.utc)
+    return int(parsed.timestamp() // SECONDS_PER_DAY)
+
+
+def extract_static_features(property_data: Dict[str, Any]) -> List[float]:
+    """Extract the static KNN features for one property, in STATIC_FEATURE_NAMES order."""
+    current_year = datetime.now().year
+    return [
+        float(property_data.get('latitude', 0) or 0),
+        float(property_data.get('longitude', 0) or 0),
+        float(property_data.get('sqft', property_data.get('square_footage', 0)) or 0),
+        float(property_data.get('bedrooms', 0) or 0),
+        float(property_data.get('bathrooms', 0) or 0),
+        float(property_data.get('year_built', current_year) or 0),
+        float(1 if (property_data.get('has_private_pool') or property_data.get('has_community_pool')) else 0),
+    ]
+
+
+def extract_numeric_attributes(property_data: Dict[str, Any]) -> List[float]:
+    """Numeric attributes of one property, in NUMERIC_ATTRIBUTE_NAMES order."""
+    return [
+        # Normalized comparables carry the private pool flag as `has_pool`
+        1.0 if property_data.get('has_private_pool', property_data.get('has_pool')) else 0.0,
+        float(property_data.get('garage_spaces') or 0),
+        float(property_data.get('lot_sqft') or 0),
+    ]
+
+
+class CodeBook:
+    """
+    Append-only table of the values of the coded attribute columns; a value's
+    int32 code is its position (code 0 is None).
+
+    Snapshots appended from one another share one code book: values are only
+    ever added, so the codes of every snapshot stay valid.
+    """
+
+    def __init__(self, values: Sequence[Any] = (None,)):
+        self.values = list(values)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, rows: List[List[Any]]) -> np.ndarray:
+        """(len(rows), len(CODED_ATTRIBUTE_NAMES)) int32 codes, adding unseen values."""
+        codes = np.zeros((len(rows), len(CODED_ATTRIBUTE_NAMES)), dtype=np.int32)
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                if not isinstance(value, (str, int, float, bool, type(None))):
+                    value = str(value)
+                code = self._codes.get(value)
+                if code is None:
+                    code = self._codes[value] = len(self.values)
+                    self.values.append(value)
+                codes[i, j] = code
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Values of the given codes, as an object array."""
+        # Snapshot the list first: the newest corpus may be adding values
+        known = list(self.values)
+        values = np.empty(len(known), dtype=object)
+        values[:] = known
+        return values[codes]
+
+    def copy(self) -> 'CodeBook':
+        return CodeBook(self.values)
+
+
+def _coded_attribute_rows(comparables: List[Dict[str, Any]]) -> List[List[Any]]:
+    return [[comp.get(name) for name in CODED_ATTRIBUTE_NAMES] for comp in comparables]
+
+
+def _numeric_attribute_matrix(comparables: List[Dict[str, Any]]) -> np.ndarray:
+    if not comparables:
+        return np.empty((0, len(NUMERIC_ATTRIBUTE_NAMES)), dtype=np.float64)
+    return np.array([extract_numeric_attributes(c) for c in comparables], dtype=np.float64)
+
+
+class FeatureStats:
+    """
+    Running mean/variance of the KNN features, in FEATURE_NAMES order.
+
+    Statistics are tracked over the static features plus the sale epoch day,
+    which has the same spread as days_since_sale. New rows are folded in with
+    the Welford/Chan update, so ingesting a sale is O(features) instead of a
+    pass over the whole corpus.
+    """
+
+    def __init__(self, count: int, mean: np.ndarray, m2: np.ndarray):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_columns(cls, features: np.ndarray, sale_days: np.ndarray) -> 'FeatureStats':
+        """Compute statistics for a whole corpus in one vectorized pass."""
+        matrix = np.column_stack([features, sale_days.astype(np.float64)])
+        if len(matrix) == 0:
+            return cls(0, np.zeros(len(FEATURE_NAMES)), np.zeros(len(FEATURE_NAMES)))
+        mean = matrix.mean(axis=0)
+        m2 = ((matrix - mean) ** 2).sum(axis=0)
+        return cls(len(matrix), mean, m2)
+
+    def updated(self, features: np.ndarray, sale_days: np.ndarray) -> 'FeatureStats':
+        """Return new statistics with the given rows folded in (Chan's parallel update)."""
+        batch = FeatureStats.from_columns(features, sale_days)
+        if batch.count == 0:
+            return self
+        if self.count == 0:
+            return batch
+
+        count = self.count + batch.count
+        delta = batch.mean - self.mean
+        mean = self.mean + delta * batch.count / count
+        m2 = self.m2 + batch.m2 + delta ** 2 * self.count * batch.count / count
+        return FeatureStats(count, mean, m2)
+
+    def mean_std(self, today: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Z-score parameters for the full feature vector (population std, zero std -> 1).
+
+        Returns:
+            (mean, std) arrays in FEATURE_NAMES order
+        """
+        if today is None:
+            today = today_epoch_day()
+
+        mean = self.mean.copy()
+        # days_since_sale = today - sale_day
+        mean[-1] = today - mean[-1]
+
+        std = np.sqrt(self.m2 / self.count) if self.count else np.ones(len(FEATURE_NAMES))
+        std[std == 0] = 1.0
+        return mean, std
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'stats_count': np.array([self.count], dtype=np.int64),
+            'stats_mean': self.mean,
+            'stats_m2': self.m2,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'FeatureStats':
+        return cls(int(arrays['stats_count'][0]), arrays['stats_mean'], arrays['stats_m2'])
+
+
+class NormalizedFeatures:
+    """
+    Z-score parameters and pre-standardized feature matrix for one corpus version.
+
+    The days_since_sale column is standardized relative to the mean sale day,
+    (mean_sale_day - sale_day) / std, which equals the z-score of days_since_sale
+    for any valuation date, so the matrix stays valid as time passes.
+    """
+
+    def __init__(self, mean: np.ndarray, std: np.ndarray, matrix: np.ndarray):
+        # mean is in storage space: static features + mean sale epoch day
+        self.mean = mean
+        self.std = std
+        self.matrix = matrix
+
+    @classmethod
+    def from_corpus(cls, corpus: 'SalesCorpus') -> 'NormalizedFeatures':
+        stats = corpus.stats
+        mean = stats.mean.copy()
+        std = np.sqrt(stats.m2 / stats.count) if stats.count else np.ones(len(FEATURE_NAMES))
+        std[std == 0] = 1.0
+
+        matrix = np.empty((len(corpus), len(FEATURE_NAMES)), dtype=np.float64)
+        matrix[:, :-1] = (corpus.features - mean[:-1]) / std[:-1]
+        matrix[:, -1] = (mean[-1] - corpus.sale_days) / std[-1]
+        return cls(mean, std, matrix)
+
+    def standardize(self, vector: np.ndarray, today: Optional[int] = None) -> np.ndarray:
+        """Standardize feature vector(s) in FEATURE_NAMES order (days as days_since_sale)."""
+        if today is None:
+            today = today_epoch_day()
+        mean = self.mean.copy()
+        mean[-1] = today - mean[-1]
+        return (np.asarray(vector, dtype=np.float64) - mean) / self.std
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'normalized_mean': self.mean,
+            'normalized_std': self.std,
+            'normalized_matrix': self.matrix,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'NormalizedFeatures':
+        return cls(arrays['normalized_mean'], arrays['normalized_std'], arrays['normalized_matrix'])
+
+
+class ColumnBuffers:
+    """
+    Growable backing storage for the corpus columns (feature matrix, sale
+    days, prices, attribute columns), keyed by name.
+
+    Capacity doubles when full, so appends are amortized O(1). Snapshots hold
+    views of the first `n` rows; rows written later are never visible to them.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], size: int):
+        self.columns = columns
+        self.size = size
+
+    @classmethod
+    def from_arrays(cls, columns: Dict[str, np.ndarray], extra: int) -> 'ColumnBuffers':
+        size = len(columns['prices'])
+        capacity = max(16, (size + extra) * 2)
+        buffers = cls(
+            {
+                name: np.empty((capacity,) + column.shape[1:], dtype=column.dtype)
+                for name, column in columns.items()
+            },
+            size
+        )
+        for name, column in columns.items():
+            buffers.columns[name][:size] = column
+        return buffers
+
+    @property
+    def capacity(self) -> int:
+        return len(self.columns['prices'])
+
+    def append(self, columns: Dict[str, np.ndarray]) -> 'ColumnBuffers':
+        """Write rows after `size`; returns self, or a larger copy if capacity ran out."""
+        count = len(columns['prices'])
+        buffers = self
+        if self.size + count > self.capacity:
+            buffers = ColumnBuffers.from_arrays(self.views(), count)
+        end = buffers.size + count
+        for name, column in columns.items():
+            buffers.columns[name][buffers.size:end] = column
+        buffers.size = end
+        return buffers
+
+    def views(self) -> Dict[str, np.ndarray]:
+        """Every column's first `size` rows."""
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+
+class SalesCorpus:
+    """
+    Columnar snapshot of the comparable sales corpus.
+
+    Attributes:
+        records: Sequence of normalized comparable dicts (row i matches array row i;
+            may hold extra rows appended after this snapshot, use record())
+        features: (n, len(STATIC_FEATURE_NAMES)) float64 feature matrix
+        sale_days: (n,) int64 sale dates as epoch days
+        prices: (n,) float64 sale prices
+        spatial_index: Grid index over the latitude/longitude columns
+        date_index: Sorted index over sale_days
+        stats: Running feature statistics for z-score normalization
+        version: Content hash identifying this corpus
+        source_signature: Signature of the data files the corpus was built from
+        market: Market shard the sales belong to ('' for the default corpus)
+        attributes: (n, len(NUMERIC_ATTRIBUTE_NAMES)) float64 attribute columns
+        codes: (n, len(CODED_ATTRIBUTE_NAMES)) int32 codes of the categorical
+            attributes in `codebook` (both derived from records when omitted)
+    """
+
+    def __init__(
+        self,
+        records: Sequence[Dict[str, Any]],
+        features: np.ndarray,
+        sale_days: np.ndarray,
+        prices: np.ndarray,
+        spatial_index: GridSpatialIndex,
+        version: str,
+        source_signature: str = '',
+        date_index: Optional[SortedColumnIndex] = None,
+        stats: Optional[FeatureStats] = None,
+        market: str = '',
+        attributes: Optional[np.ndarray] = None,
+        codes: Optional[np.ndarray] = None,
+        codebook: Optional[CodeBook] = None
+    ):
+        if attributes is None or codes is None or codebook is None:
+            rows = [records[row] for row in range(len(prices))]
+            attributes = _numeric_attribute_matrix(rows)
+            codebook = CodeBook()
+            codes = codebook.encode(_coded_attribute_rows(rows))
+        self.records = records
+        self.attributes = attributes
+        self.codes = codes
+        self.codebook = codebook
+        self.features = features
+        self.sale_days = sale_days
+        self.prices = prices
+        self.spatial_index = spatial_index
+        self.date_index = date_index if date_index is not None else SortedColumnIndex.from_values(sale_days)
+        self.stats = stats if stats is not None else FeatureStats.from_columns(features, sale_days)
+        self.version = version
+        self.source_signature = source_signature
+        self.market = market
+        self._buffers: Optional[ColumnBuffers] = None
+        self._normalized: Optional[NormalizedFeatures] = None
+        self._lazy_indexes: Dict[str, Any] = {}
+        # Parent snapshots' lazy indexes, for those that can be updated with appended rows
+        self._inherited_indexes: Dict[str, Any] = {}
+        self._updatable_indexes: set = set()
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Return the normalized comparable dict for a row."""
+        return self.records[row]
+
+    def iter_records(self):
+        """Iterate over this snapshot's records only."""
+        for row in range(len(self)):
+            yield self.records[row]
+
+    def attribute(self, name: str, start: int = 0) -> np.ndarray:
+        """Numeric attribute column (see NUMERIC_ATTRIBUTE_NAMES) for rows [start, len(self))."""
+        return self.attributes[start:, NUMERIC_ATTRIBUTE_NAMES.index(name)]
+
+    def attribute_codes(self, name: str, start: int = 0) -> np.ndarray:
+        """CodeBook codes of a categorical attribute (see CODED_ATTRIBUTE_NAMES) for rows [start, len(self))."""
+        return self.codes[start:, CODED_ATTRIBUTE_NAMES.index(name)]
+
+    def coded_attribute(self, name: str, start: int = 0) -> np.ndarray:
+        """Values of a categorical attribute for rows [start, len(self)), as an object array."""
+        return self.codebook.decode(self.attribute_codes(name, start))
+
+    def normalized(self) -> NormalizedFeatures:
+        """
+        Z-score parameters and standardized matrix for this corpus version.
+
+        Computed on first use and cached on the snapshot, so every request
+        against the same version reuses them.
+        """
+        normalized = self._normalized
+        if normalized is None:
+            normalized = NormalizedFeatures.from_corpus(self)
+            self._normalized = normalized
+        return normalized
+
+    def lazy_index(self, name: str, build, update=None):
+        """
+        Secondary index cached on this snapshot, built by `build()` on first use
+        (e.g. the attribute indexes in utils.comp_filters).
+
+        When given, `update(previous)` derives the index from the one built on
+        an earlier snapshot this one was appended from, instead of rebuilding.
+        Only indexes requested with an `update` are passed on to appended
+        snapshots; the others are rebuilt there, so no stale copy is kept.
+        """
+        index = self._lazy_indexes.get(name)
+        if index is None:
+            previous = self._inherited_indexes.pop(name, None)
+            index = update(previous) if previous is not None and update is not None else build()
+            self._lazy_indexes[name] = index
+            if update is not None:
+                self._updatable_indexes.add(name)
+        return index
+
+    def rows_in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> np.ndarray:
+        """Candidate rows in grid cells overlapping the box (superset; filter on coordinates)."""
+        return self.spatial_index.query_bbox(min_lat, min_lon, max_lat, max_lon, limit=len(self))
+
+    def rows_sold_between(self, first_day: Optional[int] = None, last_day: Optional[int] = None) -> np.ndarray:
+        """Rows whose sale epoch day is within [first_day, last_day] (None = unbounded)."""
+        return self.date_index.range(first_day, last_day, limit=len(self))
+
+    def days_since_sale(self, today: Optional[int] = None) -> np.ndarray:
+        """Days between each sale and `today` (defaults to the current UTC day)."""
+        if today is None:
+            today = today_epoch_day()
+        return (today - self.sale_days).astype(np.float64)
+
+    def feature_matrix(self, today: Optional[int] = None) -> np.ndarray:
+        """Full KNN feature matrix in FEATURE_NAMES order, including days_since_sale."""
+        return np.column_stack([self.features, self.days_since_sale(today)])
+
+    def append(self, comparables: List[Dict[str, Any]], source_signature: str = '') -> 'SalesCorpus':
+        """
+        Return a new snapshot with the given normalized comparables appended.
+
+        The new snapshot shares column buffers, records and index structures with
+        this one; this snapshot is left unchanged (its arrays are views of its own
+        rows only). Cost is amortized O(log n) per appended sale.
+
+        Args:
+            comparables: Normalized comparables to add
+            source_signature: Data file signature after the append was persisted
+        """
+        if not comparables:
+            return self
+
+        size = len(self)
+        today = today_epoch_day()
+        features = np.array([extract_static_features(c) for c in comparables], dtype=np.float64)
+        sale_days = np.array([parse_sale_day(c, today) for c in comparables], dtype=np.int64)
+        prices = np.array([float(c.get('sale_price', 0) or 0) for c in comparables], dtype=np.float64)
+
+        # Only the newest snapshot can extend the shared structures in place
+        owns_tail = (
+            self._buffers is not None and self._buffers.size == size
+            and isinstance(self.records, list) and len(self.records) == size
+        )
+        codebook = self.codebook if owns_tail else self.codebook.copy()
+        columns = {
+            'features': features,
+            'sale_days': sale_days,
+            'prices': prices,
+            'attributes': _numeric_attribute_matrix(comparables),
+            'codes': codebook.encode(_coded_attribute_rows(comparables)),
+        }
+        if owns_tail:
+            buffers = self._buffers.append(columns)
+            records = self.records
+            spatial_index = self.spatial_index
+            date_index = self.date_index
+        else:
+            buffers = ColumnBuffers.from_arrays({
+                'features': self.features,
+                'sale_days': self.sale_days,
+                'prices': self.prices,
+                'attributes': self.attributes,
+                'codes': self.codes,
+            }, len(prices))
+            buffers = buffers.append(columns)
+            records = [self.record(row) for row in range(size)]
+            spatial_index = self.spatial_index.merged()
+            date_index = self.date_index.merged()
+            if spatial_index is self.spatial_index:
+                spatial_index = GridSpatialIndex(
+                    SortedColumnIndex(self.spatial_index.cells.values, self.spatial_index.cells.row_ids),
+                    self.spatial_index.origin,
+                    self.spatial_index.cell_degrees
+                )
+            if date_index is self.date_index:
+                date_index = SortedColumnIndex(self.date_index.values, self.date_index.row_ids)
+
+        records.extend(comparables)
+        for offset in range(len(prices)):
+            row = size + offset
+            spatial_index.insert(row, features[offset, 0], features[offset, 1])
+            date_index.insert(int(sale_days[offset]), row)
+
+        # Fold pending index rows into the sorted base once the buffer gets large
+        if spatial_index.needs_merge():
+            spatial_index = spatial_index.merged()
+        if date_index.needs_merge():
+            date_index = date_index.merged()
+
+        digest = hashlib.sha1(self.version.encode('utf-8'))
+        for column in (features, sale_days, prices):
+            digest.update(np.ascontiguousarray(column).tobytes())
+
+        views = buffers.views()
+        corpus = SalesCorpus(
+            records=records,
+            features=views['features'],
+            sale_days=views['sale_days'],
+            prices=views['prices'],
+            spatial_index=spatial_index,
+            version=digest.hexdigest()[:16],
+            source_signature=source_signature or self.source_signature,
+            date_index=date_index,
+            stats=self.stats.updated(features, sale_days),
+            market=self.market,
+            attributes=views['attributes'],
+            codes=views['codes'],
+            codebook=codebook
+        )
+        corpus._buffers = buffers
+        corpus._inherited_indexes = {
+            **self._inherited_indexes,
+            **{name: index for name, index in self._lazy_indexes.items() if name in self._updatable_indexes}
+        }
+        return corpus
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Export the numeric columns, statistics and indexes as named arrays."""
+        arrays = {
+            'features': self.features,
+            'sale_days': self.sale_days,
+            'prices': self.prices,
+            'attributes': self.attributes,
+            'codes': self.codes,
+        }
+        arrays.update(self.stats.to_arrays())
+        arrays.update(self.normalized().to_arrays())
+        arrays.update(self.spatial_index.to_arrays())
+        arrays.update(self.date_index.to_arrays('date'))
+        return arrays
+
+
+def compute_corpus_version(features: np.ndarray, sale_days: np.ndarray, prices: np.ndarray) -> str:
+    """Content hash of the corpus columns; identical data gives the same version in every worker."""
+    digest = hashlib.sha1()
+    for column in (features, sale_days, prices):
+        digest.update(np.ascontiguousarray(column).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def build_corpus(comparables: List[Dict[str, Any]], source_signature: str = '', market: str = '') -> SalesCorpus:
+    """
+    Build a SalesCorpus from normalized comparable properties.
+
+    Args:
+        comparables: Normalized comparables (see normalize_comparable_property)
+        source_signature: Optional signature of the file the comparables came from
+        market: Market shard name, if the comparables are one market's sales
+
+    Returns:
+        SalesCorpus with feature matrix, price/date columns and spatial index
+    """
+    today = today_epoch_day()
+
+    if comparables:
+        features = np.array([extract_static_features(c) for c in comparables], dtype=np.float64)
+    else:
+        features = np.empty((0, len(STATIC_FEATURE_NAMES)), dtype=np.float64)
+    sale_days = np.array([parse_sale_day(c, today) for c in comparables], dtype=np.int64)
+    prices = np.array([float(c.get('sale_price', 0) or 0) for c in comparables], dtype=np.float64)
+
+    spatial_index = GridSpatialIndex.from_coordinates(features[:, 0], features[:, 1])
+    codebook = CodeBook()
+
+    return SalesCorpus(
+        records=comparables,
+        features=features,
+        sale_days=sale_days,
+        prices=prices,
+        spatial_index=spatial_index,
+        version=compute_corpus_version(features, sale_days, prices),
+        source_signature=source_signature,
+        market=market,
+        attributes=_numeric_attribute_matrix(comparables),
+        codes=codebook.encode(_coded_attribute_rows(comparables)),
+        codebook=codebook
+    )
+
+
+def load_sales_corpus(storage: Optional[SalesStorage] = None) -> SalesCorpus:
+    """
+    Load, normalize and index the sales records.
+
+    Args:
+        storage: Where the sales live (default: sales_storage_from_env(), the
+            JSON data files unless SALES_STORAGE=sqlite)
+    """
+    storage = storage or sales_storage_from_env()
+    signature = storage.signature()
+    return build_corpus(storage.load_comparables(), source_signature=signature)
+
+
+class CorpusProvider:
+    """
+    Hands out the current SalesCorpus snapshot to request handlers.
+
+    Snapshots are immutable. A reload builds a complete new corpus off the
+    request path and then swaps a single reference, so the read path is one
+    attribute load with no locks: in-flight requests keep the snapshot they
+    already hold, and new requests see the new one. When a SharedCorpusStore is
+    configured, reloads publish a new shared-memory generation instead.
+
+    Sales are read from and ingested into `storage` (JSON data files by
+    default, or SQLite; see utils.storage).
+    """
+
+    def __init__(self, shared_store=None, storage: Optional[SalesStorage] = None):
+        self.shared_store = shared_store
+        self.storage = storage or sales_storage_from_env()
+        self._corpus: Optional[SalesCorpus] = None
+        # Serializes reloads only; readers never take it
+        self._reload_lock = threading.Lock()
+        # Signature of a data file that produced an empty corpus; not retried until it changes
+        self._rejected_signature: Optional[str] = None
+
+    def get(self) -> SalesCorpus:
+        """Return the current corpus snapshot, building it on first use."""
+        corpus = self._current()
+        if corpus is None:
+            corpus = self.reload()
+        return corpus
+
+    def _current(self) -> Optional[SalesCorpus]:
+        if self.shared_store is not None:
+            return self.shared_store.current()
+        return self._corpus
+
+    def get_current_version(self) -> Optional[str]:
+        """Version of the current snapshot, or None if nothing is loaded yet."""
+        corpus = self._current()
+        return corpus.version if corpus is not None else None
+
+    def is_stale(self) -> bool:
+        """True when the data file no longer matches the current snapshot."""
+        corpus = self._current()
+        if corpus is None:
+            return True
+        return self.storage.signature() not in (corpus.source_signature, self._rejected_signature)
+
+    def _publish_lock(self):
+        """Cross-process lock of the shared store (no-op without one)."""
+        return self.shared_store.lock() if self.shared_store is not None else contextlib.nullcontext()
+
+    def reload(self, force: bool = False) -> SalesCorpus:
+        """
+        Rebuild the corpus from the data file and swap it in.
+
+        Args:
+            force: Rebuild even if the data file signature is unchanged
+
+        Returns:
+            The corpus snapshot that is current after the reload
+        """
+        with self._reload_lock, self._publish_lock():
+            current = self._current()
+            signature = self.storage.signature()
+            if not force and current is not None and signature in (current.source_signature, self._rejected_signature):
+                return current
+
+            corpus = load_sales_corpus(self.storage)
+
+            # A half-written data file parses as empty; keep serving the old snapshot
+            if current is not None and len(corpus) == 0 and len(current) > 0:
+                print("Warning: reloaded sales corpus is empty, keeping previous snapshot")
+                self._rejected_signature = corpus.source_signature
+                return current
+
+            if self.shared_store is not None:
+                self.shared_store.publish(corpus)
+                return self.shared_store.current()
+
+            # Single reference assignment: the atomic swap
+            self._corpus = corpus
+            return corpus
+
+    def ingest(self, listings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Append newly closed listings to the live corpus without a full reload.
+
+        Listings are persisted to storage (the write-ahead log for JSON) first, then appended to the
+        current snapshot (columns, indexes and running statistics) and swapped in.
+        With a shared-memory store the appended corpus is republished as a new
+        generation, which copies the arrays (O(n)) since segments are fixed-size;
+        the store's cross-process lock is held from reading the current
+        generation to publishing, so concurrent ingests in other workers are
+        never dropped. If storage changed since the current snapshot was built
+        (another writer), the corpus is reloaded instead of appended to.
+
+        Args:
+            listings: Raw listings in the PHOENIX_SALES_RECORDS.json schema
+
+        Returns:
+            Dict with accepted/rejected counts and the resulting corpus version/size
+        """
+        comparables = []
+        valid_listings = []
+        for listing in listings:
+            normalized, _ = normalize_valid_comparables([listing])
+            if normalized:
+                comparables.extend(normalized)
+                valid_listings.append(listing)
+        rejected = len(listings) - len(valid_listings)
+
+        with self._reload_lock, self._publish_lock():
+            current = self._current()
+            if current is None:
+                current = load_sales_corpus(self.storage)
+            unchanged = self.storage.signature() == current.source_signature
+
+            self.storage.append(valid_listings)
+            if unchanged:
+                corpus = current.append(comparables, source_signature=self.storage.signature())
+            else:
+                corpus = load_sales_corpus(self.storage)
+
+            if self.shared_store is not None:
+                self.shared_store.publish(corpus)
+                corpus = self.shared_store.current()
+            else:
+                self._corpus = corpus
+
+        return {
+            'accepted': len(comparables),
+            'rejected': rejected,
+            'corpus_version': corpus.version,
+            'corpus_size': len(corpus),
+        }
+
+
+def shared_memory_name_from_env() -> Optional[str]:
+    """Shared memory segment prefix from CORPUS_SHARED_MEMORY_NAME (unset = per-process corpus)."""
+    return os.environ.get('CORPUS_SHARED_MEMORY_NAME') or None
@@ -0,0 +1,131 @@
+"""
+Background watcher that hot-reloads the sales corpus when the data file changes.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from .corpus import CorpusProvider, SalesCorpus
+
+# Seconds between data file checks
+DEFAULT_POLL_INTERVAL = 5.0
+
+# Compact the sales write-ahead log into the main file once it reaches this size
+DEFAULT_WAL_COMPACT_BYTES = 1024 * 1024
+
+
+class CorpusWatcher:
+    """
+    Polls the sales records file and reloads the corpus off the request path.
+
+    Polling is a single os.stat per interval, which works the same on every
+    platform and filesystem (including network mounts where inotify doesn't).
+    The rebuild runs on the watcher thread; request handlers only ever see the
+    atomic snapshot swap done by CorpusProvider.reload().
+
+    `warmers` are called with every snapshot the watcher swaps in, so derived
+    per-version structures (e.g. the market index) are built here rather than
+    by the first request that needs them.
+    """
+
+    def __init__(
+        self,
+        provider: CorpusProvider,
+        interval: float = DEFAULT_POLL_INTERVAL,
+        wal_compact_bytes: int = DEFAULT_WAL_COMPACT_BYTES,
+        warmers: Optional[List[Callable[[SalesCorpus], Any]]] = None
+    ):
+        self.provider = provider
+        self.interval = interval
+        self.wal_compact_bytes = wal_compact_bytes
+        self.warmers = list(warmers or [])
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start the watcher thread (no-op if it is already running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='corpus-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the watcher thread and wait for it to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check_once(self) -> bool:
+        """
+        Reload the corpus if the data file changed.
+
+        Returns:
+            True if a new snapshot was swapped in
+        """
+        if not self.provider.is_stale():
+            return False
+
+        started = time.time()
+        before = self.provider.get_current_version()
+        corpus = self.provider.reload()
+        if corpus.version == before:
+            return False
+
+        print(f"Reloaded sales corpus: {len(corpus)} sales, version {corpus.version} "
+              f"({time.time() - started:.2f}s)")
+        self.warm(corpus)
+        return True
+
+    def warm(self, corpus: SalesCorpus) -> None:
+        """Run the warmers on a snapshot; a failing warmer is reported and skipped."""
+        for warmer in self.warmers:
+            try:
+                warmer(corpus)
+            except Exception as e:
+                print(f"Error warming sales corpus: {e}")
+
+    def compact_if_needed(self) -> int:
+        """
+        Compact the sales write-ahead log once it reaches `wal_compact_bytes`
+        (storage backends without a WAL never have pending bytes).
+
+        The next check_once() then rebuilds the corpus from the compacted file,
+        which also folds pending index inserts into fresh sorted indexes.
+
+        Returns:
+            Number of listings compacted
+        """
+        storage = self.provider.storage
+        if storage.pending_bytes() < self.wal_compact_bytes:
+            return 0
+        compacted = storage.compact()
+        if compacted:
+            print(f"Compacted {compacted} ingested sales into the sales records file")
+        return compacted
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.compact_if_needed()
+                self.check_once()
+            except Exception as e:
+                print(f"Error reloading sales corpus: {e}")
+
+
+def wal_compact_bytes_from_env() -> int:
+    """WAL compaction threshold from SALES_WAL_COMPACT_BYTES."""
+    try:
+        return int(os.environ.get('SALES_WAL_COMPACT_BYTES', DEFAULT_WAL_COMPACT_BYTES))
+    except ValueError:
+        return DEFAULT_WAL_COMPACT_BYTES
+
+
+def poll_interval_from_env() -> float:
+    """Watcher interval from CORPUS_WATCH_INTERVAL (seconds, 0 disables the watcher)."""
+    try:
+        return float(os.environ.get('CORPUS_WATCH_INTERVAL', DEFAULT_POLL_INTERVAL))
+    except ValueError:
+        return DEFAULT_POLL_INTERVAL
@@ -3,12 +3,38 @@ Data loader utility to read and parse JSON files from the data directory.
 """
 import json
 import os
-from typing import Dict, List, Any
+import threading
+import uuid
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: WAL writes are only serialized within one process
+    fcntl = None
 
 # Get the project root directory
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
 
+SALES_RECORDS_FILE = 'PHOENIX_SALES_RECORDS.json'
+
+# Every "<MARKET>_SALES_RECORDS.json" in the data directory is one market shard
+SALES_RECORDS_SUFFIX = '_SALES_RECORDS.json'
+
+# Newly ingested listings are appended here (one JSON listing per line) and
+# periodically compacted into SALES_RECORDS_FILE
+SALES_WAL_FILE = 'PHOENIX_SALES_RECORDS.wal.jsonl'
+
+# Key of the marker line compaction writes to a WAL, and of the matching
+# token in the records file: WAL lines up to the marker are already merged
+WAL_COMPACTION_KEY = 'wal_compaction'
+
+# Serialize WAL appends and compaction within this process, per WAL file
+_wal_locks: Dict[str, threading.Lock] = {}
+
+# Tuned KNN weights written by tune_weights.py (optional)
+KNN_WEIGHTS_FILE = 'knn_weights.json'
+
 
 def load_subject_property() -> Dict[str, Any]:
     """Load the subject property details from SUBJECT_PROPERTY_DETAILS.json"""
@@ -42,19 +68,285 @@ def load_video_transcript() -> str:
         return ''
 
 
-def load_sales_records() -> List[Dict[str, Any]]:
-    """Load Phoenix sales records from PHOENIX_SALES_RECORDS.json"""
-    file_path = os.path.join(DATA_DIR, 'PHOENIX_SALES_RECORDS.json')
+def knn_weights_path() -> str:
+    """Path of the tuned weights file (KNN_WEIGHTS_FILE env var overrides the data directory default)."""
+    return os.environ.get('KNN_WEIGHTS_FILE') or os.path.join(DATA_DIR, KNN_WEIGHTS_FILE)
+
+
+def load_knn_weights(file_path: str = None) -> Dict[str, Any]:
+    """
+    Load tuned KNN settings written by tune_weights.py.
+    
+    Args:
+        file_path: Weights file (default: knn_weights_path())
+    
+    Returns:
+        {'version', 'feature_weights', 'num_comps', 'idw_power', ...}, or an
+        empty dict when no weights file exists (built-in defaults apply)
+    """
+    file_path = file_path or knn_weights_path()
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return data.get('listings', [])
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        print(f"Error parsing {file_path}: {e}")
+        return {}
+
+
+def records_file_market(path: str) -> Optional[str]:
+    """
+    Market of a sales records file or its write-ahead log, from the file
+    name (e.g. 'phoenix' for PHOENIX_SALES_RECORDS.json); None for other names.
+    """
+    name = os.path.basename(path)
+    for suffix in (SALES_RECORDS_SUFFIX, sales_wal_file(SALES_RECORDS_SUFFIX)):
+        if name.endswith(suffix) and len(name) > len(suffix):
+            return name[:-len(suffix)].lower()
+    return None
+
+
+def discover_market_files() -> Dict[str, str]:
+    """
+    Find the per-market sales record files in the data directory.
+
+    Returns:
+        {market: file name}, e.g. {'phoenix': 'PHOENIX_SALES_RECORDS.json'}
+    """
+    try:
+        names = sorted(os.listdir(DATA_DIR))
+    except FileNotFoundError:
+        return {}
+    return {
+        records_file_market(name): name
+        for name in names
+        if name.endswith(SALES_RECORDS_SUFFIX) and len(name) > len(SALES_RECORDS_SUFFIX)
+    }
+
+
+def sales_wal_file(records_file: str) -> str:
+    """Write-ahead log file name for a sales records file."""
+    return records_file[:-len('.json')] + '.wal.jsonl'
+
+
+def _load_sales_records_data(records_file: str) -> Dict[str, Any]:
+    file_path = os.path.join(DATA_DIR, records_file)
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except FileNotFoundError:
         print(f"Warning: {file_path} not found")
-        return []
+        return {}
     except json.JSONDecodeError as e:
         print(f"Error parsing {file_path}: {e}")
-        return []
+        return {}
+
+
+def load_sales_records(records_file: str = SALES_RECORDS_FILE) -> List[Dict[str, Any]]:
+    """Load sales records from a market file (default PHOENIX_SALES_RECORDS.json)"""
+    return _load_sales_records_data(records_file).get('listings', [])
+
+
+def load_sales_wal(wal_file: str = SALES_WAL_FILE, compaction: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Load listings appended to the sales write-ahead log (not yet compacted).
+
+    Args:
+        wal_file: Write-ahead log file name in the data directory
+        compaction: The records file's WAL_COMPACTION_KEY token; WAL lines up
+            to its marker were merged into the records file by a compaction
+            that stopped before truncating the WAL, and are skipped
+    """
+    file_path = os.path.join(DATA_DIR, wal_file)
+    entries = []
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    # A torn final line from a crash mid-append; skip it
+                    print(f"Error parsing {file_path}: {e}")
+    except FileNotFoundError:
+        pass
+
+    if compaction is not None:
+        for position in range(len(entries) - 1, -1, -1):
+            if is_wal_compaction_marker(entries[position]) and entries[position][WAL_COMPACTION_KEY] == compaction:
+                entries = entries[position + 1:]
+                break
+    return [entry for entry in entries if not is_wal_compaction_marker(entry)]
+
+
+def is_wal_compaction_marker(entry: Any) -> bool:
+    """True for the marker lines compact_sales_wal writes to a WAL (not listings)."""
+    return isinstance(entry, dict) and WAL_COMPACTION_KEY in entry
+
+
+def _file_signature(file_path: str) -> str:
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return ''
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def sales_records_signature(records_file: str = SALES_RECORDS_FILE) -> str:
+    """
+    Cheap change detector for the sales records and their write-ahead log.
+
+    Returns:
+        "<mtime_ns>:<size>" of the records file (default
+        PHOENIX_SALES_RECORDS.json), plus the same for its WAL when it exists;
+        an empty string if neither file exists
+    """
+    signature = _file_signature(os.path.join(DATA_DIR, records_file))
+    wal_signature = _file_signature(os.path.join(DATA_DIR, sales_wal_file(records_file)))
+    if wal_signature:
+        signature = f"{signature}|{wal_signature}"
+    return signature
+
+
+def subject_data_signature() -> str:
+    """Change detector for the subject property and video transcript files."""
+    return '|'.join(
+        _file_signature(os.path.join(DATA_DIR, name))
+        for name in ('SUBJECT_PROPERTY_DETAILS.json', 'PRE_WALK_VIDEO_TRANSCRIPTION.json')
+    )
+
+
+class _WalFileLock:
+    """Process-local lock plus an advisory file lock (where supported) on a market's WAL."""
+
+    def __init__(self, records_file: str = SALES_RECORDS_FILE):
+        self._path = os.path.join(DATA_DIR, sales_wal_file(records_file))
+        self._lock = _wal_locks.setdefault(self._path, threading.Lock())
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._handle = open(self._path, 'a', encoding='utf-8')
+        except BaseException:
+            self._lock.release()
+            raise
+        if fcntl is not None:
+            fcntl.flock(self._handle, fcntl.LOCK_EX)
+        return self._handle
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._handle, fcntl.LOCK_UN)
+            self._handle.close()
+        finally:
+            self._lock.release()
+
+
+def _durable_write(wal, payload: str) -> None:
+    wal.write(payload)
+    wal.flush()
+    os.fsync(wal.fileno())
+
+
+def append_sales_wal(listings: List[Dict[str, Any]], records_file: str = SALES_RECORDS_FILE) -> None:
+    """
+    Durably append raw listings to a market's sales write-ahead log.
+
+    Args:
+        listings: Listings in the PHOENIX_SALES_RECORDS.json `listings` schema
+        records_file: Market sales records file the WAL belongs to
+    """
+    if not listings:
+        return
+    payload = ''.join(json.dumps(listing, separators=(',', ':')) + '\n' for listing in listings)
+    with _WalFileLock(records_file) as wal:
+        _durable_write(wal, payload)
+
+
+def sales_wal_size(records_file: str = SALES_RECORDS_FILE) -> int:
+    """Size of a market's write-ahead log in bytes (0 if it doesn't exist)."""
+    try:
+        return os.path.getsize(os.path.join(DATA_DIR, sales_wal_file(records_file)))
+    except FileNotFoundError:
+        return 0
+
+
+def compact_sales_wal(records_file: str = SALES_RECORDS_FILE) -> int:
+    """
+    Merge a market's write-ahead log into its records file.
+
+    The merged file is written to a temporary file and atomically renamed over
+    the original, then the WAL is truncated. Readers therefore see either the
+    old file + WAL or the new file, never a partially written one.
+
+    Compaction is idempotent across crashes: a marker line with a fresh token
+    is appended to the WAL before merging, and the merged records file carries
+    the same token, so if the process dies between the rename and the
+    truncation, readers and the next compaction skip the WAL lines up to the
+    marker instead of adding those listings twice.
+
+    Args:
+        records_file: Market sales records file (default PHOENIX_SALES_RECORDS.json)
+
+    Returns:
+        Number of listings moved from the WAL into the main file
+    """
+    file_path = os.path.join(DATA_DIR, records_file)
+    with _WalFileLock(records_file) as wal:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {'listings': []}
+
+        pending = load_sales_wal(sales_wal_file(records_file), data.get(WAL_COMPACTION_KEY))
+        if pending:
+            token = uuid.uuid4().hex
+            _durable_write(wal, json.dumps({WAL_COMPACTION_KEY: token}) + '\n')
+
+            data.setdefault('listings', []).extend(pending)
+            data[WAL_COMPACTION_KEY] = token
+
+            tmp_path = file_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+
+        if os.fstat(wal.fileno()).st_size > 0:
+            wal.truncate(0)
+            wal.flush()
+            os.fsync(wal.fileno())
+
+    return len(pending)
+
+
+def normalize_valid_comparables(listings: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Normalize raw listings and drop ones unusable as comparables.
+
+    Returns:
+        (normalized comparables, number of listings rejected)
+    """
+    comparables = []
+    rejected = 0
+    for listing in listings:
+        try:
+            comparable = normalize_comparable_property(listing)
+            # Only include properties with valid data
+            if comparable['sqft'] > 0 and comparable['sale_price'] > 0:
+                comparables.append(comparable)
+            else:
+                rejected += 1
+        except Exception as e:
+            print(f"Error normalizing listing: {e}")
+            rejected += 1
+    return comparables, rejected
 
 
 def normalize_subject_property(property_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -126,29 +418,27 @@ def normalize_comparable_property(listing: Dict[str, Any]) -> Dict[str, Any]:
         'dwelling_type': property_details.get('dwelling_type', 'single_family'),
         'stories': property_details.get('exterior_stories', 1),
         'has_solar_panels': property_details.get('has_solar_panels', False),
+        'market': listing.get('market'),
+        'brokerage_region_identifier': listing.get('brokerage_region_identifier'),
+        'zip_code': address.get('zip'),
     }
 
 
-def get_all_comparable_properties() -> List[Dict[str, Any]]:
+def get_all_comparable_properties(records_file: str = SALES_RECORDS_FILE) -> List[Dict[str, Any]]:
     """
     Load and normalize all sales records to use as comparable properties.
     
+    Includes listings still waiting in the write-ahead log.
+    
+    Args:
+        records_file: Market sales records file (default PHOENIX_SALES_RECORDS.json)
+    
     Returns:
         List of normalized comparable properties
     """
-    sales_records = load_sales_records()
-    comparables = []
-    
-    for listing in sales_records:
-        try:
-            comparable = normalize_comparable_property(listing)
-            # Only include properties with valid data
-            if comparable['sqft'] > 0 and comparable['sale_price'] > 0:
-                comparables.append(comparable)
-        except Exception as e:
-            print(f"Error normalizing listing: {e}")
-            continue
-    
+    data = _load_sales_records_data(records_file)
+    sales_records = data.get('listings', []) + load_sales_wal(sales_wal_file(records_file), data.get(WAL_COMPACTION_KEY))
+    comparables, _ = normalize_valid_comparables(sales_records)
     return comparables
 
 
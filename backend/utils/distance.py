@@ -0,0 +1,184 @@
+"""
+Blocked, memory-bounded weighted distance computations over the corpus.
+
+Corpus-wide operations (backtests, deduplication, clustering) need distances
+between many pairs of sales, but a full N x N float64 matrix for 200k sales
+is 320 GB. These helpers work in tiles sized to a memory budget, computing
+each tile with one matrix product (|a|^2 + |b|^2 - 2ab), and keep only what
+the caller needs (per-row top-k, or pairs within a radius), so the full
+matrix is never materialized.
+
+Distances are the KNN distances used by ComparableSelector: Euclidean over
+z-scored features, each scaled by sqrt(FEATURE_WEIGHTS).
+"""
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .corpus import FEATURE_NAMES, SalesCorpus
+
+# Bytes of distance tile a single computation may allocate
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Tile cells per byte of budget: the float64 tile plus one temporary of the same size
+_BYTES_PER_CELL = 16
+
+# Optional callable(row_ids, col_ids) -> bool mask (rows x cols) of allowed pairs
+PairFilter = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def scaled_features(corpus: SalesCorpus, feature_weights: Dict[str, float]) -> np.ndarray:
+    """
+    The corpus' z-scored feature matrix scaled by sqrt(weight) per column.
+
+    Plain Euclidean distance in this space is the weighted KNN distance.
+    """
+    weights = np.array([feature_weights.get(name, 0.0) for name in FEATURE_NAMES])
+    return corpus.normalized().matrix * np.sqrt(weights)
+
+
+def tile_shape(n_rows: int, n_cols: int, memory_budget: int = DEFAULT_MEMORY_BUDGET) -> Tuple[int, int]:
+    """
+    Rows and columns per tile so that a tile fits in the memory budget.
+
+    Whole rows are preferred (one matrix product per row block); columns are
+    only split when a single row of the full width would not fit.
+    """
+    cells = max(1, memory_budget // _BYTES_PER_CELL)
+    if n_cols <= cells:
+        return max(1, min(n_rows, cells // max(1, n_cols))), max(1, n_cols)
+    return 1, cells
+
+
+def squared_distance_tile(a: np.ndarray, b: np.ndarray, a_norms: np.ndarray = None, b_norms: np.ndarray = None) -> np.ndarray:
+    """Squared Euclidean distances between the rows of a and b, via |a|^2 + |b|^2 - 2ab."""
+    if a_norms is None:
+        a_norms = np.einsum('ij,ij->i', a, a)
+    if b_norms is None:
+        b_norms = np.einsum('ij,ij->i', b, b)
+    tile = a @ b.T
+    tile *= -2.0
+    tile += a_norms[:, None]
+    tile += b_norms[None, :]
+    np.maximum(tile, 0.0, out=tile)
+    return tile
+
+
+def iter_distance_tiles(
+    a: np.ndarray,
+    b: np.ndarray,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """
+    Yield (row_start, col_start, squared distance tile) covering a x b.
+
+    Each tile is only valid until the next one is requested.
+    """
+    row_block, col_block = tile_shape(len(a), len(b), memory_budget)
+    a_norms = np.einsum('ij,ij->i', a, a)
+    b_norms = np.einsum('ij,ij->i', b, b)
+    for row_start in range(0, len(a), row_block):
+        row_stop = min(len(a), row_start + row_block)
+        for col_start in range(0, len(b), col_block):
+            col_stop = min(len(b), col_start + col_block)
+            yield row_start, col_start, squared_distance_tile(
+                a[row_start:row_stop], b[col_start:col_stop],
+                a_norms[row_start:row_stop], b_norms[col_start:col_stop]
+            )
+
+
+def _merge_top_k(
+    best_ids: np.ndarray,
+    best_dist: np.ndarray,
+    tile_ids: np.ndarray,
+    tile_dist: np.ndarray,
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the k smallest of two candidate sets per row, ordered by (distance, id)."""
+    ids = np.concatenate([best_ids, tile_ids], axis=1)
+    dist = np.concatenate([best_dist, tile_dist], axis=1)
+    order = np.lexsort((ids, dist), axis=1)[:, :k]
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(dist, order, axis=1)
+
+
+def top_k_neighbours(
+    queries: np.ndarray,
+    points: np.ndarray,
+    k: int,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET,
+    pair_filter: Optional[PairFilter] = None,
+    exclude_self: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The k nearest points for every query row, computed tile by tile.
+
+    Args:
+        queries: (m, d) query rows in the scaled feature space
+        points: (n, d) candidate rows in the same space
+        k: Neighbours per query
+        memory_budget: Bytes a distance tile may use
+        pair_filter: Optional callable(query_ids, point_ids) returning an
+            allowed-pairs mask; disallowed pairs are never returned
+        exclude_self: Skip point i for query i (queries is points)
+
+    Returns:
+        (indices, distances), each (m, k), ordered by (distance, index) like
+        ComparableSelector._k_smallest. Slots without a neighbour hold -1 / inf.
+        Distances of the returned neighbours are recomputed exactly.
+    """
+    m = len(queries)
+    best_ids = np.full((m, k), -1, dtype=np.int64)
+    best_dist = np.full((m, k), np.inf)
+    if m == 0 or k <= 0 or len(points) == 0:
+        return best_ids, best_dist
+
+    for row_start, col_start, tile in iter_distance_tiles(queries, points, memory_budget):
+        rows, cols = tile.shape
+        row_ids = np.arange(row_start, row_start + rows)
+        col_ids = np.arange(col_start, col_start + cols)
+        if pair_filter is not None:
+            tile[~pair_filter(row_ids, col_ids)] = np.inf
+        if exclude_self:
+            tile[row_ids[:, None] == col_ids[None, :]] = np.inf
+
+        take = min(k, cols)
+        nearest = np.argpartition(tile, take - 1, axis=1)[:, :take] if take < cols else np.tile(np.arange(cols), (rows, 1))
+        best_ids[row_start:row_start + rows], best_dist[row_start:row_start + rows] = _merge_top_k(
+            best_ids[row_start:row_start + rows],
+            best_dist[row_start:row_start + rows],
+            nearest + col_start,
+            np.take_along_axis(tile, nearest, axis=1),
+            k
+        )
+
+    # Exact distances for the survivors, then the final (distance, index) order
+    found = np.isfinite(best_dist)
+    exact = np.sqrt(((queries[:, None, :] - points[np.where(found, best_ids, 0)]) ** 2).sum(axis=2))
+    exact[~found] = np.inf
+    order = np.lexsort((np.where(found, best_ids, np.iinfo(np.int64).max), exact), axis=1)
+    best_ids = np.take_along_axis(np.where(found, best_ids, -1), order, axis=1)
+    best_dist = np.take_along_axis(exact, order, axis=1)
+    return best_ids, best_dist
+
+
+def iter_pairs_within(
+    points: np.ndarray,
+    radius: float,
+    memory_budget: int = DEFAULT_MEMORY_BUDGET
+) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Yield (i, j, distance) arrays of all pairs i < j closer than `radius`.
+
+    Useful for near-duplicate detection and density-based clustering; only the
+    matching pairs of each tile are kept.
+    """
+    limit = radius * radius
+    for row_start, col_start, tile in iter_distance_tiles(points, points, memory_budget):
+        # Tiles entirely below the diagonal hold only j < i pairs
+        if col_start + tile.shape[1] <= row_start:
+            continue
+        rows, cols = np.nonzero(tile < limit)
+        i, j = rows + row_start, cols + col_start
+        upper = i < j
+        if upper.any():
+            yield i[upper], j[upper], np.sqrt(tile[rows[upper], cols[upper]])
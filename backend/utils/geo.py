@@ -0,0 +1,144 @@
+"""
+Vectorized geographic distance and comparable score-breakdown kernels.
+
+Everything here works on NumPy arrays, so distances and breakdown fields for
+any number of comparables (or subject/comp pairs in batch and backtest runs)
+come out of one array pass instead of a Python call per pair.
+"""
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from .corpus import FEATURE_NAMES, SalesCorpus
+
+EARTH_RADIUS_MILES = 3959
+
+# Miles per degree of latitude (and of longitude at the equator)
+MILES_PER_DEGREE = 2 * np.pi * EARTH_RADIUS_MILES / 360
+
+_COLUMN = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+
+def haversine_miles(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Great-circle distance in miles; arguments broadcast like NumPy arrays.
+
+    Same formula as ComparableSelector's scalar version, e.g. one subject
+    against many comps: haversine_miles(lat, lon, comp_lats, comp_lons).
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_MILES * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def radius_bbox(lat: float, lon: float, radius_miles: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a radius around a point."""
+    lat_delta = radius_miles / MILES_PER_DEGREE
+    lon_delta = radius_miles / (MILES_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+    return lat - lat_delta, lon - lon_delta, lat + lat_delta, lon + lon_delta
+
+
+def tile_bbox(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a Web Mercator (slippy map) tile."""
+    tiles = 2 ** zoom
+    if not (0 <= x < tiles and 0 <= y < tiles):
+        raise ValueError(f"Tile {x}/{y} is outside zoom level {zoom}")
+
+    def tile_lat(row: int) -> float:
+        return float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * row / tiles)))))
+
+    return tile_lat(y + 1), x / tiles * 360 - 180, tile_lat(y), (x + 1) / tiles * 360 - 180
+
+
+def rows_in_box(
+    corpus: SalesCorpus,
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    candidate_rows: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Ascending corpus rows strictly inside a latitude/longitude box, via the spatial index."""
+    rows = np.sort(corpus.rows_in_bbox(min_lat, min_lon, max_lat, max_lon))
+    if candidate_rows is not None:
+        rows = np.intersect1d(rows, candidate_rows)
+    lat, lon = corpus.features[rows, 0], corpus.features[rows, 1]
+    return rows[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+
+
+def rows_by_distance(corpus: SalesCorpus, rows: np.ndarray, lat: float, lon: float) -> Tuple[np.ndarray, np.ndarray]:
+    """(rows, miles from the point), ordered by (distance, row)."""
+    miles = haversine_miles(lat, lon, corpus.features[rows, 0], corpus.features[rows, 1])
+    order = np.lexsort((rows, miles))
+    return rows[order], miles[order]
+
+
+def rows_within_radius(
+    corpus: SalesCorpus,
+    lat: float,
+    lon: float,
+    radius_miles: float,
+    candidate_rows: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Corpus rows within `radius_miles` of a point, via the spatial index.
+
+    Args:
+        candidate_rows: Restrict to these rows (e.g. an attribute pre-filter)
+
+    Returns:
+        (rows, miles), ordered by (distance, row)
+    """
+    rows, miles = rows_by_distance(corpus, rows_in_box(corpus, *radius_bbox(lat, lon, radius_miles), candidate_rows), lat, lon)
+    inside = miles <= radius_miles
+    return rows[inside], miles[inside]
+
+
+def breakdown_columns(subject: np.ndarray, comps: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Score-breakdown fields for many comps against one subject, as arrays.
+
+    Args:
+        subject: (len(FEATURE_NAMES),) raw subject features
+        comps: (k, len(FEATURE_NAMES)) raw comp features, FEATURE_NAMES order
+
+    Returns:
+        {field: (k,) array} for the numeric fields of
+        ComparableSelector._get_score_breakdown (unrounded)
+    """
+    diff = np.abs(comps - subject)
+    subject_sqft = subject[_COLUMN['sqft']]
+    if subject_sqft > 0:
+        sqft_pct_diff = diff[:, _COLUMN['sqft']] / subject_sqft * 100
+    else:
+        sqft_pct_diff = np.zeros(len(comps))
+    return {
+        'distance_miles': haversine_miles(
+            subject[_COLUMN['latitude']], subject[_COLUMN['longitude']],
+            comps[:, _COLUMN['latitude']], comps[:, _COLUMN['longitude']]
+        ),
+        'sqft_diff': diff[:, _COLUMN['sqft']],
+        'sqft_pct_diff': sqft_pct_diff,
+        'bedrooms_diff': diff[:, _COLUMN['bedrooms']],
+        'bathrooms_diff': diff[:, _COLUMN['bathrooms']],
+        'age_diff_years': diff[:, _COLUMN['year_built']],
+        'days_since_sale': comps[:, _COLUMN['days_since_sale']],
+        'has_pool_match': (diff[:, _COLUMN['has_pool']] == 0).astype(np.int64),
+    }
+
+
+def score_breakdowns(subject: np.ndarray, comps: np.ndarray) -> List[Dict[str, float]]:
+    """
+    Per-comp score_breakdown dicts (rounded like the API reports them).
+
+    Computed column-wise with breakdown_columns(); only the final dicts are
+    assembled per comp.
+    """
+    columns = breakdown_columns(subject, comps)
+    columns['distance_miles'] = np.round(columns['distance_miles'], 2)
+    columns['sqft_pct_diff'] = np.round(columns['sqft_pct_diff'], 1)
+    names = list(columns)
+    values = zip(*(columns[name].tolist() for name in names))
+    return [
+        {**dict(zip(names, row)), 'knn_method': 'Weighted Euclidean Distance'}
+        for row in values
+    ]
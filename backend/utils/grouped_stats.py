@@ -0,0 +1,87 @@
+"""
+Vectorized group-by statistics over (group key, value) entries.
+
+Entries are kept sorted by (key, value), so the count and quantiles of every
+group come from index arithmetic on one array instead of a loop per group.
+New entries are merged into the sorted arrays and only the groups they touch
+are recomputed. Used by the neighbourhood price grid and the market
+time-adjustment index.
+"""
+from typing import Dict
+import numpy as np
+
+
+def grouped_quantiles(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Linear-interpolated quantile (as np.percentile) of each sorted group."""
+    position = starts + q * (counts - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.ceil(position).astype(np.int64)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def group_stats(keys: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-key count and quartiles for entries sorted by (key, value)."""
+    group_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    return {
+        'keys': group_keys,
+        'count': counts.astype(np.int64),
+        'q1': grouped_quantiles(values, starts, counts, 0.25),
+        'median': grouped_quantiles(values, starts, counts, 0.5),
+        'q3': grouped_quantiles(values, starts, counts, 0.75),
+    }
+
+
+def segment_rows(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, end) for each segment, without a Python loop."""
+    lengths = ends - starts
+    if lengths.sum() == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+    return np.arange(lengths.sum(), dtype=np.int64) + offsets
+
+
+class SortedGroups:
+    """
+    Count, quartiles and median per int64 group key.
+
+    Attributes:
+        keys, values: Entries sorted by (key, value)
+        table: Per-group 'keys', 'count', 'q1', 'median', 'q3' arrays, sorted by key
+    """
+
+    def __init__(self, keys: np.ndarray, values: np.ndarray, table: Dict[str, np.ndarray]):
+        self.keys = keys
+        self.values = values
+        self.table = table
+
+    @classmethod
+    def build(cls, keys: np.ndarray, values: np.ndarray) -> 'SortedGroups':
+        order = np.lexsort((values, keys))
+        keys, values = keys[order], values[order]
+        return cls(keys, values, group_stats(keys, values))
+
+    def inserted(self, new_keys: np.ndarray, new_values: np.ndarray) -> 'SortedGroups':
+        """
+        Groups with the given entries added; this object is left unchanged.
+
+        Statistics are recomputed for the touched groups only.
+        """
+        if len(new_keys) == 0:
+            return self
+
+        order = np.argsort(new_keys, kind='stable')
+        new_keys, new_values = new_keys[order], new_values[order]
+        positions = np.searchsorted(self.keys, new_keys, side='right')
+        keys = np.insert(self.keys, positions, new_keys)
+        values = np.insert(self.values, positions, new_values)
+
+        # Re-sort the touched groups by value (in place) and recompute their statistics
+        touched = np.unique(new_keys)
+        rows = segment_rows(np.searchsorted(keys, touched, 'left'), np.searchsorted(keys, touched, 'right'))
+        values[rows] = values[rows[np.lexsort((values[rows], keys[rows]))]]
+        stats = group_stats(keys[rows], values[rows])
+
+        keep = ~np.isin(self.table['keys'], touched)
+        merged = {name: np.concatenate([column[keep], stats[name]]) for name, column in self.table.items()}
+        order = np.argsort(merged['keys'], kind='stable')
+        return SortedGroups(keys, values, {name: column[order] for name, column in merged.items()})
@@ -0,0 +1,186 @@
+"""
+Hedonic ridge regression of log sale price on property features.
+
+Fitted per corpus snapshot (and so per market shard) from the sufficient
+statistics X'X and X'y, so a fit is one pass to accumulate them plus a small
+(features x features) solve. Appended sales only add their rows' contribution
+before re-solving. Feature adjustments for a subject are then O(features):
+
+    adjustment_f = exp(coef_f * (subject_f - mean of comps_f)) - 1
+
+The price models log(price) on log(sqft) and the sale month as controls, so
+the adjustment coefficients are not confounded with size or market trend;
+size itself is handled by the $/sqft scaling of the base price.
+"""
+import math
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+from .corpus import SalesCorpus, STATIC_FEATURE_NAMES
+
+# Regression columns, in design-matrix order (after the intercept)
+HEDONIC_FEATURES = (
+    'log_sqft', 'bedrooms', 'bathrooms', 'year_built', 'has_pool', 'garage_spaces', 'log_lot_sqft', 'sale_month',
+)
+
+# Features reported as price adjustments, by PriceEstimator adjustment name
+ADJUSTED_FEATURES = {
+    'pool': 'has_pool',
+    'garage': 'garage_spaces',
+    'age': 'year_built',
+    'lot_size': 'log_lot_sqft',
+}
+
+# Ridge penalty on the standardized coefficients, per sale
+DEFAULT_RIDGE_ALPHA = 0.01
+
+# Fewest sales for a usable fit; smaller corpora fall back to fixed adjustments
+MIN_FIT_SALES = 30
+
+# Largest adjustment applied for one feature (+/- fraction)
+MAX_FEATURE_ADJUSTMENT = 0.15
+
+_COLUMN = {name: i for i, name in enumerate(STATIC_FEATURE_NAMES)}
+
+
+def feature_rows(properties: List[Dict[str, Any]]) -> np.ndarray:
+    """(n, len(HEDONIC_FEATURES)) design rows for property dicts (sale_month is left 0)."""
+    rows = np.zeros((len(properties), len(HEDONIC_FEATURES)))
+    for i, prop in enumerate(properties):
+        rows[i] = [
+            math.log(max(float(prop.get('sqft', prop.get('square_footage', 0)) or 0), 1.0)),
+            float(prop.get('bedrooms', 0) or 0),
+            float(prop.get('bathrooms', 0) or 0),
+            float(prop.get('year_built', 0) or 0),
+            1.0 if (prop.get('has_pool') or prop.get('has_private_pool') or prop.get('pool')) else 0.0,
+            float(prop.get('garage_spaces', 0) or 0),
+            math.log1p(max(float(prop.get('lot_sqft', 0) or 0), 0.0)),
+            0.0,
+        ]
+    return rows
+
+
+def _corpus_design(corpus: SalesCorpus, start: int):
+    """(X, log price) for corpus rows [start, len(corpus)) with a usable price, sqft and year built."""
+    features, prices = corpus.features[start:], corpus.prices[start:]
+    valid = (prices > 0) & (features[:, _COLUMN['sqft']] > 0) & (features[:, _COLUMN['year_built']] > 0)
+    features = features[valid]
+    months = np.asarray(corpus.sale_days[start:][valid], dtype='datetime64[D]').astype('datetime64[M]')
+    design = np.column_stack([
+        np.log(features[:, _COLUMN['sqft']]),
+        features[:, _COLUMN['bedrooms']],
+        features[:, _COLUMN['bathrooms']],
+        features[:, _COLUMN['year_built']],
+        corpus.attribute('has_private_pool', start)[valid],
+        corpus.attribute('garage_spaces', start)[valid],
+        np.log1p(np.maximum(corpus.attribute('lot_sqft', start)[valid], 0)),
+        months.astype(np.int64).astype(np.float64),
+    ]) if valid.any() else np.empty((0, len(HEDONIC_FEATURES)))
+    return design, np.log(prices[valid])
+
+
+class HedonicModel:
+    """
+    Ridge coefficients plus the sufficient statistics they were solved from.
+
+    Attributes:
+        size: Corpus rows covered
+        count: Sales used in the fit
+        gram: (p+1, p+1) X'X with an intercept column first
+        moment: (p+1,) X'y
+        coefficients: {feature: log-price change per unit}, empty when
+            there are fewer than MIN_FIT_SALES sales
+    """
+
+    def __init__(self, size: int, gram: np.ndarray, moment: np.ndarray, alpha: float = DEFAULT_RIDGE_ALPHA):
+        self.size = size
+        self.gram = gram
+        self.moment = moment
+        self.alpha = alpha
+        self.count = int(round(gram[0, 0]))
+        self.coefficients: Dict[str, float] = {}
+        if self.count >= MIN_FIT_SALES:
+            self._solve()
+
+    @staticmethod
+    def _statistics(design: np.ndarray, target: np.ndarray):
+        augmented = np.column_stack([np.ones(len(design)), design])
+        return augmented.T @ augmented, augmented.T @ target
+
+    @classmethod
+    def fit(cls, corpus: SalesCorpus, alpha: float = DEFAULT_RIDGE_ALPHA) -> 'HedonicModel':
+        gram, moment = cls._statistics(*_corpus_design(corpus, 0))
+        return cls(len(corpus), gram, moment, alpha)
+
+    def updated(self, corpus: SalesCorpus) -> 'HedonicModel':
+        """Model refitted with the rows appended since this one; this model is left unchanged."""
+        gram, moment = self._statistics(*_corpus_design(corpus, self.size))
+        return HedonicModel(len(corpus), self.gram + gram, self.moment + moment, self.alpha)
+
+    def _solve(self) -> None:
+        """Ridge on standardized features (intercept unpenalized), from X'X and X'y."""
+        n = self.gram[0, 0]
+        mean = self.gram[0, 1:] / n
+        target_mean = self.moment[0] / n
+        scatter = self.gram[1:, 1:] - n * np.outer(mean, mean)
+        cross = self.moment[1:] - n * mean * target_mean
+        std = np.sqrt(np.maximum(np.diag(scatter) / n, 0))
+        # Constant columns (e.g. no pools in the market) get a zero coefficient
+        scale = np.where(std > 1e-12, 1 / np.where(std > 1e-12, std, 1), 0.0)
+        system = scale[:, None] * scatter * scale[None, :] + self.alpha * n * np.eye(len(scale))
+        standardized = np.linalg.solve(system, scale * cross)
+        self.coefficients = dict(zip(HEDONIC_FEATURES, (standardized * scale).tolist()))
+
+    @property
+    def fitted(self) -> bool:
+        return bool(self.coefficients)
+
+    def adjustments(self, subject_home: Dict[str, Any], comparables: List[Dict[str, Any]]) -> Dict[str, float]:
+        """
+        {adjustment name: fraction} for the subject against its comps' mean
+        features; adjustments under 0.5% are left out.
+        """
+        return self.adjustments_many([subject_home], [comparables])[0]
+
+    def adjustments_many(
+        self,
+        subjects: List[Dict[str, Any]],
+        comparables_lists: List[List[Dict[str, Any]]]
+    ) -> List[Dict[str, float]]:
+        """adjustments() for many subjects (each with non-empty comps) in one array pass."""
+        counts = np.array([len(comparables) for comparables in comparables_lists])
+        comp_rows = feature_rows([comp for comparables in comparables_lists for comp in comparables])
+        comp_means = np.add.reduceat(comp_rows, np.cumsum(counts) - counts, axis=0) / counts[:, None]
+        difference = feature_rows(subjects) - comp_means
+
+        names = list(ADJUSTED_FEATURES)
+        columns = [HEDONIC_FEATURES.index(ADJUSTED_FEATURES[name]) for name in names]
+        coefficients = np.array([self.coefficients[ADJUSTED_FEATURES[name]] for name in names])
+        values = np.clip(
+            np.exp(coefficients * difference[:, columns]) - 1, -MAX_FEATURE_ADJUSTMENT, MAX_FEATURE_ADJUSTMENT
+        )
+        return [
+            {name: value for name, value in zip(names, row) if abs(value) > 0.005}
+            for row in values.tolist()
+        ]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'sales': self.count,
+            'coefficients': {name: round(value, 6) for name, value in self.coefficients.items()},
+        }
+
+
+def hedonic_model(corpus: SalesCorpus) -> Optional[HedonicModel]:
+    """
+    The corpus's fitted model, or None with fewer than MIN_FIT_SALES sales.
+
+    Fitted once per snapshot; snapshots produced by SalesCorpus.append fold
+    the appended sales into their parent's statistics instead of refitting.
+    """
+    model = corpus.lazy_index(
+        'hedonic_model',
+        lambda: HedonicModel.fit(corpus),
+        update=lambda previous: previous.updated(corpus)
+    )
+    return model if model.fitted else None
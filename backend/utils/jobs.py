@@ -0,0 +1,230 @@
+"""
+In-process background jobs for long-running valuations.
+
+Jobs are queued on a bounded queue and run by a small pool of worker
+threads. Each job is a list of items processed one at a time, so partial
+results are visible (and streamable) while it runs and cancellation takes
+effect between items. Finished jobs are kept for a TTL, then dropped.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, CANCELLED)
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_RESULT_TTL = 3600.0
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at capacity."""
+
+
+class Job:
+    """
+    One submitted job: its items, per-item outcomes and lifecycle state.
+
+    Outcomes are appended in completion order as
+    {'index': i, 'result': ...} or {'index': i, 'error': '...'}.
+    """
+
+    def __init__(self, items: List[Any], handler: Callable[[Any], Any]):
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.handler = handler
+        self.status = QUEUED
+        self.outcomes: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def _record(self, outcome: Dict[str, Any]) -> None:
+        with self._changed:
+            self.outcomes.append(outcome)
+            self._changed.notify_all()
+
+    def _set_status(self, status: str) -> None:
+        with self._changed:
+            self.status = status
+            if status == RUNNING:
+                self.started_at = time.time()
+            elif status in FINISHED_STATES:
+                self.finished_at = time.time()
+            self._changed.notify_all()
+
+    def run(self) -> None:
+        """Process every item in order, stopping early if cancelled."""
+        if self.cancel_requested:
+            self._set_status(CANCELLED)
+            return
+
+        self._set_status(RUNNING)
+        for index, item in enumerate(self.items):
+            if self.cancel_requested:
+                self._set_status(CANCELLED)
+                return
+            try:
+                self._record({'index': index, 'result': self.handler(item)})
+            except Exception as e:
+                self._record({'index': index, 'error': str(e)})
+        self._set_status(COMPLETED)
+
+    def cancel(self) -> None:
+        """Request cancellation; a queued job is cancelled right away."""
+        with self._changed:
+            self.cancel_requested = True
+            if self.status == QUEUED:
+                self.status = CANCELLED
+                self.finished_at = time.time()
+            self._changed.notify_all()
+
+    def iter_outcomes(self, poll_interval: float = 1.0) -> Iterator[Dict[str, Any]]:
+        """Yield outcomes as they complete until the job finishes."""
+        position = 0
+        while True:
+            with self._changed:
+                while position == len(self.outcomes) and not self.finished:
+                    self._changed.wait(poll_interval)
+                pending = self.outcomes[position:]
+                finished = self.finished
+            for outcome in pending:
+                yield outcome
+            position += len(pending)
+            if finished and position == len(self.outcomes):
+                return
+
+    def summary(self, include_results: bool = True) -> Dict[str, Any]:
+        """JSON-serializable status, progress and (optionally) results."""
+        with self._changed:
+            outcomes = list(self.outcomes)
+            status = self.status
+        summary = {
+            'job_id': self.id,
+            'status': status,
+            'total': len(self.items),
+            'completed': len(outcomes),
+            'failed': sum(1 for outcome in outcomes if 'error' in outcome),
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if include_results:
+            summary['results'] = sorted(outcomes, key=lambda outcome: outcome['index'])
+        return summary
+
+
+class JobManager:
+    """
+    Bounded job queue, worker threads and a TTL store of jobs.
+
+    Workers start lazily on the first submit so importing the app doesn't
+    spawn threads.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_queue: int = DEFAULT_QUEUE_SIZE,
+        result_ttl: float = DEFAULT_RESULT_TTL
+    ):
+        self.workers = max(1, workers)
+        self.result_ttl = result_ttl
+        self._queue: 'queue.Queue[Job]' = queue.Queue(maxsize=max(1, max_queue))
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            finally:
+                self._queue.task_done()
+
+    def _purge_expired(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished and job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def submit(self, items: List[Any], handler: Callable[[Any], Any]) -> Job:
+        """
+        Queue a job that calls `handler(item)` for each item.
+
+        Raises:
+            JobQueueFull: The queue is at capacity
+        """
+        self._purge_expired()
+        self._ensure_workers()
+
+        job = Job(items, handler)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise JobQueueFull(f"Job queue is full ({self._queue.maxsize} jobs waiting)")
+
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Job by id, or None if unknown or expired."""
+        self._purge_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Request cancellation of a job; returns it, or None if unknown."""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+
+def _env_number(name: str, default, cast):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def job_manager_from_env() -> JobManager:
+    """Build a JobManager from JOB_WORKERS, JOB_QUEUE_SIZE and JOB_RESULT_TTL."""
+    return JobManager(
+        workers=_env_number('JOB_WORKERS', DEFAULT_WORKERS, int),
+        max_queue=_env_number('JOB_QUEUE_SIZE', DEFAULT_QUEUE_SIZE, int),
+        result_ttl=_env_number('JOB_RESULT_TTL', DEFAULT_RESULT_TTL, float)
+    )
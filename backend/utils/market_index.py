@@ -0,0 +1,189 @@
+"""
+Monthly market price index for time-adjusting comparable sale prices.
+
+The index is the median $/sqft of sales in a trailing window of months, for
+the whole market and for every zip code. A zip month with enough sales has its
+own trend; elsewhere the zip follows the market curve, scaled to the zip's own
+level. The result is a dense (regions x months) table, so moving a comp's
+price from its sale month to the valuation month is two array lookups:
+
+    adjusted_price = price * index[region, valuation_month] / index[region, sale_month]
+
+Group statistics come from utils.grouped_stats, so appended sales only
+recompute the region-months they touch before the table is re-derived.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from .corpus import SalesCorpus, STATIC_FEATURE_NAMES, parse_sale_day, today_epoch_day
+from .grouped_stats import SortedGroups
+
+# Each sale counts towards its own month and the following ones (trailing window)
+WINDOW_MONTHS = 3
+
+# Fewest sales in a window for a region month to have its own index value
+MIN_INDEX_SALES = 5
+
+# Largest time adjustment applied to a comp price (+/- fraction)
+MAX_TIME_ADJUSTMENT = 0.25
+
+# Region 0 is the whole market; zip codes get ids in order of first appearance
+MARKET_REGION = ''
+
+_MONTH_BITS = 21
+_MONTH_MASK = (1 << _MONTH_BITS) - 1
+_SQFT = STATIC_FEATURE_NAMES.index('sqft')
+
+
+def epoch_months(epoch_days) -> np.ndarray:
+    """Months since 1970-01 of epoch-day dates."""
+    return np.asarray(epoch_days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def month_label(month: int) -> str:
+    """'2024-07' for a month counted from 1970-01."""
+    return f"{1970 + month // 12}-{month % 12 + 1:02d}"
+
+
+def _fill_gaps(table: np.ndarray) -> np.ndarray:
+    """Forward-fill then back-fill NaNs along each row (vectorized)."""
+    def forward(values: np.ndarray) -> np.ndarray:
+        source = np.where(np.isnan(values), 0, np.arange(values.shape[1]))
+        return np.take_along_axis(values, np.maximum.accumulate(source, axis=1), axis=1)
+    return forward(forward(table)[:, ::-1])[:, ::-1]
+
+
+class MarketIndex:
+    """
+    Median $/sqft index per (region, month).
+
+    Attributes:
+        size: Corpus rows covered
+        regions: Region key -> row of `table` (MARKET_REGION is row 0)
+        first_month: Month (since 1970-01) of table column 0
+        table: (regions, months) index values, gap-filled (no columns without data)
+        groups: Windowed $/sqft statistics keyed by packed (region, month)
+    """
+
+    def __init__(self, size: int, regions: Dict[str, int], groups: SortedGroups):
+        self.size = size
+        self.regions = regions
+        self.groups = groups
+        self.first_month = 0
+        self.table = np.full((len(regions), 0), np.nan)
+        self._derive_table()
+
+    @staticmethod
+    def _entries(corpus: SalesCorpus, start: int, regions: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Unsorted (keys, $/sqft) entries for corpus rows [start, len(corpus)); extends `regions`."""
+        sqft, prices = corpus.features[start:, _SQFT], corpus.prices[start:]
+        valid = (sqft > 0) & (prices > 0)
+        # Zip ids in order of first appearance, assigned once per distinct zip code
+        codes = corpus.attribute_codes('zip_code', start)
+        distinct, first_rows = np.unique(codes, return_index=True)
+        region_of_code = {}
+        for code, zip_code in zip(distinct[np.argsort(first_rows)].tolist(),
+                                  corpus.codebook.decode(distinct[np.argsort(first_rows)]).tolist()):
+            zip_code = str(zip_code or '')
+            region_of_code[code] = regions.setdefault(zip_code, len(regions)) if zip_code else 0
+        region_by_code = np.array([region_of_code[code] for code in distinct.tolist()], dtype=np.int64)
+        region_ids = region_by_code[np.searchsorted(distinct, codes)][valid]
+        months = epoch_months(corpus.sale_days[start:][valid])
+        values = prices[valid] / sqft[valid]
+
+        # Market-wide and zip entries for every month of the trailing window
+        window = np.arange(WINDOW_MONTHS)
+        month_keys = (months[:, None] + window).ravel()
+        keys = [month_keys]
+        entry_values = [np.repeat(values, WINDOW_MONTHS)]
+        zoned = np.repeat(region_ids > 0, WINDOW_MONTHS)
+        keys.append((np.repeat(region_ids, WINDOW_MONTHS)[zoned] << _MONTH_BITS) | month_keys[zoned])
+        entry_values.append(entry_values[0][zoned])
+        return np.concatenate(keys), np.concatenate(entry_values)
+
+    @classmethod
+    def build(cls, corpus: SalesCorpus) -> 'MarketIndex':
+        regions = {MARKET_REGION: 0}
+        return cls(len(corpus), regions, SortedGroups.build(*cls._entries(corpus, 0, regions)))
+
+    def updated(self, corpus: SalesCorpus) -> 'MarketIndex':
+        """Index for a corpus extending this one's with appended rows; this index is left unchanged."""
+        regions = dict(self.regions)
+        groups = self.groups.inserted(*self._entries(corpus, self.size, regions))
+        return MarketIndex(len(corpus), regions, groups)
+
+    def _derive_table(self) -> None:
+        table = self.groups.table
+        usable = table['count'] >= MIN_INDEX_SALES
+        keys, medians = table['keys'][usable], table['median'][usable]
+        if len(keys) == 0:
+            return
+        region_rows = keys >> _MONTH_BITS
+        months = keys & _MONTH_MASK
+        self.first_month = int(months.min())
+        index = np.full((len(self.regions), int(months.max()) - self.first_month + 1), np.nan)
+        index[region_rows, months - self.first_month] = medians
+
+        market = index[0]
+        if np.isnan(market).all():
+            return
+        market = _fill_gaps(market[None, :])[0]
+        # Zips follow the market curve scaled by their own level where they lack data
+        ratio = _fill_gaps(index / market)
+        ratio[np.isnan(ratio)] = 1.0
+        index = market * ratio
+        index[0] = market
+        self.table = index
+
+    def _lookup(self, region_rows: np.ndarray, months: np.ndarray) -> np.ndarray:
+        columns = np.clip(months - self.first_month, 0, self.table.shape[1] - 1)
+        return self.table[region_rows, columns]
+
+    def region_rows(self, zip_codes: Sequence[Any]) -> np.ndarray:
+        """Table rows for zip codes (unknown zips use the market row)."""
+        return np.array([self.regions.get(str(zip_code or ''), 0) for zip_code in zip_codes], dtype=np.int64)
+
+    def factors(self, zip_codes: Sequence[Any], sale_days: Sequence[int], valuation_day=None) -> np.ndarray:
+        """
+        Multipliers taking prices from their sale dates to the valuation date
+        (default today; one epoch day, or one per price), clipped to
+        1 +/- MAX_TIME_ADJUSTMENT; 1 without data. Months past the newest
+        sales use the latest index value.
+        """
+        if self.table.shape[1] == 0:
+            return np.ones(len(sale_days))
+        if valuation_day is None:
+            valuation_day = today_epoch_day()
+        rows = self.region_rows(zip_codes)
+        sale_index = self._lookup(rows, epoch_months(np.asarray(sale_days, dtype=np.int64)))
+        valuation_months = np.broadcast_to(epoch_months(np.asarray(valuation_day, dtype=np.int64)), rows.shape)
+        valuation_index = self._lookup(rows, valuation_months)
+        return np.clip(valuation_index / sale_index, 1 - MAX_TIME_ADJUSTMENT, 1 + MAX_TIME_ADJUSTMENT)
+
+    def comparable_factors(self, comparables: List[Dict[str, Any]], valuation_day=None) -> np.ndarray:
+        """factors() for normalized comparable dicts (their `zip_code` and sale date)."""
+        today = today_epoch_day()
+        sale_days = [parse_sale_day(comp, today) for comp in comparables]
+        return self.factors([comp.get('zip_code') for comp in comparables], sale_days, valuation_day)
+
+    def series(self, zip_code: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Monthly index values of a zip (or the market), oldest first."""
+        row = self.regions.get(str(zip_code or ''), 0)
+        return [
+            {'month': month_label(self.first_month + column), 'median_price_per_sqft': round(float(value), 2)}
+            for column, value in enumerate(self.table[row].tolist())
+        ]
+
+
+def market_index(corpus: SalesCorpus) -> MarketIndex:
+    """
+    The corpus's market index, built on first use per snapshot.
+
+    Snapshots produced by SalesCorpus.append update their parent's index with
+    the appended sales instead of rebuilding it.
+    """
+    return corpus.lazy_index(
+        'market_index',
+        lambda: MarketIndex.build(corpus),
+        update=lambda previous: previous.updated(corpus)
+    )
@@ -0,0 +1,486 @@
+"""
+Per-market sales corpora ("shards") with lazy loading and LRU eviction.
+
+Every "<MARKET>_SALES_RECORDS.json" file in the data directory is one shard
+with its own SalesCorpus: feature statistics, normalization, spatial/date
+indexes and ANN index are all per market, so a Phoenix subject is never
+normalized against Tucson sales. Shards load on first use and the least
+recently used ones are evicted once the shard count or the estimated memory
+budget is exceeded, so a worker serving many markets only holds the hot ones.
+
+Shards are read through the configured storage backend (utils.storage): the
+market's JSON file, or its rows of the SQLite database, whose markets are
+shards too even without a data file.
+
+Routing reads per-market extents (regions, bounding box, centre) from
+memory. They are rechecked against the storage signatures at most every
+MARKET_REFRESH_SECONDS and persisted to data/market_extents.json, so a
+market that was never loaded is summarized once per change of its sales
+(without entering the shard LRU) rather than on every request or restart.
+
+The default market (PHOENIX_SALES_RECORDS.json) stays on the regular
+CorpusProvider, which keeps WAL ingestion, hot reload and shared memory.
+Ingested listings are routed like subjects and written to their own
+market's storage; a loaded shard has them appended in place.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .corpus import CorpusProvider, SalesCorpus, build_corpus
+from .data_loader import (
+    DATA_DIR, SALES_RECORDS_FILE, discover_market_files, normalize_valid_comparables, records_file_market
+)
+from .storage import SalesStorage, sales_storage_from_env, stored_markets_from_env
+
+DEFAULT_MARKET = records_file_market(SALES_RECORDS_FILE)
+DEFAULT_MAX_SHARDS = 8
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Seconds between rescans of the available markets and their extents
+DEFAULT_REFRESH_SECONDS = 30.0
+
+# Persisted market extents, keyed by market (each with its source signature)
+MARKET_EXTENTS_FILE = 'market_extents.json'
+
+# Rough in-memory size of one normalized comparable dict
+RECORD_BYTES_ESTIMATE = 1500
+
+# Degrees added around a market's sale extent when matching subject locations
+BBOX_PADDING_DEGREES = 0.25
+
+
+class UnknownMarket(ValueError):
+    """Raised when a requested market has no sales records file."""
+
+
+def estimate_corpus_bytes(corpus: SalesCorpus) -> int:
+    """Approximate memory held by a loaded shard: columns, normalized matrix and records."""
+    n = len(corpus)
+    arrays = corpus.features.nbytes + corpus.sale_days.nbytes + corpus.prices.nbytes
+    normalized = n * (corpus.features.shape[1] + 1) * 8
+    return arrays + normalized + n * RECORD_BYTES_ESTIMATE
+
+
+def market_summary(market: str, corpus: SalesCorpus) -> Dict[str, Any]:
+    """
+    Routing metadata for one shard: region identifiers, sale extent and centre.
+
+    The extent uses the 1st-99th percentile of coordinates so a few bad
+    geocodes don't stretch it over neighbouring markets.
+    """
+    regions = set()
+    for key in ('market', 'brokerage_region_identifier'):
+        for value in corpus.codebook.decode(np.unique(corpus.attribute_codes(key))).tolist():
+            if value:
+                regions.add(str(value).lower())
+
+    return _summarize(market, regions, corpus.features[:, 0], corpus.features[:, 1], len(corpus), corpus.source_signature)
+
+
+def _summarize(
+    market: str,
+    regions: set,
+    lat: np.ndarray,
+    lon: np.ndarray,
+    sales: int,
+    source_signature: Optional[str]
+) -> Dict[str, Any]:
+    located = (lat != 0) & (lon != 0)
+    bbox = centroid = None
+    if located.any():
+        lat, lon = lat[located], lon[located]
+        low_lat, high_lat = np.percentile(lat, [1, 99])
+        low_lon, high_lon = np.percentile(lon, [1, 99])
+        bbox = [float(low_lat), float(low_lon), float(high_lat), float(high_lon)]
+        centroid = [float(np.median(lat)), float(np.median(lon))]
+
+    return {
+        'market': market,
+        'regions': sorted(regions),
+        'bbox': bbox,
+        'centroid': centroid,
+        'sales': sales,
+        'source_signature': source_signature,
+    }
+
+
+def stored_market_summary(market: str, storage: SalesStorage) -> Dict[str, Any]:
+    """market_summary straight from a market's storage, without building its corpus."""
+    signature = storage.signature()
+    comparables = storage.load_comparables()
+    regions = {
+        str(comp[key]).lower()
+        for comp in comparables
+        for key in ('market', 'brokerage_region_identifier')
+        if comp.get(key)
+    }
+    lat = np.array([float(comp.get('latitude') or 0) for comp in comparables])
+    lon = np.array([float(comp.get('longitude') or 0) for comp in comparables])
+    return _summarize(market, regions, lat, lon, len(comparables), signature)
+
+
+class MarketShards:
+    """
+    Routes subjects to market shards and keeps a bounded LRU of loaded ones.
+
+    Thread-safe: lookups take a short lock; a shard is loaded outside it under
+    a per-market lock, so concurrent requests for one cold market load it once
+    while other markets keep being served.
+    """
+
+    def __init__(
+        self,
+        default_provider: Optional[CorpusProvider] = None,
+        max_shards: int = DEFAULT_MAX_SHARDS,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        storage_factory: Callable[[str], SalesStorage] = sales_storage_from_env,
+        discover_markets: Optional[Callable[[], Dict[str, str]]] = None,
+        refresh_interval: float = DEFAULT_REFRESH_SECONDS,
+        extents_path: Optional[str] = None
+    ):
+        """
+        Args:
+            default_provider: Serves DEFAULT_MARKET (not counted against the budget)
+            max_shards: Other markets kept loaded at once
+            memory_budget: Estimated bytes the other loaded markets may hold
+            storage_factory: Storage of a market's sales from its records file name
+            discover_markets: {market: records file} of the available markets
+                (default: the data directory's files plus the storage
+                backend's markets)
+            refresh_interval: Seconds between rescans of the markets and
+                their extents
+            extents_path: JSON file market extents are persisted to (None:
+                keep them in memory only)
+        """
+        self.default_provider = default_provider
+        self.max_shards = max(1, max_shards)
+        self.memory_budget = memory_budget
+        self.storage_factory = storage_factory
+        self.discover_markets = discover_markets or (lambda: {**stored_markets_from_env(), **discover_market_files()})
+        self._storages: Dict[str, SalesStorage] = {}
+        self._shards: 'OrderedDict[str, SalesCorpus]' = OrderedDict()
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._files: Dict[str, str] = {}
+        self.refresh_interval = refresh_interval
+        self.extents_path = extents_path
+        self._scanned_at = 0.0
+        self._summaries_checked_at: Optional[float] = None
+        self._summaries_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def markets(self, refresh: bool = False) -> Dict[str, str]:
+        """
+        {market: records file}; scanned on first use and rescanned when asked,
+        at most once per refresh_interval.
+        """
+        now = time.monotonic()
+        if not self._files or (refresh and now - self._scanned_at >= self.refresh_interval):
+            files = self.discover_markets()
+            if self.default_provider is not None:
+                files.setdefault(DEFAULT_MARKET, SALES_RECORDS_FILE)
+            self._files = files
+            self._scanned_at = now
+        return self._files
+
+    def get(self, market: str) -> SalesCorpus:
+        """
+        Corpus for a market, loading it (or reloading it after its file
+        changed) on demand.
+
+        Raises:
+            UnknownMarket: No records file for the market
+        """
+        market = market.lower()
+        if market == DEFAULT_MARKET and self.default_provider is not None:
+            corpus = self.default_provider.get()
+            self._remember(market, corpus)
+            return corpus
+
+        storage = self.storage(market)
+        signature = storage.signature()
+        with self._lock:
+            corpus = self._shards.get(market)
+            if corpus is not None and corpus.source_signature == signature:
+                self._shards.move_to_end(market)
+                return corpus
+            load_lock = self._load_locks.setdefault(market, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                corpus = self._shards.get(market)
+            if corpus is not None and corpus.source_signature == signature:
+                return corpus
+
+            corpus = build_corpus(storage.load_comparables(), source_signature=signature, market=market)
+            with self._lock:
+                self._shards[market] = corpus
+                self._shards.move_to_end(market)
+                self.loads += 1
+                self._evict()
+            self._remember(market, corpus)
+            return corpus
+
+    def storage(self, market: str) -> SalesStorage:
+        """
+        Storage a market's shard is loaded from.
+
+        Raises:
+            UnknownMarket: The market has no sales
+        """
+        storage = self._storages.get(market)
+        if storage is None:
+            records_file = self.markets().get(market) or self.markets(refresh=True).get(market)
+            if records_file is None:
+                raise UnknownMarket(f"Unknown market: {market}")
+            storage = self._storages.setdefault(market, self.storage_factory(records_file))
+        return storage
+
+    def _remember(self, market: str, corpus: SalesCorpus) -> None:
+        summary = self._summaries.get(market)
+        if summary is None or summary['source_signature'] != corpus.source_signature or summary['sales'] != len(corpus):
+            self._summaries[market] = market_summary(market, corpus)
+
+    def _evict(self) -> None:
+        """Drop least recently used shards past the shard count or memory budget. Caller holds _lock."""
+        while len(self._shards) > 1 and (
+            len(self._shards) > self.max_shards or self.loaded_bytes() > self.memory_budget
+        ):
+            self._shards.popitem(last=False)
+            self.evictions += 1
+
+    def loaded_bytes(self) -> int:
+        """Estimated memory held by the loaded (non-default) shards."""
+        return sum(estimate_corpus_bytes(corpus) for corpus in list(self._shards.values()))
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """
+        Routing metadata for every market, served from memory.
+
+        Every refresh_interval the markets are rescanned and each summary is
+        checked against its storage signature; a missing or stale one is
+        taken from the persisted extents if they match, else recomputed from
+        storage (the shard itself is not loaded).
+        """
+        with self._summaries_lock:
+            now = time.monotonic()
+            if self._summaries_checked_at is None or now - self._summaries_checked_at >= self.refresh_interval:
+                self._refresh_summaries()
+                self._summaries_checked_at = now
+            files = self._files
+            return [self._summaries[market] for market in sorted(self._summaries) if market in files]
+
+    def _refresh_summaries(self) -> None:
+        """Bring every market's summary up to date. Caller holds _summaries_lock."""
+        persisted = self._read_extents()
+        changed = False
+        for market in self.markets(refresh=True):
+            if market == DEFAULT_MARKET and self.default_provider is not None:
+                self._remember(market, self.default_provider.get())
+                continue
+            storage = self.storage(market)
+            signature = storage.signature()
+            summary = self._summaries.get(market)
+            if summary is not None and summary['source_signature'] == signature:
+                continue
+            summary = persisted.get(market)
+            if summary is None or summary.get('source_signature') != signature:
+                with self._lock:
+                    corpus = self._shards.get(market)
+                if corpus is not None and corpus.source_signature == signature:
+                    summary = market_summary(market, corpus)
+                else:
+                    summary = stored_market_summary(market, storage)
+                changed = True
+            self._summaries[market] = summary
+        if changed:
+            self._write_extents()
+
+    def _read_extents(self) -> Dict[str, Dict[str, Any]]:
+        if not self.extents_path or not os.path.exists(self.extents_path):
+            return {}
+        try:
+            with open(self.extents_path, 'r', encoding='utf-8') as f:
+                extents = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: ignoring unreadable market extents {self.extents_path}: {e}")
+            return {}
+        return extents if isinstance(extents, dict) else {}
+
+    def _write_extents(self) -> None:
+        if not self.extents_path:
+            return
+        extents = {
+            market: summary for market, summary in self._summaries.items()
+            if market != DEFAULT_MARKET or self.default_provider is None
+        }
+        temp_path = f"{self.extents_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(extents, f)
+            os.replace(temp_path, self.extents_path)
+        except OSError as e:
+            print(f"Warning: could not persist market extents to {self.extents_path}: {e}")
+
+    def resolve_market(self, subject_home: Optional[Dict[str, Any]] = None, market: Optional[str] = None) -> str:
+        """
+        Market to value a subject in.
+
+        An explicit market (market name or brokerage region identifier) wins.
+        Otherwise the subject's coordinates pick the market whose sale extent
+        contains them, nearest centre first; with no match the nearest market
+        centre is used, and subjects without coordinates go to DEFAULT_MARKET.
+
+        Raises:
+            UnknownMarket: The explicit market matches no shard
+        """
+        markets = self.markets()
+        if market:
+            market = str(market).lower()
+            if market in markets or market in self.markets(refresh=True):
+                return market
+            for summary in self.summaries():
+                if market in summary['regions']:
+                    return summary['market']
+            raise UnknownMarket(f"Unknown market: {market}")
+
+        if len(markets) <= 1:
+            return next(iter(markets), DEFAULT_MARKET)
+
+        subject_home = subject_home or {}
+        try:
+            lat = float(subject_home.get('latitude') or 0)
+            lon = float(subject_home.get('longitude') or 0)
+        except (TypeError, ValueError):
+            lat = lon = 0.0
+        if lat == 0 and lon == 0:
+            return DEFAULT_MARKET
+
+        best, best_key = DEFAULT_MARKET, None
+        for summary in self.summaries():
+            if summary['centroid'] is None:
+                continue
+            min_lat, min_lon, max_lat, max_lon = summary['bbox']
+            inside = (
+                min_lat - BBOX_PADDING_DEGREES <= lat <= max_lat + BBOX_PADDING_DEGREES
+                and min_lon - BBOX_PADDING_DEGREES <= lon <= max_lon + BBOX_PADDING_DEGREES
+            )
+            distance = (lat - summary['centroid'][0]) ** 2 + (lon - summary['centroid'][1]) ** 2
+            key = (not inside, distance)
+            if best_key is None or key < best_key:
+                best, best_key = summary['market'], key
+        return best
+
+    def resolve(self, subject_home: Optional[Dict[str, Any]] = None, market: Optional[str] = None) -> Tuple[str, SalesCorpus]:
+        """(market, corpus) for a subject; see resolve_market."""
+        market = self.resolve_market(subject_home, market)
+        return market, self.get(market)
+
+    def ingest(self, listings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Append newly closed listings to the storage and corpus of their markets.
+
+        Each listing goes to the market named by its `market` (or brokerage
+        region identifier), else the one its coordinates route to (see
+        resolve_market). Every market is resolved before anything is written.
+        The default market ingests through its CorpusProvider; other markets
+        append to their storage and, when the shard is loaded and current,
+        to the shard in place (otherwise the next get() reloads it).
+
+        Returns:
+            {'accepted', 'rejected', 'markets': [{'market', 'accepted',
+            'rejected', 'corpus_version', 'corpus_size'}, ...]}
+
+        Raises:
+            UnknownMarket: A listing names a market that has no sales
+        """
+        groups: 'OrderedDict[str, List[Dict[str, Any]]]' = OrderedDict()
+        rejected = 0
+        for listing in listings:
+            normalized, _ = normalize_valid_comparables([listing])
+            if not normalized:
+                rejected += 1
+                continue
+            market = self.resolve_market(normalized[0], listing.get('market') or listing.get('brokerage_region_identifier'))
+            groups.setdefault(market, []).append(listing)
+
+        results = [self._ingest_market(market, group) for market, group in groups.items()]
+        return {
+            'accepted': sum(result['accepted'] for result in results),
+            'rejected': rejected + sum(result['rejected'] for result in results),
+            'markets': results,
+        }
+
+    def _ingest_market(self, market: str, listings: List[Dict[str, Any]]) -> Dict[str, Any]:
+        if market == DEFAULT_MARKET and self.default_provider is not None:
+            return {'market': market, **self.default_provider.ingest(listings)}
+
+        comparables, _ = normalize_valid_comparables(listings)
+        storage = self.storage(market)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(market, threading.Lock())
+        with load_lock:
+            with self._lock:
+                loaded = self._shards.get(market)
+            current = loaded is not None and loaded.source_signature == storage.signature()
+            storage.append(listings)
+            if current:
+                corpus = loaded.append(comparables, source_signature=storage.signature())
+                with self._lock:
+                    if market in self._shards:
+                        self._shards[market] = corpus
+        if not current:
+            corpus = self.get(market)
+        return {
+            'market': market,
+            'accepted': len(comparables),
+            'rejected': len(listings) - len(comparables),
+            'corpus_version': corpus.version,
+            'corpus_size': len(corpus),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'loaded': list(self._shards),
+                'loaded_bytes': self.loaded_bytes(),
+                'memory_budget': self.memory_budget,
+                'max_shards': self.max_shards,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+
+def market_shards_from_env(default_provider: Optional[CorpusProvider] = None) -> MarketShards:
+    """
+    MarketShards sized from MARKET_SHARDS_MAX and MARKET_SHARDS_MEMORY_MB,
+    rescanning every MARKET_REFRESH_SECONDS and persisting extents to
+    MARKET_EXTENTS_PATH (default data/market_extents.json).
+    """
+    try:
+        max_shards = int(os.environ.get('MARKET_SHARDS_MAX', DEFAULT_MAX_SHARDS))
+    except ValueError:
+        max_shards = DEFAULT_MAX_SHARDS
+    try:
+        memory_budget = int(float(os.environ['MARKET_SHARDS_MEMORY_MB']) * 1024 * 1024)
+    except (KeyError, ValueError):
+        memory_budget = DEFAULT_MEMORY_BUDGET
+    try:
+        refresh_interval = float(os.environ.get('MARKET_REFRESH_SECONDS', DEFAULT_REFRESH_SECONDS))
+    except ValueError:
+        refresh_interval = DEFAULT_REFRESH_SECONDS
+    return MarketShards(
+        default_provider,
+        max_shards=max_shards,
+        memory_budget=memory_budget,
+        refresh_interval=refresh_interval,
+        extents_path=os.environ.get('MARKET_EXTENTS_PATH') or os.path.join(DATA_DIR, MARKET_EXTENTS_FILE)
+    )
@@ -0,0 +1,47 @@
+"""
+Newline-delimited JSON (NDJSON) helpers.
+
+Batch endpoints stream one JSON object per line so clients get each result
+as soon as it's ready and neither side holds the whole batch in memory.
+"""
+import json
+from typing import Any, Iterable, Iterator, Optional, Union
+
+from .serialization import dumps_json, is_truthy
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def ndjson_line(payload: Any) -> bytes:
+    """Encode one object as an NDJSON line (compact JSON plus newline)."""
+    return dumps_json(payload) + b'\n'
+
+
+def iter_ndjson(lines: Iterable[Union[bytes, str]]) -> Iterator[Any]:
+    """
+    Decode NDJSON lines one at a time, skipping blank lines.
+
+    Args:
+        lines: Any iterable of lines, e.g. a file, request.stream or
+            requests.Response.iter_lines()
+
+    Raises:
+        ValueError: A line is not valid JSON (message includes the line number)
+    """
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid NDJSON on line {number}: {e}")
+
+
+def wants_ndjson(accept_header: Optional[str], stream_arg: Optional[str] = None) -> bool:
+    """True when the client asked for a streamed response (?stream=true or Accept: application/x-ndjson)."""
+    if stream_arg is not None:
+        return is_truthy(stream_arg)
+    return NDJSON_MIMETYPE in (accept_header or '')
@@ -0,0 +1,79 @@
+"""
+Opaque cursors for keyset pagination over distance-ordered results.
+
+A cursor records the (distance, row) of the last item returned and the
+corpus version the page was read from; the next page starts strictly after
+that position. Corpus rows are only stable within one version (a reload
+renumbers them and ingested sales can land on pages already served), so a
+cursor from another version is rejected with StaleCursor and the client
+restarts from the first page.
+"""
+import base64
+import json
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+class StaleCursor(ValueError):
+    """Raised when a cursor was issued for a different corpus version."""
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    payload = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Raises:
+        ValueError: The cursor was not produced by encode_cursor
+    """
+    if not cursor:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(payload)
+        float(position['distance']), int(position['row']), str(position['version'])
+        return position
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Invalid cursor')
+
+
+def page_by_distance(
+    rows: np.ndarray,
+    distances: np.ndarray,
+    cursor: Optional[str],
+    limit: int,
+    version: str
+) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+    """
+    One page of rows ordered by (distance, row).
+
+    Args:
+        version: Version of the corpus the rows index into
+
+    Returns:
+        (rows, distances, next cursor or None on the last page)
+
+    Raises:
+        ValueError: Malformed cursor
+        StaleCursor: The cursor was issued for another corpus version
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        if position['version'] != version:
+            raise StaleCursor('Cursor is from an earlier version of the sales data; request the first page again')
+        after = (distances > position['distance']) | ((distances == position['distance']) & (rows > position['row']))
+        start = int(np.argmax(after)) if after.any() else len(rows)
+        rows, distances = rows[start:], distances[start:]
+
+    page_rows, page_distances = rows[:limit], distances[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor({
+            'distance': float(page_distances[-1]),
+            'row': int(page_rows[-1]),
+            'version': version,
+        })
+    return page_rows, page_distances, next_cursor
@@ -0,0 +1,188 @@
+"""
+Precomputed neighbourhood price-per-sqft aggregate over a fixed lat/lon grid.
+
+Every sale with a price and square footage contributes its $/sqft to its grid
+cell twice: once all-time and once in the cell's bucket for the sale quarter.
+The count, quartiles and median of every group come out of one vectorized
+group-by (utils.grouped_stats); new sales only recompute the groups they touch.
+
+Backs the /api/heatmap endpoint and the PriceEstimator fallback prior for
+subjects with few close comparables.
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+from .corpus import SalesCorpus, STATIC_FEATURE_NAMES
+from .grouped_stats import SortedGroups
+from .spatial_index import DEFAULT_CELL_DEGREES
+
+# Cell row, cell column and time bucket are packed into one int64 key, 21 bits each
+_FIELD_BITS = 21
+_FIELD_MASK = (1 << _FIELD_BITS) - 1
+_FIELD_OFFSET = 1 << (_FIELD_BITS - 1)
+
+# Time bucket of the all-time aggregate; quarter q (since 1970Q1) is bucket q + 1
+ALL_TIME = 0
+
+_SQFT = STATIC_FEATURE_NAMES.index('sqft')
+
+
+def quarter_label(quarter: int) -> str:
+    """'2024Q3' for a quarter index counted from 1970Q1."""
+    return f"{1970 + quarter // 4}Q{quarter % 4 + 1}"
+
+
+def parse_quarter(label: str) -> int:
+    """
+    Quarter index (since 1970Q1) for a label such as '2024Q3'.
+
+    Raises:
+        ValueError: Malformed label
+    """
+    try:
+        year, quarter = str(label).upper().split('Q')
+        year, quarter = int(year), int(quarter)
+    except ValueError:
+        raise ValueError(f"Invalid quarter: {label} (expected e.g. 2024Q3)")
+    if not 1 <= quarter <= 4 or year < 1970:
+        raise ValueError(f"Invalid quarter: {label} (expected e.g. 2024Q3)")
+    return (year - 1970) * 4 + quarter - 1
+
+
+def sale_quarters(sale_days: np.ndarray) -> np.ndarray:
+    """Quarter index (since 1970Q1) of each epoch-day sale date."""
+    months = np.asarray(sale_days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return months // 3
+
+
+class PriceGrid:
+    """
+    Count, median and IQR of price_per_sqft per grid cell (all-time and per quarter).
+
+    Attributes:
+        cell_degrees: Cell size in degrees of latitude and longitude
+        size: Corpus rows covered
+        groups: $/sqft statistics keyed by packed cell/bucket key
+    """
+
+    def __init__(self, cell_degrees: float, size: int, groups: Optional[SortedGroups] = None):
+        self.cell_degrees = cell_degrees
+        self.size = size
+        self.groups = groups
+
+    @property
+    def table(self) -> Dict[str, np.ndarray]:
+        return self.groups.table
+
+    def _cell_keys(self, latitudes, longitudes, buckets) -> np.ndarray:
+        rows = np.floor(np.asarray(latitudes) / self.cell_degrees).astype(np.int64) + _FIELD_OFFSET
+        cols = np.floor(np.asarray(longitudes) / self.cell_degrees).astype(np.int64) + _FIELD_OFFSET
+        return (rows << (2 * _FIELD_BITS)) | (cols << _FIELD_BITS) | np.asarray(buckets, dtype=np.int64)
+
+    def _entries(self, corpus: SalesCorpus, start: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Unsorted (keys, $/sqft) entries for corpus rows [start, len(corpus))."""
+        features = corpus.features[start:]
+        sqft, prices = features[:, _SQFT], corpus.prices[start:]
+        valid = (sqft > 0) & (prices > 0)
+        lat, lon = features[valid, 0], features[valid, 1]
+        values = prices[valid] / sqft[valid]
+        quarters = sale_quarters(corpus.sale_days[start:][valid])
+        keys = np.concatenate([
+            self._cell_keys(lat, lon, np.full(len(values), ALL_TIME)),
+            self._cell_keys(lat, lon, quarters + 1),
+        ])
+        return keys, np.concatenate([values, values])
+
+    @classmethod
+    def build(cls, corpus: SalesCorpus, cell_degrees: float = DEFAULT_CELL_DEGREES) -> 'PriceGrid':
+        grid = cls(cell_degrees, len(corpus))
+        grid.groups = SortedGroups.build(*grid._entries(corpus, 0))
+        return grid
+
+    def updated(self, corpus: SalesCorpus) -> 'PriceGrid':
+        """
+        Grid for a corpus extending the one this grid covers with appended rows.
+
+        Only the cells touched by the appended sales are recomputed; this grid
+        is left unchanged.
+        """
+        groups = self.groups.inserted(*self._entries(corpus, self.size))
+        return PriceGrid(self.cell_degrees, len(corpus), groups)
+
+    def _stats_dicts(self, positions: np.ndarray) -> List[Dict[str, Any]]:
+        keys = self.table['keys'][positions]
+        rows = (keys >> (2 * _FIELD_BITS)) - _FIELD_OFFSET
+        cols = ((keys >> _FIELD_BITS) & _FIELD_MASK) - _FIELD_OFFSET
+        q1, median, q3 = (self.table[name][positions] for name in ('q1', 'median', 'q3'))
+        columns = {
+            'latitude': np.round((rows + 0.5) * self.cell_degrees, 6),
+            'longitude': np.round((cols + 0.5) * self.cell_degrees, 6),
+            'count': self.table['count'][positions],
+            'median_price_per_sqft': np.round(median, 2),
+            'q1_price_per_sqft': np.round(q1, 2),
+            'q3_price_per_sqft': np.round(q3, 2),
+            'iqr_price_per_sqft': np.round(q3 - q1, 2),
+        }
+        names = list(columns)
+        return [dict(zip(names, row)) for row in zip(*(columns[name].tolist() for name in names))]
+
+    def cell_stats(self, latitude: float, longitude: float, quarter: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Statistics of the cell containing a point (all-time, or one quarter), or None if it has no sales."""
+        key = int(self._cell_keys(latitude, longitude, ALL_TIME if quarter is None else quarter + 1))
+        position = int(np.searchsorted(self.table['keys'], key))
+        if position == len(self.table['keys']) or self.table['keys'][position] != key:
+            return None
+        return self._stats_dicts(np.array([position]))[0]
+
+    def cells_in_bbox(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        quarter: Optional[int] = None,
+        min_count: int = 1
+    ) -> List[Dict[str, Any]]:
+        """Statistics of every populated cell overlapping the box, row-major from the south-west."""
+        keys = self.table['keys']
+        bucket = ALL_TIME if quarter is None else quarter + 1
+        rows = (keys >> (2 * _FIELD_BITS)) - _FIELD_OFFSET
+        cols = ((keys >> _FIELD_BITS) & _FIELD_MASK) - _FIELD_OFFSET
+        mask = (
+            ((keys & _FIELD_MASK) == bucket) & (self.table['count'] >= min_count)
+            & (rows >= np.floor(min_lat / self.cell_degrees)) & (rows <= np.floor(max_lat / self.cell_degrees))
+            & (cols >= np.floor(min_lon / self.cell_degrees)) & (cols <= np.floor(max_lon / self.cell_degrees))
+        )
+        return self._stats_dicts(np.flatnonzero(mask))
+
+    def quarters(self) -> List[str]:
+        """Labels of the quarters with sales, oldest first."""
+        buckets = np.unique(self.table['keys'] & _FIELD_MASK)
+        return [quarter_label(int(bucket) - 1) for bucket in buckets if bucket != ALL_TIME]
+
+
+def cell_degrees_from_env() -> float:
+    """Price grid cell size from PRICE_GRID_CELL_DEGREES (default DEFAULT_CELL_DEGREES)."""
+    try:
+        cell_degrees = float(os.environ.get('PRICE_GRID_CELL_DEGREES', DEFAULT_CELL_DEGREES))
+    except ValueError:
+        return DEFAULT_CELL_DEGREES
+    return cell_degrees if cell_degrees > 0 else DEFAULT_CELL_DEGREES
+
+
+PRICE_GRID_CELL_DEGREES = cell_degrees_from_env()
+
+
+def price_grid(corpus: SalesCorpus, cell_degrees: float = PRICE_GRID_CELL_DEGREES) -> PriceGrid:
+    """
+    The corpus's price grid, built on first use per snapshot.
+
+    Snapshots produced by SalesCorpus.append update their parent's grid with
+    the appended sales instead of rebuilding it.
+    """
+    return corpus.lazy_index(
+        f'price_grid:{cell_degrees}',
+        lambda: PriceGrid.build(corpus, cell_degrees),
+        update=lambda previous: previous.updated(corpus)
+    )
@@ -0,0 +1,195 @@
+"""
+Response serialization for the API.
+
+Picks the fastest available JSON encoder (orjson when installed, stdlib json
+otherwise), negotiates MessagePack from the Accept header when msgpack is
+installed, and supports a compact mode that drops echoed inputs and rounds
+floats (except coordinates) to shrink large analysis responses. Bodies are then compressed according
+to Accept-Encoding (see utils.compression).
+"""
+import json
+import math
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .compression import CachedBody, ResponseBodyCache, negotiate_encoding
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+# Response keys that only echo the request back; dropped in compact mode
+ECHOED_INPUT_KEYS = ('subject_home',)
+
+# Decimal places floats are rounded to in compact mode
+COMPACT_FLOAT_DIGITS = 2
+
+# Keys whose values are coordinates (or coordinate extents) and keep full
+# precision in compact mode: 2 decimal places of a degree is ~1 km
+COORDINATE_KEYS = ('latitude', 'longitude', 'lat', 'lon', 'bbox', 'centroid', 'cell_degrees')
+
+
+def _default(value: Any) -> Any:
+    """Fallback conversion for types the encoders don't handle natively."""
+    # NumPy scalars and arrays
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Encode to compact JSON bytes with the fastest available encoder."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def dumps_msgpack(payload: Any) -> bytes:
+    """Encode to MessagePack bytes (requires the optional msgpack package)."""
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(payload, default=_default, use_bin_type=True)
+
+
+# mimetype -> encoder, in server preference order
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {JSON_MIMETYPE: dumps_json}
+if msgpack is not None:
+    for _mimetype in MSGPACK_MIMETYPES:
+        ENCODERS[_mimetype] = dumps_msgpack
+
+
+def negotiate_mimetype(accept_header: Optional[str]) -> str:
+    """
+    Pick the response mimetype from an Accept header.
+
+    MessagePack is chosen when the client lists it ahead of (or with a higher
+    quality than) JSON and the msgpack package is installed; everything else,
+    including */*, gets JSON. Entries with q=0 (or below) are "not
+    acceptable" and never chosen.
+    """
+    if not accept_header:
+        return JSON_MIMETYPE
+
+    best_mimetype, best_quality = JSON_MIMETYPE, -1.0
+    for part in accept_header.split(','):
+        fields = part.strip().split(';')
+        mimetype = fields[0].strip().lower()
+        quality = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if mimetype in ENCODERS and quality > 0 and quality > best_quality:
+            best_mimetype, best_quality = mimetype, quality
+
+    return best_mimetype
+
+
+def compact_payload(value: Any, digits: int = COMPACT_FLOAT_DIGITS, top_level: bool = True) -> Any:
+    """
+    Shrink a response payload: drop echoed inputs and round floats, except
+    the values of COORDINATE_KEYS.
+
+    Args:
+        value: Response payload (dicts/lists/scalars)
+        digits: Decimal places to keep on floats
+    """
+    if isinstance(value, dict):
+        return {
+            key: item if key in COORDINATE_KEYS else compact_payload(item, digits, top_level=False)
+            for key, item in value.items()
+            if not (top_level and key in ECHOED_INPUT_KEYS)
+        }
+    if isinstance(value, list):
+        return [compact_payload(item, digits, top_level=False) for item in value]
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        rounded = round(value, digits)
+        return int(rounded) if rounded.is_integer() else rounded
+    return value
+
+
+def is_truthy(value: Optional[str]) -> bool:
+    """Interpret a query-string flag such as compact=true / compact=1."""
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def encode_payload(payload: Any, accept_header: Optional[str] = None, compact: bool = False) -> Tuple[bytes, str]:
+    """
+    Serialize a payload for the negotiated content type.
+
+    Returns:
+        (body bytes, mimetype)
+    """
+    if compact:
+        payload = compact_payload(payload)
+    mimetype = negotiate_mimetype(accept_header)
+    return ENCODERS[mimetype](payload), mimetype
+
+
+# Encoded (and compressed) bodies of cacheable responses, keyed by
+# (cache key, negotiated mimetype, compact flag)
+response_cache = ResponseBodyCache()
+
+
+def _request_format() -> Tuple[str, bool]:
+    from flask import request
+    return negotiate_mimetype(request.headers.get('Accept')), is_truthy(request.args.get('compact'))
+
+
+def _send(entry: CachedBody, status: int):
+    from flask import Response, request
+
+    body, encoding = entry.variant(negotiate_encoding(request.headers.get('Accept-Encoding')))
+    response = Response(body, status=status, mimetype=entry.mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+
+def make_api_response(payload: Any, status: int = 200, cache_key: Optional[Hashable] = None):
+    """
+    Build a Flask response for the current request.
+
+    Honors the Accept header (JSON or MessagePack), the `compact` query
+    parameter and Accept-Encoding (gzip/brotli above a size threshold).
+
+    Args:
+        payload: Response payload
+        status: HTTP status code
+        cache_key: When given, the encoded body and its compressed variants are
+            kept so cached_api_response() can serve later hits without
+            re-encoding or recompressing
+    """
+    mimetype, compact = _request_format()
+    entry = CachedBody(ENCODERS[mimetype](compact_payload(payload) if compact else payload), mimetype)
+    if cache_key is not None:
+        response_cache.put((cache_key, mimetype, compact), entry)
+    return _send(entry, status)
+
+
+def cached_api_response(cache_key: Hashable):
+    """Response for a previously cached payload in the current request's format, or None."""
+    mimetype, compact = _request_format()
+    entry = response_cache.get((cache_key, mimetype, compact))
+    if entry is None:
+        return None
+    return _send(entry, 200)
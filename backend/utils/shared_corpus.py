@@ -0,0 +1,319 @@
+"""
+Shared-memory storage for the prepared sales corpus.
+
+One process builds the corpus and publishes its arrays into a named
+shared-memory segment; every worker attaches to the segment and wraps the
+buffers in read-only NumPy views, so the corpus is mapped once per machine
+instead of copied into every worker's heap.
+
+A small control segment holds a generation counter. Publishing writes a new
+data segment first and only then bumps the counter, so readers either see the
+old generation or the complete new one. Publishers are serialized across
+processes by an advisory lock file, so the counter only moves forward.
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: publishing is only serialized within one process
+    fcntl = None
+
+from .corpus import CodeBook, SalesCorpus, FeatureStats, NormalizedFeatures
+from .spatial_index import GridSpatialIndex
+from .sorted_index import SortedColumnIndex
+
+# Control segment layout: int64 generation counter (plus reserved padding)
+CONTROL_SIZE = 64
+
+# Every array in the data segment starts on a cache-line boundary
+ALIGNMENT = 64
+
+# Bytes reserved at the start of the data segment for the header length
+HEADER_LENGTH_BYTES = 8
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _untrack(segment: shared_memory.SharedMemory) -> None:
+    """
+    Stop the multiprocessing resource tracker from unlinking the segment.
+
+    Segments are shared between unrelated worker processes, so the lifetime is
+    managed explicitly through SharedCorpusStore.unlink() instead.
+    """
+    try:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def _unlink(segment: shared_memory.SharedMemory) -> None:
+    """Unlink an untracked segment (SharedMemory.unlink() expects it to be tracked)."""
+    try:
+        resource_tracker.register(segment._name, 'shared_memory')
+    except Exception:
+        pass
+    segment.close()
+    segment.unlink()
+
+
+class PackedRecords:
+    """
+    Read-only sequence of record dicts stored as one JSON byte blob.
+
+    Only rows that are actually returned to a client get decoded, so workers
+    never materialize the full list of comparable dicts.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_records(cls, records) -> 'PackedRecords':
+        encoded = [json.dumps(r, separators=(',', ':'), default=str).encode('utf-8') for r in records]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(e) for e in encoded])
+        blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self.blob[start:end].tobytes())
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+
+class SharedCorpusStore:
+    """
+    Publishes and attaches SalesCorpus snapshots in named shared memory.
+
+    Segment names:
+        <name>_ctl    control segment holding the generation counter
+        <name>_g<N>   data segment for generation N
+
+    Publishers hold <tmpdir>/<name>.lock (see lock()).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._control: Optional[shared_memory.SharedMemory] = None
+        self._attached: Optional[Tuple[int, SalesCorpus]] = None
+        self._lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_handle = None
+
+    @contextmanager
+    def lock(self):
+        """
+        Exclusive publish lock: a process-local lock plus an advisory file
+        lock (where supported) shared by every process using this store name.
+
+        Re-entrant within a thread, so callers can hold it around a
+        read-modify-publish sequence that calls publish().
+        """
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                self._lock_handle = open(self._lock_path, 'a')
+                if fcntl is not None:
+                    fcntl.flock(self._lock_handle, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    if fcntl is not None:
+                        fcntl.flock(self._lock_handle, fcntl.LOCK_UN)
+                    self._lock_handle.close()
+                    self._lock_handle = None
+
+    # ------------------------------------------------------------------
+    # Control segment
+    # ------------------------------------------------------------------
+
+    def _control_segment(self) -> shared_memory.SharedMemory:
+        if self._control is None:
+            try:
+                self._control = shared_memory.SharedMemory(name=f"{self.name}_ctl", create=True, size=CONTROL_SIZE)
+                self._control.buf[:CONTROL_SIZE] = bytes(CONTROL_SIZE)
+            except FileExistsError:
+                self._control = shared_memory.SharedMemory(name=f"{self.name}_ctl")
+            _untrack(self._control)
+        return self._control
+
+    def _counter(self) -> np.ndarray:
+        return np.ndarray((1,), dtype=np.int64, buffer=self._control_segment().buf)
+
+    def generation(self) -> int:
+        """Currently published generation (0 = nothing published yet)."""
+        return int(self._counter()[0])
+
+    # ------------------------------------------------------------------
+    # Publishing
+    # ------------------------------------------------------------------
+
+    def publish(self, corpus: SalesCorpus) -> int:
+        """
+        Copy a corpus into a new data segment and make it the current generation.
+
+        Runs under lock(): the new generation is always above the published
+        one, and only the generation it replaces is unlinked.
+
+        Returns:
+            The generation number that was published
+        """
+        records = corpus.records
+        if not (isinstance(records, PackedRecords) and len(records) == len(corpus)):
+            records = PackedRecords.from_records(corpus.iter_records())
+        arrays = corpus.to_arrays()
+        arrays['records_blob'] = records.blob
+        arrays['records_offsets'] = records.offsets
+
+        # Lay out arrays after the header
+        layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            arrays[key] = array
+            layout[key] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = _align(offset + array.nbytes)
+
+        header = json.dumps({
+            'version': corpus.version,
+            'source_signature': corpus.source_signature,
+            'codebook': corpus.codebook.values,
+            'arrays': layout,
+        }, default=str).encode('utf-8')
+        data_start = _align(HEADER_LENGTH_BYTES + len(header))
+        total_size = max(data_start + offset, 1)
+
+        with self.lock():
+            counter = self._counter()
+            previous = int(counter[0])
+            generation = previous + 1
+            while True:
+                try:
+                    segment = shared_memory.SharedMemory(name=f"{self.name}_g{generation}", create=True, size=total_size)
+                    break
+                except FileExistsError:
+                    # Left behind by a publisher that died before bumping the counter
+                    generation += 1
+            _untrack(segment)
+
+            segment.buf[:HEADER_LENGTH_BYTES] = len(header).to_bytes(HEADER_LENGTH_BYTES, 'little')
+            segment.buf[HEADER_LENGTH_BYTES:HEADER_LENGTH_BYTES + len(header)] = header
+            for key, array in arrays.items():
+                start = data_start + layout[key]['offset']
+                target = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf, offset=start)
+                target[...] = array
+                del target
+
+            # Publish: a single aligned 8-byte store flips readers to the new generation
+            counter[0] = max(generation, int(counter[0]))
+            segment.close()
+
+            if 0 < previous < generation:
+                self._unlink_generation(previous)
+
+        return generation
+
+    def _unlink_generation(self, generation: int) -> None:
+        """Remove an old data segment; processes still attached keep their mapping."""
+        try:
+            old = shared_memory.SharedMemory(name=f"{self.name}_g{generation}")
+        except FileNotFoundError:
+            return
+        _unlink(old)
+
+    # ------------------------------------------------------------------
+    # Attaching
+    # ------------------------------------------------------------------
+
+    def current(self) -> Optional[SalesCorpus]:
+        """
+        Return the corpus for the current generation, attaching on first use.
+
+        Reading the counter is a single memory load, so this is cheap to call
+        on every request.
+        """
+        while True:
+            generation = self.generation()
+            if generation == 0:
+                return None
+            if self._attached is not None and self._attached[0] == generation:
+                return self._attached[1]
+            try:
+                corpus = self._attach(generation)
+            except FileNotFoundError:
+                # Superseded between reading the counter and attaching; retry
+                continue
+            self._attached = (generation, corpus)
+            return corpus
+
+    def _attach(self, generation: int) -> SalesCorpus:
+        segment = shared_memory.SharedMemory(name=f"{self.name}_g{generation}")
+        _untrack(segment)
+
+        header_length = int.from_bytes(bytes(segment.buf[:HEADER_LENGTH_BYTES]), 'little')
+        header = json.loads(bytes(segment.buf[HEADER_LENGTH_BYTES:HEADER_LENGTH_BYTES + header_length]))
+        data_start = _align(HEADER_LENGTH_BYTES + header_length)
+
+        arrays = {}
+        for key, spec in header['arrays'].items():
+            view = np.ndarray(
+                tuple(spec['shape']),
+                dtype=np.dtype(spec['dtype']),
+                buffer=segment.buf,
+                offset=data_start + spec['offset']
+            )
+            view.flags.writeable = False
+            arrays[key] = view
+
+        corpus = SalesCorpus(
+            records=PackedRecords(arrays['records_blob'], arrays['records_offsets']),
+            features=arrays['features'],
+            sale_days=arrays['sale_days'],
+            prices=arrays['prices'],
+            spatial_index=GridSpatialIndex.from_arrays(arrays),
+            version=header['version'],
+            source_signature=header['source_signature'],
+            date_index=SortedColumnIndex.from_arrays(arrays, 'date'),
+            stats=FeatureStats.from_arrays(arrays),
+            attributes=arrays['attributes'],
+            codes=arrays['codes'],
+            codebook=CodeBook(header['codebook'])
+        )
+        corpus._normalized = NormalizedFeatures.from_arrays(arrays)
+        # Keep the mapping alive for as long as the corpus is referenced
+        corpus._shared_segment = segment
+        return corpus
+
+    def unlink(self) -> None:
+        """Remove the current data segment and the control segment."""
+        generation = self.generation()
+        if generation:
+            self._unlink_generation(generation)
+        control = self._control_segment()
+        self._control = None
+        _unlink(control)
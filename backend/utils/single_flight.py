@@ -0,0 +1,102 @@
+"""
+Single-flight request coalescing.
+
+When several identical requests arrive while one is still being computed,
+only the first one (the leader) runs the computation; the others wait for
+its result, or its exception, instead of repeating the work.
+"""
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a waiter gives up on an in-flight computation."""
+
+
+class _Call:
+    """One in-flight computation shared by its leader and waiters."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one computation.
+
+    The result object is shared by every caller, so it must be treated as
+    read-only. Only in-flight calls are coalesced; nothing is cached after the
+    leader finishes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Run `fn` unless an identical call is already in flight, then share its outcome.
+
+        Args:
+            key: Identity of the computation
+            fn: Zero-argument callable computing the result
+            timeout: Seconds a waiter waits for the leader (None = forever). The
+                leader itself always runs to completion.
+
+        Returns:
+            (result, shared) - shared is True when the result came from another caller
+
+        Raises:
+            SingleFlightTimeout: A waiter timed out
+            Exception: Whatever `fn` raised, re-raised in the leader and every waiter
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            raise SingleFlightTimeout(f"Timed out after {timeout}s waiting for an identical in-flight request")
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def in_flight(self) -> int:
+        """Number of distinct computations currently running."""
+        with self._lock:
+            return len(self._calls)
+
+
+def canonical_request_key(endpoint: str, payload: Any, corpus_version: Optional[str] = None) -> str:
+    """
+    Stable hash of a request: endpoint, canonical JSON payload and corpus version.
+
+    Key order and whitespace in the payload don't affect the hash, so
+    semantically identical bodies coalesce.
+    """
+    digest = hashlib.sha256()
+    digest.update(endpoint.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update((corpus_version or '').encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8'))
+    return digest.hexdigest()
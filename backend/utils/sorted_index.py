@@ -0,0 +1,135 @@
+"""
+Sorted single-column index with cheap inserts.
+
+Rows are kept in a sorted base array for binary search. New rows go into a
+small unsorted pending buffer that is scanned on each query; once the buffer
+grows past a fraction of the base, the two are merged into a new base. That
+keeps inserts amortized O(log n) while range queries stay O(log n + matches).
+"""
+from typing import Dict, Optional
+import numpy as np
+
+# Pending rows are merged into the sorted base once they exceed this fraction of it
+MERGE_FRACTION = 0.125
+
+# ...but never merge for fewer pending rows than this
+MIN_MERGE_SIZE = 1024
+
+
+class SortedColumnIndex:
+    """
+    Index over one numeric column supporting inclusive range queries.
+
+    Snapshot readers pass `limit` (their row count) so rows inserted after the
+    snapshot was taken are invisible to them.
+    """
+
+    def __init__(self, values: np.ndarray, row_ids: np.ndarray):
+        self.values = values
+        self.row_ids = row_ids
+        self._pending_values = []
+        self._pending_rows = []
+
+    @classmethod
+    def from_values(cls, column: np.ndarray) -> 'SortedColumnIndex':
+        """Build the index for a column (row i = column[i])."""
+        column = np.asarray(column)
+        order = np.argsort(column, kind='stable').astype(np.int64)
+        return cls(column[order], order)
+
+    def __len__(self) -> int:
+        return len(self.row_ids) + len(self._pending_rows)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending_rows)
+
+    def insert(self, value, row: int) -> None:
+        """Add one row; it is visible to queries immediately."""
+        self._pending_values.append(value)
+        self._pending_rows.append(row)
+
+    def copy(self) -> 'SortedColumnIndex':
+        """Index with the same rows whose later inserts don't affect this one (shares the sorted base)."""
+        pending_values, pending_rows = self._pending_arrays()
+        index = SortedColumnIndex(self.values, self.row_ids)
+        index._pending_values = pending_values.tolist()
+        index._pending_rows = pending_rows.tolist()
+        return index
+
+    def needs_merge(self) -> bool:
+        """True when the pending buffer is large enough to be worth merging."""
+        return self.pending_count > max(MIN_MERGE_SIZE, int(len(self.row_ids) * MERGE_FRACTION))
+
+    def merged(self) -> 'SortedColumnIndex':
+        """Return a new index with the pending rows merged into the sorted base."""
+        if not self._pending_rows:
+            return self
+        pending_values = np.asarray(self._pending_values, dtype=self.values.dtype)
+        pending_rows = np.asarray(self._pending_rows, dtype=np.int64)
+        values = np.concatenate([self.values, pending_values])
+        rows = np.concatenate([self.row_ids, pending_rows])
+        order = np.argsort(values, kind='stable')
+        return SortedColumnIndex(values[order], rows[order])
+
+    def range(self, low=None, high=None, limit: Optional[int] = None) -> np.ndarray:
+        """
+        Row ids with low <= value <= high (either bound may be None).
+
+        Args:
+            low: Inclusive lower bound
+            high: Inclusive upper bound
+            limit: Only return rows < limit (snapshot size)
+        """
+        start = 0 if low is None else int(np.searchsorted(self.values, low, side='left'))
+        end = len(self.values) if high is None else int(np.searchsorted(self.values, high, side='right'))
+        rows = self.row_ids[start:end]
+        return self._with_pending(rows, low, high, limit)
+
+    def ranges(self, lows: np.ndarray, highs: np.ndarray, limit: Optional[int] = None) -> np.ndarray:
+        """Union of several inclusive ranges (one binary search pair per range)."""
+        starts = np.searchsorted(self.values, lows, side='left')
+        ends = np.searchsorted(self.values, highs, side='right')
+        slices = [self.row_ids[s:e] for s, e in zip(starts, ends) if e > s]
+        rows = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+        if self._pending_rows:
+            pending_values, pending_rows = self._pending_arrays()
+            matches = np.zeros(len(pending_rows), dtype=bool)
+            for low, high in zip(lows, highs):
+                matches |= (pending_values >= low) & (pending_values <= high)
+            rows = np.concatenate([rows, pending_rows[matches]])
+
+        if limit is not None:
+            rows = rows[rows < limit]
+        return rows
+
+    def _pending_arrays(self):
+        # Copy lengths first: a concurrent insert may append between the two reads
+        count = min(len(self._pending_values), len(self._pending_rows))
+        return (
+            np.asarray(self._pending_values[:count], dtype=self.values.dtype),
+            np.asarray(self._pending_rows[:count], dtype=np.int64),
+        )
+
+    def _with_pending(self, rows: np.ndarray, low, high, limit: Optional[int]) -> np.ndarray:
+        if self._pending_rows:
+            pending_values, pending_rows = self._pending_arrays()
+            mask = np.ones(len(pending_rows), dtype=bool)
+            if low is not None:
+                mask &= pending_values >= low
+            if high is not None:
+                mask &= pending_values <= high
+            rows = np.concatenate([rows, pending_rows[mask]])
+        if limit is not None:
+            rows = rows[rows < limit]
+        return rows
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        """Export as plain arrays (pending rows are merged first)."""
+        index = self.merged()
+        return {f'{prefix}_values': index.values, f'{prefix}_row_ids': index.row_ids}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], prefix: str) -> 'SortedColumnIndex':
+        return cls(arrays[f'{prefix}_values'], arrays[f'{prefix}_row_ids'])
@@ -0,0 +1,138 @@
+"""
+Grid-based spatial index over latitude/longitude coordinates.
+
+Each row is mapped to a packed grid-cell key and the keys are kept in a
+SortedColumnIndex, so the index is two flat arrays (easy to place in shared
+memory) and supports cheap inserts for newly ingested sales.
+"""
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+from .sorted_index import SortedColumnIndex
+
+# Roughly 0.7 miles of latitude per cell in the Phoenix area
+DEFAULT_CELL_DEGREES = 0.01
+
+# Column offset used to pack (row, col) cell coordinates into a single int64 key
+_KEY_STRIDE = 1 << 20
+# Columns are stored shifted by this offset so the packed column is always
+# non-negative and `key // _KEY_STRIDE` recovers the grid row exactly, even for
+# longitudes west of the origin (e.g. an index whose origin is (0, 0))
+_COL_OFFSET = _KEY_STRIDE >> 1
+
+
+class GridSpatialIndex:
+    """
+    Fixed-size lat/lon grid index.
+
+    Every row is assigned to the cell that contains its coordinates. Rows are
+    kept sorted by cell key so a bounding-box query is one binary search per
+    grid row the box overlaps.
+    """
+
+    def __init__(
+        self,
+        cells: SortedColumnIndex,
+        origin: Tuple[float, float],
+        cell_degrees: float = DEFAULT_CELL_DEGREES
+    ):
+        self.cells = cells
+        self.origin = origin
+        self.cell_degrees = cell_degrees
+
+    @classmethod
+    def from_coordinates(
+        cls,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        cell_degrees: float = DEFAULT_CELL_DEGREES
+    ) -> 'GridSpatialIndex':
+        """Build the index for the given coordinate columns."""
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+
+        if len(latitudes) == 0:
+            origin = (0.0, 0.0)
+        else:
+            origin = (float(latitudes.min()), float(longitudes.min()))
+
+        index = cls(SortedColumnIndex.from_values(np.empty(0, dtype=np.int64)), origin, cell_degrees)
+        index.cells = SortedColumnIndex.from_values(index.cell_keys_for(latitudes, longitudes))
+        return index
+
+    def cell_keys_for(self, latitudes, longitudes) -> np.ndarray:
+        """Map coordinates to packed int64 cell keys."""
+        rows = np.floor((np.asarray(latitudes) - self.origin[0]) / self.cell_degrees).astype(np.int64)
+        cols = np.floor((np.asarray(longitudes) - self.origin[1]) / self.cell_degrees).astype(np.int64)
+        return rows * _KEY_STRIDE + cols + _COL_OFFSET
+
+    def insert(self, row: int, latitude: float, longitude: float) -> None:
+        """Add one row to the index."""
+        self.cells.insert(int(self.cell_keys_for(latitude, longitude)), row)
+
+    def needs_merge(self) -> bool:
+        return self.cells.needs_merge()
+
+    def merged(self) -> 'GridSpatialIndex':
+        """Return an index with pending inserts merged into the sorted base."""
+        return GridSpatialIndex(self.cells.merged(), self.origin, self.cell_degrees)
+
+    def query_bbox(
+        self,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float,
+        limit: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        Return row ids of every point in the cells overlapping the bounding box.
+
+        The result is a superset of the points strictly inside the box; callers
+        that need an exact answer filter the candidates against the coordinates.
+
+        Args:
+            limit: Only return rows < limit (snapshot size)
+        """
+        if len(self.cells) == 0 or min_lat > max_lat or min_lon > max_lon:
+            return np.empty(0, dtype=np.int64)
+
+        row_lo = int(np.floor((min_lat - self.origin[0]) / self.cell_degrees))
+        row_hi = int(np.floor((max_lat - self.origin[0]) / self.cell_degrees))
+        col_lo = int(np.floor((min_lon - self.origin[1]) / self.cell_degrees))
+        col_hi = int(np.floor((max_lon - self.origin[1]) / self.cell_degrees))
+        # Keep the column range inside one packed grid row
+        col_lo = max(col_lo, -_COL_OFFSET)
+        col_hi = min(col_hi, _COL_OFFSET - 1)
+        if col_lo > col_hi:
+            return np.empty(0, dtype=np.int64)
+
+        # Clamp to the populated extent so huge boxes don't loop over empty rows
+        if len(self.cells.values) and not self.cells.pending_count:
+            row_lo = max(row_lo, int(self.cells.values[0] // _KEY_STRIDE))
+            row_hi = min(row_hi, int(self.cells.values[-1] // _KEY_STRIDE))
+        if row_lo > row_hi:
+            return np.empty(0, dtype=np.int64)
+
+        grid_rows = np.arange(row_lo, row_hi + 1, dtype=np.int64)
+        return self.cells.ranges(
+            grid_rows * _KEY_STRIDE + col_lo + _COL_OFFSET,
+            grid_rows * _KEY_STRIDE + col_hi + _COL_OFFSET,
+            limit=limit
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Export the index as plain arrays (for shared memory publishing)."""
+        arrays = self.cells.to_arrays('spatial_cells')
+        arrays['spatial_meta'] = np.array([self.origin[0], self.origin[1], self.cell_degrees], dtype=np.float64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'GridSpatialIndex':
+        """Rebuild an index from arrays produced by `to_arrays`."""
+        meta = arrays['spatial_meta']
+        return cls(
+            SortedColumnIndex.from_arrays(arrays, 'spatial_cells'),
+            (float(meta[0]), float(meta[1])),
+            float(meta[2])
+        )
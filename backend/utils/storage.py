@@ -0,0 +1,428 @@
+"""
+Pluggable storage for the comparable sales behind the corpus.
+
+JsonSalesStorage is the original layout (one <MARKET>_SALES_RECORDS.json file
+per market plus its write-ahead log). SqliteSalesStorage keeps normalized
+sales of every market in a typed SQLite table, indexed only for the queries
+it runs: a market's rows in id order, and listing ids for re-imports. It
+runs in WAL mode behind a small per-process connection pool, so any number
+of worker processes can read it while one writes. Candidate queries
+(nearest, bounding box, filters) are served by the in-memory corpus built
+from these rows, not by the database; the default market's corpus can be
+published to shared memory (CORPUS_SHARED_MEMORY_NAME) so workers don't
+each hold a copy.
+
+Select the backend with SALES_STORAGE=json|sqlite (SALES_DB_PATH for the
+database file); populate the database with import_sales.py.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .data_loader import (
+    DATA_DIR,
+    SALES_RECORDS_FILE,
+    SALES_RECORDS_SUFFIX,
+    append_sales_wal,
+    compact_sales_wal,
+    get_all_comparable_properties,
+    is_wal_compaction_marker,
+    normalize_valid_comparables,
+    records_file_market,
+    sales_records_signature,
+    sales_wal_size,
+)
+
+SALES_DB_FILE = 'sales.db'
+DEFAULT_POOL_SIZE = 4
+
+# Seconds a connection waits on a lock held by another writer
+DEFAULT_BUSY_TIMEOUT = 30.0
+
+# Memory-map the database so worker processes share its pages through the OS cache
+DEFAULT_MMAP_BYTES = 256 * 1024 * 1024
+
+
+class SalesStorage:
+    """
+    Interface the CorpusProvider loads and ingests sales through.
+
+    Implementations return normalized comparables (see
+    data_loader.normalize_comparable_property) in a stable order, so the same
+    data gives the same corpus version whichever backend holds it.
+    """
+
+    def load_comparables(self) -> List[Dict[str, Any]]:
+        """All valid normalized comparables."""
+        raise NotImplementedError
+
+    def signature(self) -> str:
+        """Cheap change detector; differs whenever load_comparables() would."""
+        raise NotImplementedError
+
+    def append(self, listings: List[Dict[str, Any]]) -> None:
+        """Durably add raw listings (PHOENIX_SALES_RECORDS.json `listings` schema)."""
+        raise NotImplementedError
+
+    def pending_bytes(self) -> int:
+        """Bytes of appended data waiting to be compacted (0 if not applicable)."""
+        return 0
+
+    def compact(self) -> int:
+        """Fold appended data into the main store; returns listings moved."""
+        return 0
+
+
+class JsonSalesStorage(SalesStorage):
+    """The JSON sales records file and its write-ahead log in the data directory."""
+
+    def __init__(self, records_file: str = SALES_RECORDS_FILE):
+        self.records_file = records_file
+
+    def load_comparables(self) -> List[Dict[str, Any]]:
+        return get_all_comparable_properties(self.records_file)
+
+    def signature(self) -> str:
+        return sales_records_signature(self.records_file)
+
+    def append(self, listings: List[Dict[str, Any]]) -> None:
+        append_sales_wal(listings, self.records_file)
+
+    def pending_bytes(self) -> int:
+        return sales_wal_size(self.records_file)
+
+    def compact(self) -> int:
+        return compact_sales_wal(self.records_file)
+
+
+class SqliteConnectionPool:
+    """
+    Bounded pool of SQLite connections for one database file.
+
+    Connections are opened lazily, up to `size`, and handed out one per
+    borrower. The pool is per process: after a fork the inherited connections
+    are abandoned (never used or closed in the child) and new ones are opened.
+    """
+
+    def __init__(self, path: str, size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_BUSY_TIMEOUT):
+        self.path = path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._idle: 'queue.LifoQueue[sqlite3.Connection]' = queue.LifoQueue()
+        self._opened = 0
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(f'PRAGMA mmap_size={DEFAULT_MMAP_BYTES}')
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection; waits for one to be returned when all are in use."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = None
+                if self._opened < self.size:
+                    self._opened += 1
+                    connection = self._open()
+        if connection is None:
+            connection = self._idle.get(timeout=self.timeout)
+        try:
+            yield connection
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            self._idle.put(connection)
+
+    def close(self) -> None:
+        """Close the idle connections of this process."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+                return
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._opened = 0
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY,
+    listing_id TEXT,
+    market TEXT,
+    brokerage_region_identifier TEXT,
+    address TEXT,
+    zip TEXT,
+    bedrooms INTEGER,
+    bathrooms INTEGER,
+    sqft INTEGER,
+    year_built INTEGER,
+    lot_sqft INTEGER,
+    garage_spaces INTEGER,
+    has_pool INTEGER,
+    sale_price REAL,
+    sale_date TEXT,
+    latitude REAL,
+    longitude REAL,
+    days_on_market INTEGER,
+    price_per_sqft REAL,
+    dwelling_type TEXT,
+    stories INTEGER,
+    has_solar_panels INTEGER
+);
+DROP INDEX IF EXISTS idx_sales_sale_date;
+DROP INDEX IF EXISTS idx_sales_zip;
+DROP INDEX IF EXISTS idx_sales_sqft;
+CREATE INDEX IF NOT EXISTS idx_sales_market ON sales (market);
+CREATE INDEX IF NOT EXISTS idx_sales_listing_id ON sales (listing_id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+"""
+
+# Columns holding the normalized comparable fields, in normalize_comparable_property order
+COMPARABLE_COLUMNS = (
+    'address', 'bedrooms', 'bathrooms', 'sqft', 'year_built', 'lot_sqft', 'garage_spaces',
+    'has_pool', 'sale_price', 'sale_date', 'latitude', 'longitude', 'days_on_market',
+    'price_per_sqft', 'dwelling_type', 'stories', 'has_solar_panels', 'market',
+    'brokerage_region_identifier',
+)
+
+_BOOLEAN_COLUMNS = ('has_pool', 'has_solar_panels')
+
+_INSERT = (
+    f"INSERT INTO sales (listing_id, zip, {', '.join(COMPARABLE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * (len(COMPARABLE_COLUMNS) + 2))})"
+)
+
+
+def _row_to_comparable(row: sqlite3.Row) -> Dict[str, Any]:
+    comparable = {column: row[column] for column in COMPARABLE_COLUMNS}
+    for column in _BOOLEAN_COLUMNS:
+        if comparable[column] is not None:
+            comparable[column] = bool(comparable[column])
+    comparable['zip_code'] = row['zip']
+    return comparable
+
+
+def _listing_zip(listing: Dict[str, Any]) -> Optional[str]:
+    address = (listing.get('property_details') or {}).get('property_address') or {}
+    return address.get('zip')
+
+
+class SqliteSalesStorage(SalesStorage):
+    """
+    Normalized sales in an SQLite database.
+
+    Market names are stored lowercase; listings without a `market` are
+    stored under the storage's (or the import's) market.
+
+    Args:
+        path: Database file (created with its schema if missing)
+        market: Only read this market's sales, and tag appended listings
+            without a market with it (None = all markets)
+        pool_size: Connections kept per process
+        pool: Existing connection pool for `path` to share (e.g. between
+            the storages of several markets)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        market: Optional[str] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        pool: Optional[SqliteConnectionPool] = None
+    ):
+        self.path = path
+        self.market = market.lower() if market else None
+        self.pool = pool or SqliteConnectionPool(path, pool_size)
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _where(self, clauses: List[str], params: List[Any]) -> Tuple[str, List[Any]]:
+        if self.market is not None:
+            clauses = clauses + ['s.market = ?']
+            params = params + [self.market]
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self.pool.connection() as connection:
+            return [_row_to_comparable(row) for row in connection.execute(sql, tuple(params))]
+
+    def load_comparables(self) -> List[Dict[str, Any]]:
+        where, params = self._where([], [])
+        return self._query(f"SELECT s.* FROM sales s{where} ORDER BY s.id", params)
+
+    def signature(self) -> str:
+        with self.pool.connection() as connection:
+            generation = connection.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+        return f"sqlite:{generation}"
+
+    def append(self, listings: List[Dict[str, Any]]) -> None:
+        self.import_listings(listings)
+
+    def markets(self) -> List[str]:
+        """Markets with sales in the database, sorted."""
+        with self.pool.connection() as connection:
+            rows = connection.execute("SELECT DISTINCT market FROM sales WHERE market IS NOT NULL ORDER BY market")
+            return [row[0] for row in rows]
+
+    def import_listings(
+        self,
+        listings: Iterable[Dict[str, Any]],
+        batch_size: int = 5000,
+        market: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Bulk import raw listings, normalizing them on the way in.
+
+        Listings without a `market` are stored under `market` (default this
+        storage's market).
+
+        Sales stored by an earlier import with the same listing `id` are
+        replaced, so re-importing a file is idempotent; repeated ids within
+        one import are all kept, as in the JSON files. Each batch is one
+        transaction; the generation (and so signature()) changes once per batch.
+
+        Returns:
+            {'imported': n, 'rejected': n}
+        """
+        with self.pool.connection() as connection:
+            first_new_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM sales").fetchone()[0]
+        market = (market or self.market or '').lower() or None
+        
+        imported = rejected = 0
+        batch: List[Dict[str, Any]] = []
+        for listing in listings:
+            batch.append(listing)
+            if len(batch) >= batch_size:
+                counts = self._import_batch(batch, first_new_id, market)
+                imported, rejected = imported + counts[0], rejected + counts[1]
+                batch = []
+        if batch:
+            counts = self._import_batch(batch, first_new_id, market)
+            imported, rejected = imported + counts[0], rejected + counts[1]
+        return {'imported': imported, 'rejected': rejected}
+
+    def _import_batch(self, listings: List[Dict[str, Any]], first_new_id: int, market: Optional[str]) -> Tuple[int, int]:
+        rows = []
+        for listing in listings:
+            comparables, _ = normalize_valid_comparables([listing])
+            if comparables:
+                comparable = comparables[0]
+                comparable['market'] = str(comparable.get('market') or market or '').lower() or None
+                rows.append([listing.get('id'), _listing_zip(listing)] + [
+                    int(comparable[column]) if column in _BOOLEAN_COLUMNS and comparable[column] is not None
+                    else comparable[column]
+                    for column in COMPARABLE_COLUMNS
+                ])
+        if not rows:
+            return 0, len(listings)
+
+        with self.pool.connection() as connection:
+            with connection:
+                listing_ids = [row[0] for row in rows if row[0] is not None]
+                for start in range(0, len(listing_ids), 500):
+                    chunk = listing_ids[start:start + 500]
+                    marks = ', '.join('?' * len(chunk))
+                    replaced = f"SELECT id FROM sales WHERE listing_id IN ({marks}) AND id < ?"
+                    connection.execute(f"DELETE FROM sales WHERE id IN ({replaced})", chunk + [first_new_id])
+                connection.executemany(_INSERT, rows)
+                connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+        return len(rows), len(listings) - len(rows)
+
+    def count(self) -> int:
+        where, params = self._where([], [])
+        with self.pool.connection() as connection:
+            return connection.execute(f"SELECT COUNT(*) FROM sales s{where}", params).fetchone()[0]
+
+
+def sales_db_path() -> str:
+    """SQLite database path (SALES_DB_PATH env var overrides data/sales.db)."""
+    return os.environ.get('SALES_DB_PATH') or os.path.join(DATA_DIR, SALES_DB_FILE)
+
+
+# One connection pool per database file, shared by the per-market storages
+_sqlite_pools: Dict[str, SqliteConnectionPool] = {}
+_sqlite_pools_lock = threading.Lock()
+
+
+def _storage_backend() -> str:
+    backend = os.environ.get('SALES_STORAGE', 'json').lower()
+    if backend not in ('json', 'sqlite'):
+        print(f"Warning: unknown SALES_STORAGE {backend!r}, using json")
+        return 'json'
+    return backend
+
+
+def _shared_sqlite_storage(market: Optional[str]) -> SqliteSalesStorage:
+    path = sales_db_path()
+    with _sqlite_pools_lock:
+        pool = _sqlite_pools.get(path)
+        if pool is None:
+            try:
+                pool_size = int(os.environ.get('SALES_DB_POOL_SIZE', DEFAULT_POOL_SIZE))
+            except ValueError:
+                pool_size = DEFAULT_POOL_SIZE
+            pool = _sqlite_pools[path] = SqliteConnectionPool(path, pool_size)
+    return SqliteSalesStorage(path, market=market, pool=pool)
+
+
+def sales_storage_from_env(records_file: str = SALES_RECORDS_FILE) -> SalesStorage:
+    """
+    Storage of one market's sales (default the Phoenix market) from
+    SALES_STORAGE: json (the default) reads `records_file`, sqlite reads the
+    market's rows of the shared database.
+    """
+    if _storage_backend() == 'sqlite':
+        return _shared_sqlite_storage(records_file_market(records_file))
+    return JsonSalesStorage(records_file)
+
+
+def stored_markets_from_env() -> Dict[str, str]:
+    """
+    {market: records file name} of the markets held only by the storage
+    backend (the SQLite database's markets; none for json).
+    """
+    if _storage_backend() != 'sqlite':
+        return {}
+    return {
+        market: f"{market.upper()}{SALES_RECORDS_SUFFIX}"
+        for market in _shared_sqlite_storage(None).markets()
+    }
+
+
+def iter_listings_file(path: str) -> Iterator[Dict[str, Any]]:
+    """Listings from a `{"listings": [...]}` JSON file or a JSONL write-ahead log."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        print(f"Error parsing {path}: {e}")
+                        continue
+                    if not is_wal_compaction_marker(entry):
+                        yield entry
+        else:
+            yield from json.load(f).get('listings', [])
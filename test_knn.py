@@ -1,12 +1,57 @@
 """
 Test KNN implementation directly
 """
+import copy
+import datetime as dt
+import gzip
+import json
+import os
+import shutil
 import sys
+import threading
+import time
 sys.path.insert(0, 'backend')
 
+import numpy as np
+import pytest
+
+import bulk_valuation
+from services.backtester import Backtester
 from services.comparable_selector import ComparableSelector
+from services.conformal import ConformalCalibration
 from services.price_estimator import PriceEstimator
-from utils.data_loader import load_real_data
+from services.weight_tuner import backtest_metrics
+from utils import compression, corpus as corpus_module, data_loader
+from utils.ann_index import IVFIndex, recall_at_k
+from utils.comp_filters import candidate_rows, filter_comparables, parse_filters
+from utils.compression import CachedBody, negotiate_encoding
+from utils.corpus import CorpusProvider, build_corpus, load_sales_corpus, parse_sale_day, today_epoch_day
+from utils.corpus_watcher import CorpusWatcher
+from utils.data_loader import load_real_data, load_sales_records, normalize_valid_comparables
+from utils.distance import iter_pairs_within, scaled_features, tile_shape, top_k_neighbours
+from utils.hedonic import HedonicModel, hedonic_model
+from utils.jobs import CANCELLED, COMPLETED, QUEUED, RUNNING, JobManager, JobQueueFull
+from utils.market_index import MAX_TIME_ADJUSTMENT, market_index
+from utils.market_shards import MarketShards, market_summary
+from utils.ndjson import NDJSON_MIMETYPE
+from utils.price_grid import PriceGrid, price_grid
+from utils.serialization import JSON_MIMETYPE, compact_payload, encode_payload, negotiate_mimetype
+from utils.shared_corpus import PackedRecords, SharedCorpusStore
+from utils.single_flight import SingleFlight, SingleFlightTimeout, canonical_request_key
+from utils.storage import JsonSalesStorage, SqliteSalesStorage
+
+SUBJECT = {
+    'address': 'Test subject',
+    'latitude': 33.45,
+    'longitude': -112.07,
+    'sqft': 1800,
+    'bedrooms': 3,
+    'bathrooms': 2,
+    'year_built': 2001,
+    'has_pool': True,
+    'garage_spaces': 2,
+    'lot_sqft': 6000,
+}
 
 def test_knn():
     print("=" * 80)
@@ -106,5 +151,919 @@ def test_knn():
     print(result.get('methodology', 'N/A'))
     print("=" * 80)
 
+
+def _comparable_key(comp):
+    return (comp['address'], comp['sale_price'], comp['sale_date'])
+
+
+@pytest.fixture(params=[6, 18], ids=['06:00Z', '18:00Z'])
+def frozen_clock(request, monkeypatch):
+    """Pin the current time, before and after the 12:00Z timestamps the sales use."""
+    frozen = dt.datetime(2025, 11, 3, request.param, tzinfo=dt.timezone.utc)
+
+    class FrozenDatetime(dt.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return frozen.astimezone(tz) if tz else frozen.replace(tzinfo=None)
+
+    monkeypatch.setattr(corpus_module, 'datetime', FrozenDatetime)
+    return frozen
+
+
+def test_corpus_knn_matches_list_knn(frozen_clock):
+    """The vectorized corpus path picks the same comps, at the same distances, as the list path."""
+    comps = load_real_data()['comparable_properties']
+    selector = ComparableSelector()
+
+    from_list = selector.select_top_comparables(SUBJECT, comps, num_comps=10)
+    from_corpus = selector.select_from_corpus(SUBJECT, build_corpus(comps), num_comps=10)
+
+    assert len(from_corpus) == 10
+    assert [_comparable_key(c) for c in from_corpus] == [_comparable_key(c) for c in from_list]
+    assert [c['knn_distance'] for c in from_corpus] == pytest.approx([c['knn_distance'] for c in from_list])
+    assert [c['similarity_score'] for c in from_corpus] == pytest.approx([c['similarity_score'] for c in from_list])
+
+
+def test_corpus_sale_dates_match_list_path(frozen_clock):
+    """Missing dates default to 90 days and offset dates are converted to UTC on both paths."""
+    comps = copy.deepcopy(load_real_data()['comparable_properties'][:20])
+    comps[0]['sale_date'] = None
+    comps[1]['sale_date'] = '2024-08-02T23:30:00-07:00'
+    selector = ComparableSelector()
+
+    def days_by_key(results):
+        return {_comparable_key(c): c['score_breakdown']['days_since_sale'] for c in results}
+
+    from_list = days_by_key(selector.select_top_comparables(SUBJECT, comps, num_comps=len(comps)))
+    from_corpus = days_by_key(selector.select_from_corpus(SUBJECT, build_corpus(comps), num_comps=len(comps)))
+
+    assert from_corpus == from_list
+    assert from_corpus[_comparable_key(comps[0])] == 90
+
+
+
+def test_bbox_query_with_columns_west_of_the_grid_origin():
+    """An index grown from an empty corpus has its origin at (0, 0), so every column is negative."""
+    comps = load_real_data()['comparable_properties']
+    sales = (comps * 8)[:1100]
+    corpus = build_corpus([]).append(sales)
+    assert corpus.spatial_index.origin == (0.0, 0.0) and not corpus.spatial_index.cells.pending_count
+
+    inside = [
+        row for row, sale in enumerate(sales)
+        if 33 <= sale['latitude'] <= 34 and -113 <= sale['longitude'] <= -111
+    ]
+    rows = corpus.rows_in_bbox(33, -113, 34, -111)
+    assert len(inside) == 1100 and sorted(rows.tolist()) == inside
+    assert corpus.rows_in_bbox(33.4, -112.1, 33.5, -112.0).size < len(inside)
+
+
+def test_shared_corpus_indexes_read_columns_not_records(monkeypatch):
+    """Attached workers build the filter indexes, market index, hedonic model and extents without decoding records."""
+    comps = load_real_data()['comparable_properties']
+    corpus = build_corpus(comps)
+    store = SharedCorpusStore(f'hpp_test_{os.getpid()}')
+    try:
+        store.publish(corpus)
+        shared = store.current()
+
+        def decode(records, row):
+            raise AssertionError(f'record {row} decoded')
+        monkeypatch.setattr(PackedRecords, '__getitem__', decode)
+
+        constraints = parse_filters({**FILTERS, 'dwelling_type': ['single_family', 'condo']}, SUBJECT)
+        assert candidate_rows(shared, constraints).tolist() == candidate_rows(corpus, constraints).tolist()
+        assert np.array_equal(market_index(shared).table, market_index(corpus).table)
+        assert hedonic_model(shared).coefficients == hedonic_model(corpus).coefficients
+        assert market_summary('phoenix', shared)['regions'] == ['phoenix', 'phoenix_az']
+    finally:
+        store.unlink()
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Private copy of the data directory, so ingests and compactions leave data/ alone."""
+    shutil.copytree(data_loader.DATA_DIR, tmp_path, dirs_exist_ok=True)
+    monkeypatch.setattr(data_loader, 'DATA_DIR', str(tmp_path))
+    return tmp_path
+
+
+def _new_listings(count, prefix='new'):
+    """Valid raw listings copied from the Phoenix records under fresh ids."""
+    listings = [
+        listing for listing in load_sales_records()
+        if normalize_valid_comparables([listing])[0]
+    ][:count]
+    return [{**copy.deepcopy(listing), 'id': f"{prefix}-{i}"} for i, listing in enumerate(listings)]
+
+
+def test_ingest_leaves_earlier_snapshots_unchanged(data_dir):
+    provider = CorpusProvider(storage=JsonSalesStorage())
+    selector = ComparableSelector()
+    before = provider.get()
+    size, version = len(before), before.version
+    comps_before = selector.select_from_corpus(SUBJECT, before, num_comps=10)
+
+    result = provider.ingest(_new_listings(5) + [{'id': 'bad', 'sale_price': 0}])
+    after = provider.get()
+
+    assert (result['accepted'], result['rejected']) == (5, 1)
+    assert len(after) == size + 5 and after.version == result['corpus_version'] != version
+    # The earlier snapshot still sees only its own rows
+    assert len(before) == size and before.version == version
+    assert len(list(before.iter_records())) == size
+    assert selector.select_from_corpus(SUBJECT, before, num_comps=10) == comps_before
+
+    # The appended snapshot selects like a corpus loaded from storage, before and after compaction
+    reloaded = load_sales_corpus(JsonSalesStorage())
+    expected = selector.select_from_corpus(SUBJECT, reloaded, num_comps=10)
+    assert len(reloaded) == len(after)
+    assert [_comparable_key(c) for c in selector.select_from_corpus(SUBJECT, after, num_comps=10)] == \
+        [_comparable_key(c) for c in expected]
+
+    assert JsonSalesStorage().compact() == 5
+    assert len(load_sales_corpus(JsonSalesStorage())) == len(after)
+    assert not (data_dir / data_loader.SALES_WAL_FILE).stat().st_size
+
+
+
+def test_wal_compaction_is_idempotent_after_a_crash(data_dir, monkeypatch):
+    storage = JsonSalesStorage()
+    size = len(storage.load_comparables())
+    storage.append(_new_listings(4))
+
+    # Die after the merged records file is in place but before the WAL is truncated
+    def crash(fd):
+        raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(data_loader.os, 'fstat', crash)
+        with pytest.raises(KeyboardInterrupt):
+            storage.compact()
+
+    assert storage.pending_bytes() > 0
+    assert len(storage.load_comparables()) == size + 4
+
+    storage.append(_new_listings(1, prefix='later'))
+    assert len(storage.load_comparables()) == size + 5
+    assert storage.compact() == 1
+    assert storage.pending_bytes() == 0
+    assert len(storage.load_comparables()) == size + 5
+
+    # Another market's WAL is separate
+    other = JsonSalesStorage('TUCSON_SALES_RECORDS.json')
+    other.append(_new_listings(2, prefix='tucson'))
+    assert (data_dir / 'TUCSON_SALES_RECORDS.wal.jsonl').exists() and storage.pending_bytes() == 0
+    assert other.compact() == 2 and len(other.load_comparables()) == 2
+
+
+def test_sqlite_import_round_trip(data_dir):
+    """A database imported from the JSON files yields the same corpus, before and after a reload."""
+    import import_sales
+
+    json_corpus = load_sales_corpus(JsonSalesStorage())
+    db_path = str(data_dir / 'sales.db')
+    assert import_sales.main(['--db', db_path]) == 0
+
+    storage = SqliteSalesStorage(db_path, market='phoenix')
+    imported = load_sales_corpus(storage)
+    assert imported.version == json_corpus.version and len(imported) == len(json_corpus)
+    assert list(imported.iter_records())[:3] == list(json_corpus.iter_records())[:3]
+
+    # Re-importing replaces what the first import loaded; a fresh connection reads the same corpus
+    assert import_sales.main(['--db', db_path]) == 0
+    storage.pool.close()
+    provider = CorpusProvider(storage=SqliteSalesStorage(db_path, market='phoenix'))
+    assert provider.get().version == json_corpus.version
+    assert provider.storage.count() == len(json_corpus)
+    provider.storage.pool.close()
+
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, JSON_MIMETYPE),
+    ('*/*', JSON_MIMETYPE),
+    ('application/msgpack', 'application/msgpack'),
+    ('application/json, application/msgpack', JSON_MIMETYPE),
+    ('application/json;q=0.5, application/msgpack', 'application/msgpack'),
+    ('application/msgpack;q=0.2, application/json;q=0.8', JSON_MIMETYPE),
+    ('application/msgpack;q=0', JSON_MIMETYPE),
+    ('application/msgpack;q=0, application/json;q=0.1', JSON_MIMETYPE),
+    ('application/json;q=0, application/x-msgpack', 'application/x-msgpack'),
+])
+def test_accept_negotiation(accept, expected):
+    pytest.importorskip('msgpack')
+    assert negotiate_mimetype(accept) == expected
+
+
+def test_msgpack_round_trip_and_compact_mode():
+    msgpack = pytest.importorskip('msgpack')
+    payload = {
+        'subject_home': SUBJECT,
+        'price_per_sqft': 212.34567,
+        'comparables': [{'latitude': 33.4512345, 'longitude': -112.0798765, 'similarity_score': 91.256}],
+        'market': {'bbox': [33.0846151, -112.5842637, 33.7747824, -111.51296], 'centroid': [33.45678, -112.07654]},
+    }
+
+    body, mimetype = encode_payload(payload, 'application/msgpack')
+    assert mimetype == 'application/msgpack'
+    assert msgpack.unpackb(body, raw=False) == payload
+
+    body, _ = encode_payload(payload, 'application/msgpack', compact=True)
+    compact = msgpack.unpackb(body, raw=False)
+    assert compact == compact_payload(payload)
+    assert 'subject_home' not in compact
+    assert compact['price_per_sqft'] == 212.35
+    assert compact['comparables'][0] == {'latitude': 33.4512345, 'longitude': -112.0798765, 'similarity_score': 91.26}
+    assert compact['market'] == payload['market']
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    (None, None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('deflate, gzip;q=0.5', 'gzip'),
+    ('*', 'gzip'),
+    ('gzip;q=0', None),
+    ('*, gzip;q=0', None),
+])
+def test_encoding_negotiation(accept_encoding, expected, monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('br;q=0, *', 'gzip'),
+    ('*', 'br'),
+])
+def test_brotli_negotiation(accept_encoding, expected):
+    pytest.importorskip('brotli')
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_compression_threshold_and_cached_variants():
+    small = CachedBody(b'x' * (compression.MIN_BYTES - 1), JSON_MIMETYPE)
+    assert small.variant('gzip') == (small.body, None)
+    large = CachedBody(b'{"comparables": []}' * compression.MIN_BYTES, JSON_MIMETYPE)
+    body, encoding = large.variant('gzip')
+    assert encoding == 'gzip' and len(body) < len(large.body)
+    assert gzip.decompress(body) == large.body
+    assert large.variant('gzip')[0] is body
+    assert large.variant(None) == (large.body, None)
+
+
+def test_api_responses_are_compressed_when_large_enough(api):
+    request = {'subject_home': SUBJECT, 'num_comps': 10}
+    plain = api.post('/api/select-comparables', json=request)
+    compressed = api.post('/api/select-comparables', json=request, headers={'Accept-Encoding': 'gzip'})
+    assert len(plain.data) >= compression.MIN_BYTES and 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+    error = api.post('/api/select-comparables', json={'subject_home': SUBJECT, 'filters': {'pool': True}},
+                     headers={'Accept-Encoding': 'gzip'})
+    assert error.status_code == 400 and 'Content-Encoding' not in error.headers
+
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'condition not reached in time'
+        time.sleep(0.005)
+
+
+def _run_coalesced(flight, key, fn, callers, timeout=None):
+    """Start `callers` threads on flight.do(key, fn); returns (threads, outcomes)."""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flight.do(key, fn, timeout=timeout))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_single_flight_coalesces_identical_calls():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {'price': 1}
+
+    threads, outcomes = _run_coalesced(flight, 'key', compute, callers=8)
+    _wait_until(lambda: 'key' in flight._calls and flight._calls['key'].waiters == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and flight.in_flight() == 0
+    assert all(result is outcomes[0][0] for result, _ in outcomes)
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * 7
+
+    # Nothing is cached once the leader finishes
+    assert flight.do('key', lambda: {'price': 2}) == ({'price': 2}, False)
+
+
+def test_single_flight_shares_errors_and_times_out_waiters():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError('bad subject')
+
+    threads, outcomes = _run_coalesced(flight, 'key', fail, callers=3)
+    _wait_until(lambda: 'key' in flight._calls and flight._calls['key'].waiters == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert [type(outcome) for outcome in outcomes] == [ValueError] * 3
+
+    release.clear()
+    leader, _ = _run_coalesced(flight, 'slow', lambda: release.wait(5), callers=1)
+    _wait_until(lambda: flight.in_flight() == 1)
+    with pytest.raises(SingleFlightTimeout):
+        flight.do('slow', lambda: None, timeout=0.01)
+    release.set()
+    leader[0].join()
+
+
+def test_canonical_request_key():
+    body = {'subject_home': {'sqft': 1800, 'bedrooms': 3}, 'filters': None}
+    reordered = {'filters': None, 'subject_home': {'bedrooms': 3, 'sqft': 1800}}
+
+    assert canonical_request_key('analyze-home', body, 'v1') == canonical_request_key('analyze-home', reordered, 'v1')
+    assert canonical_request_key('analyze-home', body, 'v1') != canonical_request_key('analyze-home', body, 'v2')
+    assert canonical_request_key('analyze-home', body, 'v1') != canonical_request_key('select-comparables', body, 'v1')
+
+
+
+def _gated_handler(gate, started):
+    """Job handler that doubles numbers, fails on 'bad' and blocks on 'wait' until the gate opens."""
+    def handle(item):
+        if item == 'wait':
+            started.set()
+            gate.wait(5)
+            return 'waited'
+        if item == 'bad':
+            raise ValueError('bad item')
+        return item * 2
+    return handle
+
+
+def test_job_lifecycle():
+    manager = JobManager(workers=1, max_queue=4)
+    gate, started = threading.Event(), threading.Event()
+    job = manager.submit(['wait', 1, 'bad', 3], _gated_handler(gate, started))
+
+    assert started.wait(5)
+    assert manager.get(job.id).status == RUNNING
+    gate.set()
+    streamed = list(job.iter_outcomes(poll_interval=0.05))
+
+    summary = job.summary()
+    assert summary['status'] == COMPLETED
+    assert (summary['total'], summary['completed'], summary['failed']) == (4, 4, 1)
+    assert [outcome['index'] for outcome in streamed] == [0, 1, 2, 3]
+    assert summary['results'] == [
+        {'index': 0, 'result': 'waited'},
+        {'index': 1, 'result': 2},
+        {'index': 2, 'error': 'bad item'},
+        {'index': 3, 'result': 6},
+    ]
+    assert 'results' not in job.summary(include_results=False)
+    assert manager.get('unknown') is None
+
+
+def test_job_cancellation_and_full_queue():
+    manager = JobManager(workers=1, max_queue=1)
+    gate, started = threading.Event(), threading.Event()
+    handler = _gated_handler(gate, started)
+
+    running = manager.submit(['wait', 1, 2], handler)
+    assert started.wait(5)
+    queued = manager.submit([1, 2], handler)
+    with pytest.raises(JobQueueFull):
+        manager.submit([1], handler)
+
+    # A queued job is cancelled right away and never runs
+    assert queued.status == QUEUED
+    assert manager.cancel(queued.id).status == CANCELLED
+
+    # A running job stops after the item in progress
+    manager.cancel(running.id)
+    assert running.status == RUNNING and running.cancel_requested
+    gate.set()
+    list(running.iter_outcomes(poll_interval=0.05))
+    assert running.status == CANCELLED
+    assert running.summary()['results'] == [{'index': 0, 'result': 'waited'}]
+
+    manager._queue.join()
+    assert queued.outcomes == [] and queued.status == CANCELLED
+    assert manager.cancel('unknown') is None
+
+
+
+@pytest.fixture
+def api(data_dir, monkeypatch):
+    """Flask test client for the app, serving the sales in data_dir."""
+    monkeypatch.setenv('CORPUS_WATCH_INTERVAL', '0')
+    import app as api_app
+    monkeypatch.setattr(api_app, 'market_shards', MarketShards(
+        api_app.corpus_provider, refresh_interval=0, extents_path=str(data_dir / 'market_extents.json')
+    ))
+    api_app.corpus_provider.reload(force=True)
+    return api_app.app.test_client()
+
+
+def _tucson_listings(count, prefix='tucson'):
+    """Phoenix listings moved to Tucson and tagged with its market."""
+    listings = _new_listings(count, prefix)
+    for listing in listings:
+        address = listing['property_details']['property_address']
+        address['latitude'] -= 1.3
+        address['longitude'] += 1.2
+        listing['market'], listing['brokerage_region_identifier'] = 'tucson', 'tucson_az'
+    return listings
+
+
+def _wal_lines(data_dir, market):
+    wal = data_dir / f'{market.upper()}_SALES_RECORDS.wal.jsonl'
+    return len(wal.read_text().splitlines()) if wal.exists() else 0
+
+
+def test_ingest_routes_listings_to_their_market(api, data_dir):
+    (data_dir / 'TUCSON_SALES_RECORDS.json').write_text(json.dumps({'listings': _tucson_listings(40, 'seed')}))
+    unmarked = _tucson_listings(1, 'unmarked')[0]
+    del unmarked['market'], unmarked['brokerage_region_identifier']
+
+    response = api.post('/api/sales/bulk', json={
+        'listings': _new_listings(2) + _tucson_listings(2) + [unmarked, {'id': 'bad'}]
+    })
+    assert response.status_code == 201
+    result = response.get_json()
+    by_market = {entry['market']: entry for entry in result['markets']}
+    assert (result['accepted'], result['rejected']) == (5, 1)
+    assert by_market['phoenix']['accepted'] == 2 and by_market['tucson']['accepted'] == 3
+    assert by_market['tucson']['corpus_size'] == 43
+    assert (_wal_lines(data_dir, 'phoenix'), _wal_lines(data_dir, 'tucson')) == (2, 3)
+
+    # A loaded shard is appended to in place
+    near_tucson = '/api/comparables/near?lat=32.2&lon=-110.9&radius_miles=100&market=tucson'
+    assert api.get(near_tucson).get_json()['total'] == 43
+    single = api.post('/api/sales', json=_tucson_listings(1, 'single')[0])
+    assert single.status_code == 201 and single.get_json()['market'] == 'tucson'
+    assert api.get(near_tucson).get_json()['total'] == 44
+    assert single.get_json()['corpus_version'] == api.get(near_tucson).get_json()['corpus_version']
+
+    # An unknown market is rejected before anything is written
+    flagstaff = {**_new_listings(1, 'flagstaff')[0], 'market': 'flagstaff'}
+    response = api.post('/api/sales/bulk', json={'listings': _new_listings(1, 'first') + [flagstaff]})
+    assert response.status_code == 400 and response.get_json()['type'] == 'UnknownMarket'
+    assert (_wal_lines(data_dir, 'phoenix'), _wal_lines(data_dir, 'tucson')) == (2, 4)
+
+
+FILTERS = {
+    'sqft_within_pct': 25,
+    'bedrooms': 'same',
+    'year_built_min': 1985,
+    'has_private_pool': True,
+    'sold_within_days': 3650,
+}
+
+
+def _matches_filters(comp, today):
+    """FILTERS evaluated by hand for SUBJECT."""
+    return (
+        1350 <= comp['sqft'] <= 2250
+        and comp['bedrooms'] == 3
+        and comp['year_built'] >= 1985
+        and bool(comp.get('has_private_pool', comp.get('has_pool')))
+        and parse_sale_day(comp, today) >= today - 3650
+    )
+
+
+def test_filters_match_brute_force():
+    comps = load_real_data()['comparable_properties']
+    today = today_epoch_day()
+    expected = [row for row, comp in enumerate(comps) if _matches_filters(comp, today)]
+    assert 0 < len(expected) < len(comps)
+
+    constraints = parse_filters(FILTERS, SUBJECT)
+    assert candidate_rows(build_corpus(comps), constraints).tolist() == expected
+    assert filter_comparables(comps, constraints) == [comps[row] for row in expected]
+
+    # A corpus grown by appends answers like one built in one go
+    corpus = build_corpus(comps[:60])
+    candidate_rows(corpus, constraints)
+    for start in range(60, len(comps), 25):
+        corpus = corpus.append(comps[start:start + 25])
+        grown = [row for row in expected if row < start + 25]
+        assert candidate_rows(corpus, constraints).tolist() == grown
+
+
+def test_select_comparables_applies_filters(api):
+    response = api.post('/api/select-comparables', json={'subject_home': SUBJECT, 'num_comps': 50, 'filters': FILTERS})
+    assert response.status_code == 200
+    comparables = response.get_json()['comparables']
+    today = today_epoch_day()
+    assert comparables and all(_matches_filters(comp, today) for comp in comparables)
+
+
+@pytest.mark.parametrize('filters', [
+    {'pool': True},
+    {'sqft_min': 1500, 'sqft_within': 10},
+    {'sqft_min': 'big'},
+    {'dwelling_type': {'kind': 'condo'}},
+    {'dwelling_type': ['condo', ['townhouse']]},
+    {'dwelling_type': 'same'},
+    ['sqft_min'],
+])
+def test_invalid_filters_are_rejected(api, filters):
+    for path in ('/api/select-comparables', '/api/analyze-home'):
+        response = api.post(path, json={'subject_home': SUBJECT, 'filters': filters})
+        assert response.status_code == 400, path
+        assert response.get_json()['success'] is False
+    with pytest.raises(ValueError):
+        parse_filters(filters, SUBJECT)
+
+
+
+NEAR_QUERY = '/api/comparables/near?lat=33.45&lon=-112.07&radius_miles=60&limit=40'
+
+
+def _page_through(api, query):
+    """Every page of a comparables listing; returns (comparables, corpus versions seen)."""
+    comparables, versions, cursor = [], set(), None
+    while True:
+        page = api.get(query + (f'&cursor={cursor}' if cursor else '')).get_json()
+        comparables.extend(page['comparables'])
+        versions.add(page['corpus_version'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return comparables, versions
+
+
+def test_cursor_pages_cover_results_once(api):
+    first = api.get(NEAR_QUERY).get_json()
+    comparables, versions = _page_through(api, NEAR_QUERY)
+
+    assert len(comparables) == first['total'] > 2 * 40 and len(versions) == 1
+    distances = [comp['distance_miles'] for comp in comparables]
+    assert distances == sorted(distances)
+    assert len({_comparable_key(comp) for comp in comparables}) == len(set(map(_comparable_key, load_real_data()['comparable_properties'])))
+
+
+def test_cursor_is_rejected_after_ingest(api):
+    first = api.get(NEAR_QUERY).get_json()
+    assert api.get(f"{NEAR_QUERY}&cursor={first['next_cursor']}").status_code == 200
+
+    assert api.post('/api/sales/bulk', json={'listings': _new_listings(3)}).status_code == 201
+
+    stale = api.get(f"{NEAR_QUERY}&cursor={first['next_cursor']}")
+    assert stale.status_code == 410 and stale.get_json()['type'] == 'StaleCursor'
+    # Restarting from the first page lists the new sales too
+    comparables, versions = _page_through(api, NEAR_QUERY)
+    assert len(comparables) == first['total'] + 3 and versions != {first['corpus_version']}
+
+    bbox = '/api/comparables/bbox?min_lat=33&min_lon=-113&max_lat=34&max_lon=-111&limit=10'
+    page = api.get(bbox).get_json()
+    api.post('/api/sales', json=_new_listings(1, prefix='later')[0])
+    assert api.get(f"{bbox}&cursor={page['next_cursor']}").status_code == 410
+    assert api.get(f"{bbox}&cursor=not-a-cursor").status_code == 400
+
+
+
+def _jittered_sales(comps, copies, seed=0):
+    """Copies of the comps with prices moved by up to +/-20%, dated in later quarters."""
+    rng = np.random.default_rng(seed)
+    sales = []
+    for copy_number in range(copies):
+        for comp in comps:
+            sale = dict(comp)
+            sale['sale_price'] = round(comp['sale_price'] * rng.uniform(0.8, 1.2))
+            sale['sale_date'] = f"{2020 + copy_number % 5}-{1 + copy_number % 12:02d}-15T12:00:00Z"
+            sales.append(sale)
+    return sales
+
+
+def _assert_same_grid(grid, expected):
+    assert grid.size == expected.size
+    assert np.array_equal(grid.table['keys'], expected.table['keys'])
+    assert np.array_equal(grid.table['count'], expected.table['count'])
+    for column in ('q1', 'median', 'q3'):
+        assert np.allclose(grid.table[column], expected.table[column])
+
+
+def test_price_grid_update_matches_rebuild():
+    comps = load_real_data()['comparable_properties']
+    sales = comps + _jittered_sales(comps, copies=6)
+    cell_degrees = 0.05
+
+    corpus = build_corpus(sales[:100])
+    grid = price_grid(corpus, cell_degrees)
+    first_table = {name: column.copy() for name, column in grid.table.items()}
+    for start in range(100, len(sales), 137):
+        corpus = corpus.append(sales[start:start + 137])
+        _assert_same_grid(price_grid(corpus, cell_degrees), PriceGrid.build(corpus, cell_degrees))
+
+    # The first snapshot's grid is untouched by the updates
+    assert all(np.array_equal(grid.table[name], first_table[name]) for name in first_table)
+    assert grid.size == 100
+
+    rebuilt = PriceGrid.build(build_corpus(sales), cell_degrees)
+    _assert_same_grid(price_grid(corpus, cell_degrees), rebuilt)
+    assert {'2020Q1', '2020Q2', '2021Q1', '2022Q1', '2023Q2', '2024Q2'} <= set(rebuilt.quarters())
+
+
+def test_conformal_intervals_cover_held_out_sales():
+    """Split conformal: calibrate on half the leave-one-out residuals, measure coverage on the other half."""
+    comps = load_real_data()['comparable_properties']
+    corpus = build_corpus(comps + _jittered_sales(comps, copies=4, seed=1))
+    rows, predictions = Backtester().run(corpus)
+    order = np.random.default_rng(0).permutation(len(rows))
+    calibration_half, held_out = order[:len(order) // 2], order[len(order) // 2:]
+    calibration = ConformalCalibration.from_backtest(corpus, rows[calibration_half], predictions[calibration_half])
+
+    for coverage in (0.5, 0.8, 0.9):
+        covered = 0
+        for position in held_out:
+            price_range = calibration.interval(predictions[position], coverage)['price_range']
+            covered += price_range['low'] <= corpus.prices[rows[position]] <= price_range['high']
+        assert covered / len(held_out) == pytest.approx(coverage, abs=0.06), coverage
+
+
+def test_backtest_metrics_compare_candidates_on_the_same_sales():
+    corpus = build_corpus(load_real_data()['comparable_properties'])
+    weights = ComparableSelector.FEATURE_WEIGHTS
+    small, large = backtest_metrics(corpus, [
+        {'feature_weights': weights, 'num_comps': 3, 'idw_power': 1.0},
+        {'feature_weights': weights, 'num_comps': 10, 'idw_power': 1.0},
+    ])
+    _, large_only = backtest_metrics(corpus, [
+        {'feature_weights': weights, 'num_comps': 10, 'idw_power': 1.0},
+        {'feature_weights': weights, 'num_comps': 10, 'idw_power': 1.0},
+    ])
+    assert small['count'] == large['count'] == large_only['count']
+    assert large == large_only
+
+
+def test_bootstrap_range_is_seeded_and_contains_the_estimate():
+    comps = load_real_data()['comparable_properties']
+    corpus = build_corpus(comps)
+    top_comps = ComparableSelector().select_top_comparables(SUBJECT, comps, num_comps=10)
+    condition_summary = {'condition_score': 7.0}
+    results = [
+        PriceEstimator(interval_method='bootstrap').estimate_price(
+            SUBJECT, copy.deepcopy(top_comps), condition_summary, market_index=market_index(corpus)
+        )
+        for _ in range(2)
+    ]
+    first, second = results
+    assert first['price_range'] == second['price_range']
+    assert first['interval']['method'] == 'bootstrap' and first['interval']['seed'] == second['interval']['seed']
+    assert first['price_range']['low'] < first['recommended_price'] < first['price_range']['high']
+
+
+def test_ivf_recall_is_exact_when_every_list_is_probed():
+    comps = load_real_data()['comparable_properties']
+    corpus = build_corpus(comps + _jittered_sales(comps, copies=6))
+    points = scaled_features(corpus, ComparableSelector.FEATURE_WEIGHTS)
+    index = IVFIndex.build(points, corpus.version, nlist=16)
+    queries = points[::37]
+    exact, _ = top_k_neighbours(queries, points, 10)
+
+    approximate = [index.search(query, 10, nprobe=index.nlist)[0] for query in queries]
+    assert recall_at_k(exact, approximate) == 1.0
+
+
+def test_blocked_distances_match_brute_force():
+    comps = load_real_data()['comparable_properties']
+    corpus = build_corpus(comps + _jittered_sales(comps, copies=2))
+    points = scaled_features(corpus, ComparableSelector.FEATURE_WEIGHTS)
+    distances = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    budget = 16 * 64  # 64-cell tiles: every query row is split across column blocks
+    assert tile_shape(len(points), len(points), budget) == (1, 64)
+
+    ids, found = top_k_neighbours(points, points, 8, memory_budget=budget, exclude_self=True)
+    np.fill_diagonal(distances, np.inf)
+    columns = np.arange(len(points))
+    expected = np.lexsort((np.broadcast_to(columns, distances.shape), distances), axis=1)[:, :8]
+    assert np.array_equal(ids, expected)
+    assert np.allclose(found, np.take_along_axis(distances, expected, axis=1))
+
+    # Halfway between two distinct pair distances, so rounding can't move a pair across it
+    gaps = np.unique(distances[np.triu_indices(len(points), k=1)])
+    radius = float(gaps[len(gaps) // 50:len(gaps) // 50 + 2].mean())
+    pairs = {
+        (int(i), int(j))
+        for rows, cols, _ in iter_pairs_within(points, radius, memory_budget=budget)
+        for i, j in zip(rows, cols)
+    }
+    i, j = np.nonzero(np.triu(distances < radius, k=1))
+    assert pairs and pairs == set(zip(i.tolist(), j.tolist()))
+
+
+def test_hedonic_update_matches_full_fit():
+    comps = load_real_data()['comparable_properties']
+    sales = comps + _jittered_sales(comps, copies=5)
+    corpus = build_corpus(sales[:60])
+    first = model = HedonicModel.fit(corpus)
+    first_coefficients = dict(first.coefficients)
+    for start in range(60, len(sales), 211):
+        corpus = corpus.append(sales[start:start + 211])
+        model = model.updated(corpus)
+        refit = HedonicModel.fit(corpus)
+        assert (model.size, model.count) == (refit.size, refit.count)
+        assert model.coefficients.keys() == refit.coefficients.keys()
+        assert np.allclose(list(model.coefficients.values()), list(refit.coefficients.values()), rtol=1e-6, atol=1e-9)
+    assert hedonic_model(corpus).coefficients == pytest.approx(model.coefficients, rel=1e-6, abs=1e-9)
+    assert first.size == 60 and first.coefficients == first_coefficients
+
+
+def _trending_sales(zip_code, monthly_growth, months=24, per_month=10):
+    """Sales with $/sqft rising by monthly_growth per month from 2022-01, 1500 sqft each."""
+    base = load_real_data()['comparable_properties'][0]
+    sales = []
+    for month in range(months):
+        for day in range(per_month):
+            sales.append({
+                **base,
+                'sqft': 1500,
+                'zip_code': zip_code,
+                'sale_price': round(1500 * 200 * (1 + monthly_growth) ** month),
+                'sale_date': f"{2022 + month // 12}-{month % 12 + 1:02d}-{day + 1:02d}T12:00:00Z",
+            })
+    return sales
+
+
+def test_market_index_recovers_a_synthetic_trend():
+    corpus = build_corpus(_trending_sales('85001', 0.01) + _trending_sales('85002', 0.0))
+    index = market_index(corpus)
+    day = lambda month: int(np.datetime64(f"{2022 + month // 12}-{month % 12 + 1:02d}-15", 'D').astype(np.int64))
+
+    # Every month after the first two has a full trailing window
+    for sale_month, valuation_month in ((2, 20), (6, 23), (10, 11), (15, 15)):
+        factors = index.factors(['85001', '85002'], [day(sale_month)] * 2, day(valuation_month))
+        assert factors[0] == pytest.approx(1.01 ** (valuation_month - sale_month), rel=1e-4)
+        assert factors[1] == pytest.approx(1.0, rel=1e-4)
+
+    # A full window's median is its middle month, so month m indexes at m - 1; past the
+    # newest sales the index holds the last window, which only has month 23's sales
+    assert index.factors(['85001'], [day(10)], day(40))[0] == pytest.approx(1.01 ** 14, rel=1e-4)
+    assert index.factors(['85001'], [day(2)], day(23))[0] == pytest.approx(1.01 ** 21, rel=1e-4)
+    assert index.factors(['85001'], [day(0)], day(23))[0] <= 1 + MAX_TIME_ADJUSTMENT
+
+
+def test_watcher_swaps_snapshots_and_keeps_the_last_one_on_an_empty_file(data_dir):
+    records_path = data_dir / data_loader.SALES_RECORDS_FILE
+    provider = CorpusProvider(storage=JsonSalesStorage())
+    warmed = []
+    watcher = CorpusWatcher(provider, interval=0, warmers=[warmed.append])
+    first = provider.get()
+    assert not watcher.check_once()
+
+    records = json.loads(records_path.read_text())
+    records['listings'] = records['listings'][:40]
+    records_path.write_text(json.dumps(records))
+    assert watcher.check_once()
+    trimmed = provider.get()
+    assert trimmed is not first and trimmed.version != first.version
+    assert len(trimmed) < len(first) and warmed == [trimmed]
+
+    # A half-written (empty) file parses as no sales: the previous snapshot stays current
+    records_path.write_text('')
+    assert not watcher.check_once()
+    assert provider.get() is trimmed and not watcher.check_once()
+    assert warmed == [trimmed]
+
+    records['listings'] = records['listings'][:30]
+    records_path.write_text(json.dumps(records))
+    assert watcher.check_once() and len(provider.get()) < len(trimmed)
+
+
+def test_analyze_batch_streams_results_errors_and_a_summary(api):
+    subjects = [
+        {'subject_home': SUBJECT},
+        'not a subject',
+        {'subject_home': SUBJECT, 'market': 'atlantis'},
+        {'subject_home': {**SUBJECT, 'sqft': 2400}},
+    ]
+    response = api.post('/api/analyze-batch?stream=true', json={'subjects': subjects, 'num_comps': 5})
+    assert response.status_code == 200 and response.mimetype == NDJSON_MIMETYPE
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line.get('index') for line in lines] == [0, 1, 2, 3, None]
+    assert 'result' in lines[0] and 'result' in lines[3]
+    assert 'error' in lines[1] and 'atlantis' in lines[2]['error']
+    assert lines[-1] == {'success': True, 'total': 4, 'failed': 2}
+
+    single = api.post('/api/analyze-home', json={'subject_home': SUBJECT}).get_json()
+    assert lines[0]['result']['price_recommendation'] == single['price_recommendation']
+    collected = api.post('/api/analyze-batch', json={'subjects': subjects, 'num_comps': 5}).get_json()
+    assert (collected['total'], collected['failed']) == (4, 2)
+    assert [sorted(outcome) for outcome in collected['results']] == [sorted(line) for line in lines[:-1]]
+
+    # A malformed NDJSON line ends the stream with an error summary after the results already sent
+    body = json.dumps(subjects[0]) + '\n{not json\n' + json.dumps(subjects[3]) + '\n'
+    response = api.post('/api/analyze-batch', data=body, content_type=NDJSON_MIMETYPE,
+                        headers={'Accept': NDJSON_MIMETYPE})
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert len(lines) == 2 and 'result' in lines[0]
+    assert lines[1]['success'] is False and 'line 2' in lines[1]['error']
+    assert (lines[1]['total'], lines[1]['failed']) == (1, 0)
+
+
+def test_bulk_valuation_resumes_from_its_checkpoint(data_dir, tmp_path):
+    subjects = [{'subject_home': {**SUBJECT, 'sqft': 1500 + 100 * i}} for i in range(5)] + [{'subject_home': 'bad'}]
+    input_path, output_path = tmp_path / 'subjects.jsonl', str(tmp_path / 'results.jsonl')
+    input_path.write_text(''.join(json.dumps(subject) + '\n' for subject in subjects))
+
+    assert bulk_valuation.run(str(input_path), output_path, workers=1, checkpoint_every=2, progress_interval=60) == \
+        {'valued': 6, 'failed': 1, 'total': 6}
+    with open(output_path, 'rb') as f:
+        expected = f.readlines()
+    assert [json.loads(line)['index'] for line in expected] == list(range(6))
+    assert 'error' in json.loads(expected[-1])
+
+    # Crash after the checkpoint at row 2: one more row and half of the next were written
+    bulk_valuation.write_checkpoint(output_path, {
+        'input': bulk_valuation._input_signature(str(input_path)),
+        'completed': 2,
+        'output_bytes': len(b''.join(expected[:2])),
+    })
+    with open(output_path, 'wb') as f:
+        f.write(b''.join(expected[:3]) + expected[3][:20])
+
+    assert bulk_valuation.run(str(input_path), output_path, workers=1, resume=True, progress_interval=60)['valued'] == 4
+    with open(output_path, 'rb') as f:
+        assert f.readlines() == expected
+    assert bulk_valuation.load_checkpoint(output_path)['completed'] == 6
+
+    # Output lost below the checkpoint can't be resumed onto
+    with open(output_path, 'wb') as f:
+        f.write(expected[0])
+    with pytest.raises(SystemExit):
+        bulk_valuation.run(str(input_path), output_path, workers=1, resume=True, progress_interval=60)
+
+
+def test_backtest_only_uses_earlier_sales_as_comps(monkeypatch):
+    comps = load_real_data()['comparable_properties']
+    corpus = build_corpus(comps + _jittered_sales(comps, copies=3))
+    backtester = Backtester(memory_budget=16 * 64 * len(corpus))
+    assert len(backtester.blocks(corpus)) > 1
+    calls = []
+    estimate = Backtester.estimate
+
+    def recording_estimate(self, corpus, subject_row, comp_rows, comp_distances):
+        calls.append((subject_row, np.asarray(comp_rows), np.asarray(comp_distances)))
+        return estimate(self, corpus, subject_row, comp_rows, comp_distances)
+    monkeypatch.setattr(Backtester, 'estimate', recording_estimate)
+
+    rows, _ = backtester.run(corpus)
+    assert len(calls) == len(rows) > 0
+    points = scaled_features(corpus, backtester.feature_weights)
+    for subject_row, comp_rows, comp_distances in calls:
+        earlier = np.flatnonzero(corpus.sale_days < corpus.sale_days[subject_row])
+        assert np.isin(comp_rows, earlier).all()
+        # Exactly the K nearest of the earlier sales (compared by distance, ties may swap rows)
+        brute = np.sort(np.sqrt(((points[earlier] - points[subject_row]) ** 2).sum(axis=1)))[:backtester.num_comps]
+        assert np.allclose(comp_distances, brute)
+
+
+def test_sensitivity_prices_match_analyze_home(api):
+    scenarios = [
+        {'name': 'no pool', 'set': {'has_pool': False}},
+        {'name': '+300 sqft', 'add': {'sqft': 300}},
+        {'name': 'older', 'set': {'year_built': 1975}, 'add': {'bedrooms': 1}},
+    ]
+    variants = [
+        SUBJECT,
+        {**SUBJECT, 'has_pool': False},
+        {**SUBJECT, 'sqft': SUBJECT['sqft'] + 300},
+        {**SUBJECT, 'year_built': 1975, 'bedrooms': SUBJECT['bedrooms'] + 1},
+    ]
+    for filters in (None, {'sqft_min': 1200, 'year_built_min': 1970}):
+        report = api.post('/api/sensitivity', json={'subject_home': SUBJECT, 'scenarios': scenarios, 'filters': filters})
+        assert report.status_code == 200
+        report = report.get_json()
+        prices = [report['base']['recommended_price']] + [scenario['recommended_price'] for scenario in report['scenarios']]
+        expected = [
+            api.post('/api/analyze-home', json={'subject_home': variant, 'filters': filters})
+            .get_json()['price_recommendation']['recommended_price']
+            for variant in variants
+        ]
+        assert prices == expected, filters
+
+
 if __name__ == '__main__':
     test_knn()